@@ -1,736 +1,1170 @@
-import tkinter as tk
-from tkinter import ttk, filedialog, messagebox, scrolledtext
-import os
-import re
-import json
-import tempfile
-import shutil
-import fnmatch
-import codecs
-
-class TextReplaceTool:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("Adrts超级文本替换工具")
-        self.root.geometry("900x700")
-        self.root.minsize(800, 600)
-        
-        # 设置统一的中文字体
-        self.font = ('SimHei', 10)
-        self.title_font = ('SimHei', 11, 'bold')  # 标题字体
-        
-        # 临时文件夹
-        self.temp_dir = tempfile.mkdtemp()
-        
-        # 数据存储
-        self.replace_rules = []  # 存储替换规则
-        self.file_list = []  # 存储待处理的文件列表
-        self.failed_files = []  # 存储替换失败的文件及原因
-        
-        # 可用的编码器列表
-        self.available_encodings = [
-            'utf-8', 'utf-8-sig', 'gbk', 'gb2312', 'latin-1', 'ascii',
-            'iso-8859-1', 'iso-8859-2', 'iso-8859-3', 'iso-8859-4',
-            'iso-8859-5', 'iso-8859-6', 'iso-8859-7', 'iso-8859-8',
-            'iso-8859-9', 'iso-8859-10', 'iso-8859-11', 'iso-8859-13',
-            'iso-8859-14', 'iso-8859-15', 'iso-8859-16',
-            'windows-1250', 'windows-1251', 'windows-1252', 'windows-1253',
-            'windows-1254', 'windows-1255', 'windows-1256', 'windows-1257',
-            'windows-1258'
-        ]
-        
-        # 创建UI
-        self.create_ui()
-        
-        # 程序关闭时清理临时文件
-        self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
-        
-    def create_ui(self):
-        # 创建自定义样式
-        style = ttk.Style()
-        style.configure("Custom.TLabelframe.Label", font=self.title_font)
-        
-        # 主框架 - 使用网格布局
-        main_frame = ttk.Frame(self.root, padding=10)
-        main_frame.grid(row=0, column=0, sticky=(tk.N, tk.S, tk.W, tk.E))
-        
-        # 设置行列权重，使界面可伸缩
-        self.root.grid_rowconfigure(0, weight=1)
-        self.root.grid_columnconfigure(0, weight=1)
-        main_frame.grid_rowconfigure(2, weight=1)  # 内容区域可伸缩
-        main_frame.grid_columnconfigure(0, weight=1)
-        
-        # 顶部文件选择区 - 使用LabelFrame
-        file_frame = ttk.LabelFrame(
-            main_frame, 
-            text="文件选择", 
-            style="Custom.TLabelframe", 
-            padding=5,
-            relief="groove"
-        )
-        file_frame.grid(row=0, column=0, sticky=(tk.W, tk.E), pady=(0, 10))
-        
-        # 文件选择模式
-        mode_frame = ttk.Frame(file_frame)
-        mode_frame.pack(fill=tk.X, pady=(0, 5))
-        
-        self.file_mode = tk.StringVar(value="single")
-        
-        ttk.Radiobutton(mode_frame, text="单个文件", variable=self.file_mode, value="single", 
-                        command=self.update_file_controls).pack(side=tk.LEFT, padx=(0, 10))
-        ttk.Radiobutton(mode_frame, text="多个文件", variable=self.file_mode, value="multiple", 
-                        command=self.update_file_controls).pack(side=tk.LEFT, padx=(0, 10))
-        ttk.Radiobutton(mode_frame, text="目录", variable=self.file_mode, value="directory", 
-                        command=self.update_file_controls).pack(side=tk.LEFT)
-        
-        # 文件路径选择
-        path_frame = ttk.Frame(file_frame)
-        path_frame.pack(fill=tk.X, pady=(0, 5))
-        
-        ttk.Label(path_frame, text="文件/目录路径:").pack(side=tk.LEFT, padx=(0, 5))
-        
-        self.path_entry = ttk.Entry(path_frame, font=self.font)
-        self.path_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 5))
-        
-        browse_btn = ttk.Button(path_frame, text="浏览...", command=self.browse_files)
-        browse_btn.pack(side=tk.LEFT)
-        
-        # 目录选项
-        self.dir_options_frame = ttk.Frame(file_frame)
-        
-        # 使用网格布局优化目录选项区域
-        self.dir_options_frame.columnconfigure(0, weight=1)
-        self.dir_options_frame.columnconfigure(1, weight=1)
-        
-        self.recursive_var = tk.BooleanVar(value=True)
-        ttk.Checkbutton(self.dir_options_frame, text="递归子文件夹", variable=self.recursive_var).grid(row=0, column=0, sticky=tk.W, pady=(5, 0))
-        
-        filter_frame = ttk.Frame(self.dir_options_frame)
-        filter_frame.grid(row=0, column=1, sticky=(tk.W, tk.E), pady=(5, 0))
-        
-        ttk.Label(filter_frame, text="文件过滤:").pack(side=tk.LEFT, padx=(0, 5))
-        self.filter_var = tk.StringVar(value="*.*")
-        ttk.Entry(filter_frame, textvariable=self.filter_var, width=20, font=self.font).pack(side=tk.LEFT, fill=tk.X, expand=True)
-        
-        # 编码选项
-        encoding_frame = ttk.Frame(file_frame)
-        encoding_frame.pack(fill=tk.X, pady=(5, 0))
-        
-        ttk.Label(encoding_frame, text="读取编码:").pack(side=tk.LEFT, padx=(0, 5))
-        self.read_encoding = tk.StringVar(value="try-all")
-        ttk.Combobox(encoding_frame, textvariable=self.read_encoding, 
-                    values=["utf-8", "utf-8-sig", "gbk", "gb2312", "latin-1", "ascii", "auto-detect", "try-all"],
-                    width=15).pack(side=tk.LEFT, padx=(0, 10))
-        
-        ttk.Label(encoding_frame, text="写入编码:").pack(side=tk.LEFT, padx=(0, 5))
-        self.write_encoding = tk.StringVar(value="utf-8")
-        ttk.Combobox(encoding_frame, textvariable=self.write_encoding, 
-                    values=["utf-8", "utf-8-sig", "gbk", "gb2312", "latin-1", "ascii"],
-                    width=15).pack(side=tk.LEFT)
-        
-        # 中部内容区
-        content_frame = ttk.Frame(main_frame)
-        content_frame.grid(row=2, column=0, sticky=(tk.N, tk.S, tk.W, tk.E), pady=(0, 10))
-        
-        # 设置内容区域的行列权重
-        content_frame.grid_rowconfigure(0, weight=1)
-        content_frame.grid_columnconfigure(0, weight=1)
-        
-        # 使用PanedWindow分隔规则区域和日志区域，允许用户调整比例
-        paned_window = ttk.PanedWindow(content_frame, orient=tk.VERTICAL)
-        paned_window.grid(row=0, column=0, sticky=(tk.N, tk.S, tk.W, tk.E))
-        
-        # 规则表格和按钮 - 使用LabelFrame
-        rules_frame = ttk.LabelFrame(
-            paned_window, 
-            text="替换规则", 
-            style="Custom.TLabelframe", 
-            padding=5,
-            relief="groove"
-        )
-        paned_window.add(rules_frame, weight=1)
-        
-        # 使用网格布局优化规则区域
-        rules_frame.grid_rowconfigure(0, weight=1)
-        rules_frame.grid_columnconfigure(0, weight=1)
-        
-        # 创建Treeview表格
-        columns = ("alias", "find", "replace", "regex")
-        self.rules_tree = ttk.Treeview(rules_frame, columns=columns, show="headings", height=8)
-        self.rules_tree.heading("alias", text="规则别名")
-        self.rules_tree.heading("find", text="查找内容")
-        self.rules_tree.heading("replace", text="替换内容")
-        self.rules_tree.heading("regex", text="正则")
-        
-        self.rules_tree.column("alias", width=120)
-        self.rules_tree.column("find", width=180)
-        self.rules_tree.column("replace", width=180)
-        self.rules_tree.column("regex", width=60, anchor=tk.CENTER)
-        
-        self.rules_tree.grid(row=0, column=0, sticky=(tk.N, tk.S, tk.W, tk.E))
-        
-        # 添加滚动条
-        tree_scroll = ttk.Scrollbar(rules_frame, orient=tk.VERTICAL, command=self.rules_tree.yview)
-        tree_scroll.grid(row=0, column=1, sticky=(tk.N, tk.S))
-        self.rules_tree.configure(yscroll=tree_scroll.set)
-        
-        # 右侧规则操作按钮 - 使用网格布局
-        btn_frame = ttk.Frame(rules_frame)
-        btn_frame.grid(row=0, column=2, sticky=(tk.N, tk.W), padx=(10, 0))
-        
-        btn_width = 12
-        ttk.Button(btn_frame, text="添加规则", width=btn_width, command=self.add_rule).grid(row=0, column=0, sticky=tk.W, pady=(0, 5))
-        ttk.Button(btn_frame, text="编辑规则", width=btn_width, command=self.edit_rule).grid(row=1, column=0, sticky=tk.W, pady=(0, 5))
-        ttk.Button(btn_frame, text="删除规则", width=btn_width, command=self.delete_rule).grid(row=2, column=0, sticky=tk.W, pady=(0, 5))
-        ttk.Button(btn_frame, text="清空规则", width=btn_width, command=self.clear_rules).grid(row=3, column=0, sticky=tk.W, pady=(0, 5))
-        ttk.Button(btn_frame, text="保存规则", width=btn_width, command=self.save_rules).grid(row=4, column=0, sticky=tk.W, pady=(0, 5))
-        ttk.Button(btn_frame, text="加载规则", width=btn_width, command=self.load_rules).grid(row=5, column=0, sticky=tk.W)
-        
-        # 消息日志区域
-        log_frame = ttk.LabelFrame(
-            paned_window, 
-            text="消息日志", 
-            style="Custom.TLabelframe", 
-            padding=5,
-            relief="groove"
-        )
-        paned_window.add(log_frame, weight=1)
-        
-        log_frame.grid_rowconfigure(0, weight=1)
-        log_frame.grid_columnconfigure(0, weight=1)
-        
-        # 使用与替换规则相同的字体设置
-        self.log_text = scrolledtext.ScrolledText(log_frame, wrap=tk.WORD, font=self.font, height=8)
-        self.log_text.grid(row=0, column=0, sticky=(tk.N, tk.S, tk.W, tk.E))
-        
-        # 底部控制区 - 使用网格布局
-        bottom_frame = ttk.Frame(main_frame)
-        bottom_frame.grid(row=3, column=0, sticky=(tk.W, tk.E))
-        
-        bottom_frame.grid_columnconfigure(0, weight=1)
-        
-        # 左侧临时文件提示
-        temp_frame = ttk.Frame(bottom_frame)
-        temp_frame.grid(row=0, column=0, sticky=tk.W)
-        
-        ttk.Label(temp_frame, text=f"临时文件位置: {self.temp_dir}").pack(anchor=tk.W)
-        
-        # 右侧按钮
-        btn_frame = ttk.Frame(bottom_frame)
-        btn_frame.grid(row=0, column=1, sticky=tk.E)
-        
-        self.execute_btn = ttk.Button(btn_frame, text="执行替换", command=self.execute_replace)
-        self.execute_btn.pack(side=tk.LEFT, padx=(0, 5))
-        
-        clear_btn = ttk.Button(btn_frame, text="清空消息", command=self.clear_log)
-        clear_btn.pack(side=tk.LEFT)
-        
-        # 状态栏
-        self.status_bar = ttk.Label(main_frame, text="就绪", relief=tk.SUNKEN, anchor=tk.W)
-        self.status_bar.grid(row=4, column=0, sticky=(tk.W, tk.E), pady=(5, 0))
-        
-        # 进度条
-        self.progress = ttk.Progressbar(main_frame, orient=tk.HORIZONTAL, length=100, mode='determinate')
-        self.progress.grid(row=5, column=0, sticky=(tk.W, tk.E), pady=(0, 5))
-        
-        # 初始化文件控件状态
-        self.update_file_controls()
-    
-    def update_file_controls(self):
-        """根据文件选择模式更新控件状态"""
-        mode = self.file_mode.get()
-        
-        # 重置目录选项框架
-        if hasattr(self, 'dir_options_frame') and self.dir_options_frame.winfo_ismapped():
-            self.dir_options_frame.pack_forget()
-        
-        # 根据模式启用/禁用控件
-        if mode == "directory":
-            self.dir_options_frame.pack(fill=tk.X, pady=(5, 0))
-        else:
-            self.path_entry.delete(0, tk.END)
-    
-    def browse_files(self):
-        """浏览并选择文件或目录"""
-        mode = self.file_mode.get()
-        self.path_entry.delete(0, tk.END)
-        
-        if mode == "single":
-            filename = filedialog.askopenfilename(title="选择单个文件")
-            if filename:
-                self.path_entry.insert(0, filename)
-                
-        elif mode == "multiple":
-            filenames = filedialog.askopenfilenames(title="选择多个文件")
-            if filenames:
-                self.path_entry.insert(0, ", ".join(filenames))
-                
-        elif mode == "directory":
-            directory = filedialog.askdirectory(title="选择目录")
-            if directory:
-                self.path_entry.insert(0, directory)
-    
-    def update_file_list(self):
-        """根据选择更新文件列表"""
-        self.file_list = []
-        mode = self.file_mode.get()
-        path = self.path_entry.get().strip()
-        
-        if not path:
-            return
-            
-        try:
-            if mode == "single":
-                if os.path.isfile(path):
-                    self.file_list = [path]
-                    self.log(f"已选择文件: {path}")
-                else:
-                    self.log(f"错误: 文件不存在 - {path}")
-                    
-            elif mode == "multiple":
-                file_paths = [p.strip() for p in path.split(",") if p.strip()]
-                valid_files = []
-                
-                for file_path in file_paths:
-                    if os.path.isfile(file_path):
-                        valid_files.append(file_path)
-                    else:
-                        self.log(f"警告: 文件不存在 - {file_path}")
-                
-                self.file_list = valid_files
-                self.log(f"已选择 {len(valid_files)} 个文件")
-                
-            elif mode == "directory":
-                if os.path.isdir(path):
-                    filter_text = self.filter_var.get()
-                    filter_patterns = [p.strip() for p in filter_text.split(',') if p.strip()]
-                    
-                    if not filter_patterns:
-                        filter_patterns = ["*.*"]  # 默认匹配所有文件
-                    
-                    self.log(f"扫描目录: {path}，过滤模式: {filter_text}")
-                    
-                    # 编译所有过滤模式的正则表达式
-                    regex_patterns = [re.compile(fnmatch.translate(pattern), re.IGNORECASE) 
-                                     for pattern in filter_patterns]
-                    
-                    # 获取文件列表
-                    file_list = []
-                    
-                    if self.recursive_var.get():
-                        for root, _, files in os.walk(path):
-                            for file in files:
-                                # 检查文件是否匹配任何一个过滤模式
-                                for pattern in regex_patterns:
-                                    if pattern.match(file):
-                                        file_list.append(os.path.join(root, file))
-                                        break
-                    else:
-                        for file in os.listdir(path):
-                            file_path = os.path.join(path, file)
-                            if os.path.isfile(file_path):
-                                # 检查文件是否匹配任何一个过滤模式
-                                for pattern in regex_patterns:
-                                    if pattern.match(file):
-                                        file_list.append(file_path)
-                                        break
-                    
-                    self.file_list = file_list
-                    self.log(f"找到 {len(file_list)} 个匹配的文件")
-                else:
-                    self.log(f"错误: 目录不存在 - {path}")
-                    
-        except Exception as e:
-            self.log(f"错误: 更新文件列表时出错 - {str(e)}")
-    
-    def clear_log(self):
-        """清空日志消息"""
-        self.log_text.config(state=tk.NORMAL)
-        self.log_text.delete(1.0, tk.END)
-        self.log_text.config(state=tk.DISABLED)
-    
-    def add_rule(self):
-        """添加新的替换规则"""
-        dialog = RuleDialog(self.root, self, "添加规则")
-        self.root.wait_window(dialog.top)  # 等待对话框关闭
-        self.refresh_rules_tree()  # 刷新规则表格
-    
-    def edit_rule(self):
-        """编辑选中的替换规则"""
-        selected_item = self.rules_tree.selection()
-        if not selected_item:
-            self.log("请先选择要编辑的规则")
-            return
-            
-        index = self.rules_tree.index(selected_item[0])
-        dialog = RuleDialog(self.root, self, "编辑规则", index)
-        self.root.wait_window(dialog.top)  # 等待对话框关闭
-        self.refresh_rules_tree()  # 刷新规则表格
-    
-    def delete_rule(self):
-        """删除选中的替换规则"""
-        selected_item = self.rules_tree.selection()
-        if not selected_item:
-            self.log("请先选择要删除的规则")
-            return
-            
-        if messagebox.askyesno("确认删除", "确定要删除选中的规则吗?"):
-            index = self.rules_tree.index(selected_item[0])
-            del self.replace_rules[index]
-            self.refresh_rules_tree()
-            self.log(f"已删除规则: {index+1}")
-    
-    def clear_rules(self):
-        """清空所有替换规则"""
-        if not self.replace_rules:
-            return
-            
-        if messagebox.askyesno("确认清空", "确定要清空所有规则吗?"):
-            self.replace_rules = []
-            self.refresh_rules_tree()
-            self.log("已清空所有规则")
-    
-    def save_rules(self):
-        """保存替换规则到文件"""
-        if not self.replace_rules:
-            self.log("没有规则可保存")
-            return
-            
-        filename = filedialog.asksaveasfilename(
-            defaultextension=".json",
-            filetypes=[("JSON文件", "*.json"), ("所有文件", "*.*")],
-            title="保存规则"
-        )
-        
-        if filename:
-            try:
-                with open(filename, 'w', encoding='utf-8') as f:
-                    json.dump(self.replace_rules, f, ensure_ascii=False, indent=4)
-                self.log(f"规则已保存到: {filename}")
-            except Exception as e:
-                self.log(f"错误: 保存规则时出错 - {str(e)}")
-    
-    def load_rules(self):
-        """从文件加载替换规则"""
-        filename = filedialog.askopenfilename(
-            filetypes=[("JSON文件", "*.json"), ("所有文件", "*.*")],
-            title="加载规则"
-        )
-        
-        if filename:
-            try:
-                with open(filename, 'r', encoding='utf-8') as f:
-                    self.replace_rules = json.load(f)
-                self.refresh_rules_tree()
-                self.log(f"已从 {filename} 加载 {len(self.replace_rules)} 条规则")
-            except Exception as e:
-                self.log(f"错误: 加载规则时出错 - {str(e)}")
-    
-    def refresh_rules_tree(self):
-        """刷新规则表格显示"""
-        # 清空现有项
-        for item in self.rules_tree.get_children():
-            self.rules_tree.delete(item)
-        
-        # 添加规则
-        for rule in self.replace_rules:
-            # 在表格中显示✓或✗表示是否启用正则
-            regex_mark = "✓" if rule.get("regex", False) else "✗"
-            self.rules_tree.insert("", tk.END, values=(
-                rule["alias"], 
-                rule["find"], 
-                rule["replace"],
-                regex_mark
-            ))
-    
-    def log(self, message):
-        """添加日志消息"""
-        self.log_text.config(state=tk.NORMAL)
-        self.log_text.insert(tk.END, message + "\n")
-        self.log_text.see(tk.END)
-        self.log_text.config(state=tk.DISABLED)
-    
-    def execute_replace(self):
-        """执行替换操作"""
-        # 重置失败文件列表
-        self.failed_files = []
-        
-        # 在替换前更新文件列表
-        self.update_file_list()
-        
-        if not self.file_list:
-            self.log("错误: 没有选择要处理的文件")
-            return
-            
-        if not self.replace_rules:
-            self.log("错误: 没有定义替换规则")
-            return
-            
-        # 更新状态栏
-        self.status_bar.config(text="正在处理文件...")
-        self.progress["value"] = 0
-        self.root.update()
-        
-        total_files = len(self.file_list)
-        success_count = 0
-        failed_count = 0
-        
-        for i, file_path in enumerate(self.file_list):
-            try:
-                self.log(f"\n处理文件: {file_path}")
-                self.process_file(file_path)
-                success_count += 1
-            except Exception as e:
-                error_msg = str(e)
-                self.log(f"错误: 处理文件时出错 - {error_msg}")
-                self.failed_files.append((file_path, error_msg))
-                failed_count += 1
-            
-            # 更新进度条
-            self.progress["value"] = (i + 1) / total_files * 100
-            self.root.update()
-        
-        # 更新状态栏
-        self.status_bar.config(text=f"处理完成: 成功 {success_count} 个，失败 {failed_count} 个")
-        
-        # 显示失败文件列表
-        if self.failed_files:
-            self.log("\n========== 替换失败的文件 ==========")
-            for file_path, error_msg in self.failed_files:
-                self.log(f"文件: {file_path}")
-                self.log(f"错误: {error_msg}")
-                self.log("-------------------------------")
-        
-        # 显示结果消息
-        messagebox.showinfo("处理完成", 
-                           f"处理完成!\n成功: {success_count} 个\n失败: {failed_count} 个")
-    
-    def detect_encoding(self, file_path):
-        """检测文件编码"""
-        with open(file_path, 'rb') as f:
-            raw_data = f.read(4)
-        
-        # 检查BOM
-        if raw_data.startswith(codecs.BOM_UTF8):
-            return 'utf-8-sig'
-        elif raw_data.startswith(codecs.BOM_UTF16_LE):
-            return 'utf-16-le'
-        elif raw_data.startswith(codecs.BOM_UTF16_BE):
-            return 'utf-16-be'
-        elif raw_data.startswith(codecs.BOM_UTF32_LE):
-            return 'utf-32-le'
-        elif raw_data.startswith(codecs.BOM_UTF32_BE):
-            return 'utf-32-be'
-        
-        # 默认返回utf-8
-        return 'utf-8'
-    
-    def try_all_encodings(self, file_path):
-        """尝试所有可用的编码器读取文件"""
-        self.log("尝试所有可用的编码器读取文件...")
-        
-        for encoding in self.available_encodings:
-            try:
-                self.log(f"尝试编码: {encoding}")
-                with open(file_path, 'r', encoding=encoding) as f:
-                    content = f.read()
-                self.log(f"成功使用 {encoding} 编码读取文件")
-                return (content, encoding)
-            except UnicodeDecodeError:
-                continue
-        
-        # 如果所有编码器都失败
-        raise Exception("无法使用任何可用的编码器读取文件")
-    
-    def process_file(self, file_path):
-        """处理单个文件"""
-        read_encoding = self.read_encoding.get()
-        
-        # 自动检测编码
-        if read_encoding == "auto-detect":
-            detected_encoding = self.detect_encoding(file_path)
-            self.log(f"自动检测编码: {detected_encoding}")
-            read_encoding = detected_encoding
-        # 尝试所有编码器
-        elif read_encoding == "try-all":
-            content, used_encoding = self.try_all_encodings(file_path)
-            read_encoding = used_encoding
-        else:
-            # 使用指定编码
-            pass
-        
-        try:
-            # 如果不是尝试所有编码器模式，则正常读取文件
-            if read_encoding != "try-all":
-                with open(file_path, 'r', encoding=read_encoding) as f:
-                    content = f.read()
-            
-            original_content = content
-            modified = False
-            replacements = 0
-            
-            # 应用所有替换规则
-            for rule in self.replace_rules:
-                find_text = rule["find"]
-                replace_text = rule["replace"]
-                use_regex = rule.get("regex", False)
-                
-                if use_regex:
-                    try:
-                        # 使用正则表达式替换
-                        pattern = re.compile(find_text, re.DOTALL)
-                        new_content, count = pattern.subn(replace_text, content)
-                        
-                        if count > 0:
-                            content = new_content
-                            modified = True
-                            replacements += count
-                            self.log(f"应用正则规则: {rule['alias']} (替换 {count} 处)")
-                    except re.error as e:
-                        self.log(f"警告: 正则表达式错误 - {rule['alias']}: {str(e)}")
-                else:
-                    # 使用普通字符串替换
-                    if find_text in content:
-                        content = content.replace(find_text, replace_text)
-                        modified = True
-                        count = content.count(replace_text)
-                        replacements += count
-                        self.log(f"应用规则: {rule['alias']} (替换 {count} 处)")
-            
-            # 如果内容被修改，则保存
-            if modified:
-                self.log(f"共执行 {replacements} 处替换")
-                
-                # 创建临时文件
-                temp_file = os.path.join(self.temp_dir, os.path.basename(file_path))
-                
-                # 写入修改后的内容
-                with open(temp_file, 'w', encoding=self.write_encoding.get()) as f:
-                    f.write(content)
-                
-                # 替换原文件
-                shutil.copy2(temp_file, file_path)
-                self.log(f"已保存修改到: {file_path}")
-            else:
-                self.log("没有需要替换的内容")
-                
-        except UnicodeDecodeError as e:
-            # 记录编码错误
-            error_msg = f"编码错误: 文件 {file_path} 无法使用 {read_encoding} 编码读取 - {str(e)}"
-            self.log(error_msg)
-            raise Exception(error_msg)
-        except Exception as e:
-            # 记录其他错误
-            error_msg = f"处理文件 {file_path} 时出错 - {str(e)}"
-            self.log(error_msg)
-            raise
-    
-    def on_closing(self):
-        """程序关闭时清理资源"""
-        if messagebox.askokcancel("退出", "确定要退出程序吗?"):
-            # 清理临时文件
-            try:
-                if os.path.exists(self.temp_dir):
-                    shutil.rmtree(self.temp_dir)
-                    self.log(f"已清理临时文件: {self.temp_dir}")
-            except Exception as e:
-                self.log(f"警告: 清理临时文件时出错 - {str(e)}")
-            
-            self.root.destroy()
-
-class RuleDialog:
-    """替换规则对话框"""
-    def __init__(self, parent, app, title, rule_index=None):
-        self.app = app
-        self.rule_index = rule_index
-        
-        self.top = tk.Toplevel(parent)
-        self.top.title(title)
-        self.top.geometry("500x450")  # 增加高度以容纳正则选项
-        self.top.resizable(True, True)
-        self.top.transient(parent)
-        self.top.grab_set()
-        
-        # 设置中文字体
-        self.font = ('SimHei', 10)
-        
-        # 创建UI
-        main_frame = ttk.Frame(self.top, padding=10)
-        main_frame.pack(fill=tk.BOTH, expand=True)
-        
-        # 规则别名
-        ttk.Label(main_frame, text="规则别名:", font=self.font).pack(anchor=tk.W, pady=(0, 5))
-        self.alias_var = tk.StringVar()
-        ttk.Entry(main_frame, textvariable=self.alias_var, font=self.font).pack(fill=tk.X, pady=(0, 10))
-        
-        # 查找内容
-        ttk.Label(main_frame, text="查找内容:", font=self.font).pack(anchor=tk.W, pady=(0, 5))
-        self.find_var = tk.StringVar()
-        ttk.Entry(main_frame, textvariable=self.find_var, font=self.font).pack(fill=tk.X, pady=(0, 10))
-        
-        # 替换内容
-        ttk.Label(main_frame, text="替换内容:", font=self.font).pack(anchor=tk.W, pady=(0, 5))
-        self.replace_text = scrolledtext.ScrolledText(main_frame, wrap=tk.WORD, height=10, font=self.font)
-        self.replace_text.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
-        
-        # 正则表达式选项
-        regex_frame = ttk.Frame(main_frame)
-        regex_frame.pack(fill=tk.X, pady=(5, 10))
-        
-        self.regex_var = tk.BooleanVar()
-        ttk.Checkbutton(regex_frame, text="使用正则表达式", variable=self.regex_var).pack(anchor=tk.W)
-        
-        # 按钮
-        btn_frame = ttk.Frame(main_frame)
-        btn_frame.pack(fill=tk.X)
-        
-        ttk.Button(btn_frame, text="确定", command=self.on_ok).pack(side=tk.LEFT, padx=(0, 5))
-        ttk.Button(btn_frame, text="取消", command=self.top.destroy).pack(side=tk.LEFT)
-        
-        # 如果是编辑模式，加载现有规则
-        if rule_index is not None and 0 <= rule_index < len(app.replace_rules):
-            rule = app.replace_rules[rule_index]
-            self.alias_var.set(rule["alias"])
-            self.find_var.set(rule["find"])
-            self.replace_text.delete(1.0, tk.END)
-            self.replace_text.insert(tk.END, rule["replace"])
-            self.regex_var.set(rule.get("regex", False))
-    
-    def on_ok(self):
-        """确定按钮处理"""
-        alias = self.alias_var.get().strip()
-        find_text = self.find_var.get()
-        replace_text = self.replace_text.get(1.0, tk.END).rstrip()
-        use_regex = self.regex_var.get()
-        
-        if not alias:
-            messagebox.showerror("错误", "规则别名不能为空")
-            return
-            
-        if not find_text:
-            messagebox.showerror("错误", "查找内容不能为空")
-            return
-            
-        rule = {
-            "alias": alias,
-            "find": find_text,
-            "replace": replace_text,
-            "regex": use_regex
-        }
-        
-        # 添加或更新规则
-        if self.rule_index is not None and 0 <= self.rule_index < len(self.app.replace_rules):
-            self.app.replace_rules[self.rule_index] = rule
-            self.app.log(f"已更新规则: {alias}")
-        else:
-            self.app.replace_rules.append(rule)
-            self.app.log(f"已添加规则: {alias}")
-        
-        # 关闭对话框
-        self.top.destroy()
-
-if __name__ == "__main__":
-    root = tk.Tk()
-    app = TextReplaceTool(root)
-    root.mainloop()
-### 主要改进点：
+import os
+import sys
+import threading
+import queue
+import time
+
+from adrts.engine import ReplaceEngine, load_rules, save_rules, log_failed_files
+from adrts.rules import RuleSet, RuleError, RULE_MODES, MODE_SEQUENTIAL
+from adrts.scanner import collect_files, DEFAULT_EXCLUDES
+from adrts.parallel import default_workers
+from adrts.manifest import RunManifest, default_manifest_path, common_root, rule_fingerprint, cache_dir
+from adrts.contentindex import ContentIndex, default_index_path
+from adrts.logsink import LogSink, LEVEL_NAMES
+from adrts.preview import load_snippets
+from adrts.guard import DEFAULT_REGEX_TIMEOUT, backtracking_risks, rule_warnings
+from adrts.ruleview import RuleView
+from adrts.analysis import analyze_rules
+from adrts.watch import watch_directory
+from adrts.backup import BackupStore
+
+# Tk 界面模块在创建窗口时由 load_tk() 导入，带参数作为命令行工具运行或只使用引擎时不加载
+tk = ttk = filedialog = messagebox = scrolledtext = None
+
+
+def load_tk():
+    """导入 Tk 界面模块（重复调用无额外开销）"""
+    global tk, ttk, filedialog, messagebox, scrolledtext
+    if tk is None:
+        import tkinter
+        from tkinter import ttk as _ttk, filedialog as _filedialog, messagebox as _messagebox
+        from tkinter import scrolledtext as _scrolledtext
+        tk, ttk, filedialog, messagebox, scrolledtext = (
+            tkinter, _ttk, _filedialog, _messagebox, _scrolledtext)
+    return tk
+
+class TextReplaceTool:
+    def __init__(self, root):
+        load_tk()
+        self.root = root
+        self.root.title("Adrts超级文本替换工具")
+        self.root.geometry("900x700")
+        self.root.minsize(800, 600)
+        
+        # 设置统一的中文字体
+        self.font = ('SimHei', 10)
+        self.title_font = ('SimHei', 11, 'bold')  # 标题字体
+        
+        # 数据存储
+        self.replace_rules = []  # 存储替换规则
+        self.rule_view = RuleView(self.replace_rules)  # 规则表格的搜索与分页，表格只显示当前页
+        self.rule_page = 0
+        self.rule_search_job = None  # 延迟执行的搜索，输入停顿后才过滤
+        self.file_list = []  # 存储待处理的文件列表
+        self.failed_files = []  # 存储替换失败的文件及原因
+        self.preview = None  # 最近一次预览的结果，应用预览后清除
+        self.preview_file_list = []  # 预览时的文件列表
+        
+        # 后台任务：工作线程通过队列汇报结果，界面定时拉取
+        self.job_thread = None
+        self.job_queue = queue.Queue()
+        self.job_progress = (0, 0)  # (已完成数, 总数)，由工作线程更新
+        self.cancel_event = None
+        self.poll_interval = 100  # 拉取队列的间隔（毫秒）
+        
+        # 日志：消息先进入缓冲区，定时批量显示；界面只保留最近的若干行，完整日志写入轮转文件
+        self.max_log_lines = 5000
+        self.log_flush_interval = 100  # 刷新日志显示的间隔（毫秒）
+        try:
+            self.log_sink = LogSink(os.path.join(cache_dir(), "adrts.log"), max_pending=self.max_log_lines)
+        except OSError:
+            self.log_sink = LogSink(max_pending=self.max_log_lines)
+        
+        # 创建UI
+        self.create_ui()
+        self.root.after(self.log_flush_interval, self.flush_log)
+        
+        # 程序关闭时确认并释放资源
+        self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
+        
+    def create_ui(self):
+        # 创建自定义样式
+        style = ttk.Style()
+        style.configure("Custom.TLabelframe.Label", font=self.title_font)
+        
+        # 主框架 - 使用网格布局
+        main_frame = ttk.Frame(self.root, padding=10)
+        main_frame.grid(row=0, column=0, sticky=(tk.N, tk.S, tk.W, tk.E))
+        
+        # 设置行列权重，使界面可伸缩
+        self.root.grid_rowconfigure(0, weight=1)
+        self.root.grid_columnconfigure(0, weight=1)
+        main_frame.grid_rowconfigure(2, weight=1)  # 内容区域可伸缩
+        main_frame.grid_columnconfigure(0, weight=1)
+        
+        # 顶部文件选择区 - 使用LabelFrame
+        file_frame = ttk.LabelFrame(
+            main_frame, 
+            text="文件选择", 
+            style="Custom.TLabelframe", 
+            padding=5,
+            relief="groove"
+        )
+        file_frame.grid(row=0, column=0, sticky=(tk.W, tk.E), pady=(0, 10))
+        
+        # 文件选择模式
+        mode_frame = ttk.Frame(file_frame)
+        mode_frame.pack(fill=tk.X, pady=(0, 5))
+        
+        self.file_mode = tk.StringVar(value="single")
+        
+        ttk.Radiobutton(mode_frame, text="单个文件", variable=self.file_mode, value="single", 
+                        command=self.update_file_controls).pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Radiobutton(mode_frame, text="多个文件", variable=self.file_mode, value="multiple", 
+                        command=self.update_file_controls).pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Radiobutton(mode_frame, text="目录", variable=self.file_mode, value="directory", 
+                        command=self.update_file_controls).pack(side=tk.LEFT)
+        
+        # 文件路径选择
+        path_frame = ttk.Frame(file_frame)
+        path_frame.pack(fill=tk.X, pady=(0, 5))
+        
+        ttk.Label(path_frame, text="文件/目录路径:").pack(side=tk.LEFT, padx=(0, 5))
+        
+        self.path_entry = ttk.Entry(path_frame, font=self.font)
+        self.path_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 5))
+        
+        browse_btn = ttk.Button(path_frame, text="浏览...", command=self.browse_files)
+        browse_btn.pack(side=tk.LEFT)
+        
+        # 目录选项
+        self.dir_options_frame = ttk.Frame(file_frame)
+        
+        # 使用网格布局优化目录选项区域
+        self.dir_options_frame.columnconfigure(0, weight=1)
+        self.dir_options_frame.columnconfigure(1, weight=1)
+        
+        self.recursive_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(self.dir_options_frame, text="递归子文件夹", variable=self.recursive_var).grid(row=0, column=0, sticky=tk.W, pady=(5, 0))
+        
+        filter_frame = ttk.Frame(self.dir_options_frame)
+        filter_frame.grid(row=0, column=1, sticky=(tk.W, tk.E), pady=(5, 0))
+        
+        ttk.Label(filter_frame, text="文件过滤:").pack(side=tk.LEFT, padx=(0, 5))
+        self.filter_var = tk.StringVar(value="*.*")
+        ttk.Entry(filter_frame, textvariable=self.filter_var, width=20, font=self.font).pack(side=tk.LEFT, fill=tk.X, expand=True)
+        
+        # 排除模式：匹配的文件和目录不处理，被排除的目录不会被扫描
+        exclude_frame = ttk.Frame(self.dir_options_frame)
+        exclude_frame.grid(row=1, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(5, 0))
+        
+        ttk.Label(exclude_frame, text="排除:").pack(side=tk.LEFT, padx=(0, 5))
+        self.exclude_var = tk.StringVar(value=DEFAULT_EXCLUDES)
+        ttk.Entry(exclude_frame, textvariable=self.exclude_var, font=self.font).pack(side=tk.LEFT, fill=tk.X, expand=True)
+        
+        # 编码选项
+        encoding_frame = ttk.Frame(file_frame)
+        encoding_frame.pack(fill=tk.X, pady=(5, 0))
+        
+        ttk.Label(encoding_frame, text="读取编码:").pack(side=tk.LEFT, padx=(0, 5))
+        self.read_encoding = tk.StringVar(value="try-all")
+        ttk.Combobox(encoding_frame, textvariable=self.read_encoding, 
+                    values=["utf-8", "utf-8-sig", "gbk", "gb2312", "latin-1", "ascii", "auto-detect", "try-all"],
+                    width=15).pack(side=tk.LEFT, padx=(0, 10))
+        
+        ttk.Label(encoding_frame, text="写入编码:").pack(side=tk.LEFT, padx=(0, 5))
+        self.write_encoding = tk.StringVar(value="utf-8")
+        ttk.Combobox(encoding_frame, textvariable=self.write_encoding, 
+                    values=["utf-8", "utf-8-sig", "gbk", "gb2312", "latin-1", "ascii"],
+                    width=15).pack(side=tk.LEFT, padx=(0, 10))
+        
+        # 规则执行模式：sequential 依次链式替换，single-pass 合并字面量规则单遍替换，
+        # fused 再把独立的正则规则合并为一次扫描
+        ttk.Label(encoding_frame, text="规则模式:").pack(side=tk.LEFT, padx=(0, 5))
+        self.rule_mode = tk.StringVar(value=MODE_SEQUENTIAL)
+        ttk.Combobox(encoding_frame, textvariable=self.rule_mode, values=list(RULE_MODES),
+                    state="readonly", width=12).pack(side=tk.LEFT, padx=(0, 10))
+        
+        # 并行工作进程数，1 表示串行处理
+        ttk.Label(encoding_frame, text="并行进程:").pack(side=tk.LEFT, padx=(0, 5))
+        self.workers_var = tk.IntVar(value=1)
+        ttk.Spinbox(encoding_frame, textvariable=self.workers_var, from_=1, to=default_workers(),
+                    width=5).pack(side=tk.LEFT, padx=(0, 10))
+        
+        # 增量运行：跳过上次用相同规则和编码处理后未变化的文件
+        self.incremental_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(encoding_frame, text="增量运行", variable=self.incremental_var).pack(side=tk.LEFT)
+        
+        # 内容索引：未变化的文件不打开，直接排除不可能含有查找内容的文件
+        self.index_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(encoding_frame, text="内容索引", variable=self.index_var).pack(side=tk.LEFT, padx=(10, 0))
+        
+        # 备份：覆盖文件之前把原内容保存到备份仓库，可撤销最近一次运行
+        self.backup_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(encoding_frame, text="备份原文件", variable=self.backup_var).pack(side=tk.LEFT, padx=(10, 0))
+        
+        # 性能统计：记录各阶段与各规则的耗时和命中数，结束后输出汇总表
+        self.profile_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(encoding_frame, text="性能统计", variable=self.profile_var).pack(side=tk.LEFT, padx=(10, 0))
+        
+        # 每条正则规则在单个文件上的最长运行时间，超时的文件记为失败，0 表示不限制
+        ttk.Label(encoding_frame, text="正则超时(秒):").pack(side=tk.LEFT, padx=(10, 5))
+        self.regex_timeout_var = tk.IntVar(value=DEFAULT_REGEX_TIMEOUT)
+        ttk.Spinbox(encoding_frame, textvariable=self.regex_timeout_var, from_=0, to=3600,
+                    width=5).pack(side=tk.LEFT)
+        
+        # 中部内容区
+        content_frame = ttk.Frame(main_frame)
+        content_frame.grid(row=2, column=0, sticky=(tk.N, tk.S, tk.W, tk.E), pady=(0, 10))
+        
+        # 设置内容区域的行列权重
+        content_frame.grid_rowconfigure(0, weight=1)
+        content_frame.grid_columnconfigure(0, weight=1)
+        
+        # 使用PanedWindow分隔规则区域和日志区域，允许用户调整比例
+        paned_window = ttk.PanedWindow(content_frame, orient=tk.VERTICAL)
+        paned_window.grid(row=0, column=0, sticky=(tk.N, tk.S, tk.W, tk.E))
+        
+        # 规则表格和按钮 - 使用LabelFrame
+        rules_frame = ttk.LabelFrame(
+            paned_window, 
+            text="替换规则", 
+            style="Custom.TLabelframe", 
+            padding=5,
+            relief="groove"
+        )
+        paned_window.add(rules_frame, weight=1)
+        
+        # 使用网格布局优化规则区域
+        rules_frame.grid_rowconfigure(1, weight=1)
+        rules_frame.grid_columnconfigure(0, weight=1)
+        
+        # 规则搜索与翻页：上万条规则时表格只显示一页
+        search_frame = ttk.Frame(rules_frame)
+        search_frame.grid(row=0, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(0, 5))
+        ttk.Label(search_frame, text="搜索:", font=self.font).pack(side=tk.LEFT, padx=(0, 5))
+        self.rule_search_var = tk.StringVar()
+        self.rule_search_var.trace_add("write", self.schedule_rule_search)
+        ttk.Entry(search_frame, textvariable=self.rule_search_var, font=self.font).pack(side=tk.LEFT, fill=tk.X, expand=True)
+        ttk.Button(search_frame, text="上一页", command=lambda: self.show_rule_page(self.rule_page - 1)).pack(side=tk.LEFT, padx=(5, 0))
+        ttk.Button(search_frame, text="下一页", command=lambda: self.show_rule_page(self.rule_page + 1)).pack(side=tk.LEFT, padx=(5, 0))
+        self.rule_page_label = ttk.Label(search_frame, font=self.font)
+        self.rule_page_label.pack(side=tk.LEFT, padx=(5, 0))
+        self.update_rule_page_label()
+        
+        # 创建Treeview表格
+        columns = ("alias", "find", "replace", "regex")
+        self.rules_tree = ttk.Treeview(rules_frame, columns=columns, show="headings", height=8)
+        self.rules_tree.heading("alias", text="规则别名")
+        self.rules_tree.heading("find", text="查找内容")
+        self.rules_tree.heading("replace", text="替换内容")
+        self.rules_tree.heading("regex", text="正则")
+        
+        self.rules_tree.column("alias", width=120)
+        self.rules_tree.column("find", width=180)
+        self.rules_tree.column("replace", width=180)
+        self.rules_tree.column("regex", width=60, anchor=tk.CENTER)
+        
+        self.rules_tree.grid(row=1, column=0, sticky=(tk.N, tk.S, tk.W, tk.E))
+        
+        # 添加滚动条
+        tree_scroll = ttk.Scrollbar(rules_frame, orient=tk.VERTICAL, command=self.rules_tree.yview)
+        tree_scroll.grid(row=1, column=1, sticky=(tk.N, tk.S))
+        self.rules_tree.configure(yscroll=tree_scroll.set)
+        
+        # 右侧规则操作按钮 - 使用网格布局
+        btn_frame = ttk.Frame(rules_frame)
+        btn_frame.grid(row=0, column=2, rowspan=2, sticky=(tk.N, tk.W), padx=(10, 0))
+        
+        btn_width = 12
+        ttk.Button(btn_frame, text="添加规则", width=btn_width, command=self.add_rule).grid(row=0, column=0, sticky=tk.W, pady=(0, 5))
+        ttk.Button(btn_frame, text="编辑规则", width=btn_width, command=self.edit_rule).grid(row=1, column=0, sticky=tk.W, pady=(0, 5))
+        ttk.Button(btn_frame, text="删除规则", width=btn_width, command=self.delete_rule).grid(row=2, column=0, sticky=tk.W, pady=(0, 5))
+        ttk.Button(btn_frame, text="清空规则", width=btn_width, command=self.clear_rules).grid(row=3, column=0, sticky=tk.W, pady=(0, 5))
+        ttk.Button(btn_frame, text="保存规则", width=btn_width, command=self.save_rules).grid(row=4, column=0, sticky=tk.W, pady=(0, 5))
+        ttk.Button(btn_frame, text="加载规则", width=btn_width, command=self.load_rules).grid(row=5, column=0, sticky=tk.W, pady=(0, 5))
+        ttk.Button(btn_frame, text="检查规则", width=btn_width, command=self.check_rules).grid(row=6, column=0, sticky=tk.W)
+        
+        # 消息日志区域
+        log_frame = ttk.LabelFrame(
+            paned_window, 
+            text="消息日志", 
+            style="Custom.TLabelframe", 
+            padding=5,
+            relief="groove"
+        )
+        paned_window.add(log_frame, weight=1)
+        
+        log_frame.grid_rowconfigure(0, weight=1)
+        log_frame.grid_columnconfigure(0, weight=1)
+        
+        # 使用与替换规则相同的字体设置
+        self.log_text = scrolledtext.ScrolledText(log_frame, wrap=tk.WORD, font=self.font, height=8)
+        self.log_text.grid(row=0, column=0, sticky=(tk.N, tk.S, tk.W, tk.E))
+        
+        # 显示级别与日志文件位置
+        log_option_frame = ttk.Frame(log_frame)
+        log_option_frame.grid(row=1, column=0, sticky=(tk.W, tk.E), pady=(5, 0))
+        
+        ttk.Label(log_option_frame, text="显示级别:").pack(side=tk.LEFT, padx=(0, 5))
+        self.log_level_var = tk.StringVar(value="INFO")
+        level_combo = ttk.Combobox(log_option_frame, textvariable=self.log_level_var,
+                                   values=list(LEVEL_NAMES), state="readonly", width=10)
+        level_combo.pack(side=tk.LEFT, padx=(0, 10))
+        level_combo.bind("<<ComboboxSelected>>", self.change_log_level)
+        
+        if self.log_sink.file_path:
+            ttk.Label(log_option_frame, text=f"完整日志: {self.log_sink.file_path}").pack(side=tk.LEFT)
+        
+        # 底部控制区 - 使用网格布局
+        bottom_frame = ttk.Frame(main_frame)
+        bottom_frame.grid(row=3, column=0, sticky=(tk.W, tk.E))
+        
+        bottom_frame.grid_columnconfigure(0, weight=1)
+        
+        # 右侧按钮
+        btn_frame = ttk.Frame(bottom_frame)
+        btn_frame.grid(row=0, column=1, sticky=tk.E)
+        
+        self.preview_btn = ttk.Button(btn_frame, text="预览", command=self.preview_replace)
+        self.preview_btn.pack(side=tk.LEFT, padx=(0, 5))
+        
+        self.execute_btn = ttk.Button(btn_frame, text="执行替换", command=self.execute_replace)
+        self.execute_btn.pack(side=tk.LEFT, padx=(0, 5))
+        
+        self.watch_btn = ttk.Button(btn_frame, text="监视目录", command=self.start_watch)
+        self.watch_btn.pack(side=tk.LEFT, padx=(0, 5))
+        
+        self.undo_btn = ttk.Button(btn_frame, text="撤销上次运行", command=self.undo_last_run)
+        self.undo_btn.pack(side=tk.LEFT, padx=(0, 5))
+        
+        self.cancel_btn = ttk.Button(btn_frame, text="取消", command=self.cancel_replace, state=tk.DISABLED)
+        self.cancel_btn.pack(side=tk.LEFT, padx=(0, 5))
+        
+        clear_btn = ttk.Button(btn_frame, text="清空消息", command=self.clear_log)
+        clear_btn.pack(side=tk.LEFT)
+        
+        # 状态栏
+        self.status_bar = ttk.Label(main_frame, text="就绪", relief=tk.SUNKEN, anchor=tk.W)
+        self.status_bar.grid(row=4, column=0, sticky=(tk.W, tk.E), pady=(5, 0))
+        
+        # 进度条
+        self.progress = ttk.Progressbar(main_frame, orient=tk.HORIZONTAL, length=100, mode='determinate')
+        self.progress.grid(row=5, column=0, sticky=(tk.W, tk.E), pady=(0, 5))
+        
+        # 初始化文件控件状态
+        self.update_file_controls()
+    
+    def update_file_controls(self):
+        """根据文件选择模式更新控件状态"""
+        mode = self.file_mode.get()
+        
+        # 重置目录选项框架
+        if hasattr(self, 'dir_options_frame') and self.dir_options_frame.winfo_ismapped():
+            self.dir_options_frame.pack_forget()
+        
+        # 根据模式启用/禁用控件
+        if mode == "directory":
+            self.dir_options_frame.pack(fill=tk.X, pady=(5, 0))
+        else:
+            self.path_entry.delete(0, tk.END)
+    
+    def browse_files(self):
+        """浏览并选择文件或目录"""
+        mode = self.file_mode.get()
+        self.path_entry.delete(0, tk.END)
+        
+        if mode == "single":
+            filename = filedialog.askopenfilename(title="选择单个文件")
+            if filename:
+                self.path_entry.insert(0, filename)
+                
+        elif mode == "multiple":
+            filenames = filedialog.askopenfilenames(title="选择多个文件")
+            if filenames:
+                self.path_entry.insert(0, ", ".join(filenames))
+                
+        elif mode == "directory":
+            directory = filedialog.askdirectory(title="选择目录")
+            if directory:
+                self.path_entry.insert(0, directory)
+    
+    def update_file_list(self):
+        """根据选择更新文件列表"""
+        self.file_list = []
+        
+        try:
+            self.file_list = collect_files(
+                self.file_mode.get(),
+                self.path_entry.get(),
+                self.filter_var.get(),
+                self.recursive_var.get(),
+                log=self.log,
+                exclude_text=self.exclude_var.get()
+            )
+        except Exception as e:
+            self.log(f"错误: 更新文件列表时出错 - {str(e)}")
+    
+    def clear_log(self):
+        """清空日志消息"""
+        self.log_sink.drain()
+        self.log_text.config(state=tk.NORMAL)
+        self.log_text.delete(1.0, tk.END)
+        self.log_text.config(state=tk.DISABLED)
+    
+    def add_rule(self):
+        """添加新的替换规则"""
+        count = len(self.replace_rules)
+        dialog = RuleDialog(self.root, self, "添加规则")
+        self.root.wait_window(dialog.top)  # 等待对话框关闭
+        if len(self.replace_rules) == count:
+            return
+        
+        # 只插入新规则这一行；新规则不在当前页时翻到它所在的页
+        position = self.rule_view.append(count)
+        if position is None:
+            self.update_rule_page_label()
+            return
+        if self.rule_view.page_of(position) != self.rule_page:
+            self.show_rule_page(self.rule_view.page_of(position))
+        else:
+            self.rules_tree.insert("", tk.END, values=self.rule_values(self.replace_rules[count]))
+            self.update_rule_page_label()
+        item = self.rules_tree.get_children()[-1]
+        self.rules_tree.selection_set(item)
+        self.rules_tree.see(item)
+    
+    def selected_rule(self):
+        """返回选中的 (表格行, 规则序号)，没有选中时返回 None"""
+        selected_item = self.rules_tree.selection()
+        if not selected_item:
+            return None
+        item = selected_item[0]
+        return item, self.rule_view.rule_index(self.rule_page, self.rules_tree.index(item))
+    
+    def edit_rule(self):
+        """编辑选中的替换规则"""
+        selected = self.selected_rule()
+        if selected is None:
+            self.log("请先选择要编辑的规则")
+            return
+            
+        item, index = selected
+        dialog = RuleDialog(self.root, self, "编辑规则", index)
+        self.root.wait_window(dialog.top)  # 等待对话框关闭
+        self.rules_tree.item(item, values=self.rule_values(self.replace_rules[index]))  # 只更新这一行
+    
+    def delete_rule(self):
+        """删除选中的替换规则"""
+        selected = self.selected_rule()
+        if selected is None:
+            self.log("请先选择要删除的规则")
+            return
+            
+        if messagebox.askyesno("确认删除", "确定要删除选中的规则吗?"):
+            item, index = selected
+            del self.replace_rules[index]
+            self.rule_view.remove(index)
+            self.rules_tree.delete(item)
+            # 下一页的第一条规则移到本页末尾
+            indices = self.rule_view.page_indices(self.rule_page)
+            if not indices and self.rule_page > 0:
+                self.show_rule_page(self.rule_page - 1)
+            else:
+                if len(indices) > len(self.rules_tree.get_children()):
+                    self.rules_tree.insert("", tk.END, values=self.rule_values(self.replace_rules[indices[-1]]))
+                self.update_rule_page_label()
+            self.log(f"已删除规则: {index+1}")
+    
+    def clear_rules(self):
+        """清空所有替换规则"""
+        if not self.replace_rules:
+            return
+            
+        if messagebox.askyesno("确认清空", "确定要清空所有规则吗?"):
+            self.replace_rules = []
+            self.refresh_rules_tree()
+            self.log("已清空所有规则")
+    
+    def save_rules(self):
+        """保存替换规则到文件"""
+        if not self.replace_rules:
+            self.log("没有规则可保存")
+            return
+            
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".json",
+            filetypes=[("JSON文件", "*.json"), ("JSON Lines文件（每行一条规则）", "*.jsonl"), ("所有文件", "*.*")],
+            title="保存规则"
+        )
+        
+        if filename:
+            try:
+                save_rules(self.replace_rules, filename)
+                self.log(f"规则已保存到: {filename}")
+            except Exception as e:
+                self.log(f"错误: 保存规则时出错 - {str(e)}")
+    
+    def load_rules(self):
+        """从文件加载替换规则"""
+        filename = filedialog.askopenfilename(
+            filetypes=[("规则文件", "*.json *.jsonl"), ("所有文件", "*.*")],
+            title="加载规则"
+        )
+        
+        if filename:
+            try:
+                self.replace_rules = load_rules(filename)
+                self.refresh_rules_tree()
+                self.log(f"已从 {filename} 加载 {len(self.replace_rules)} 条规则")
+                for warning in rule_warnings(self.replace_rules):
+                    self.log(warning)
+            except Exception as e:
+                self.log(f"错误: 加载规则时出错 - {str(e)}")
+    
+    def check_rules(self):
+        """检查重复、冲突、不起作用和被遮蔽的规则，可以一次删除可删除的规则"""
+        rule_set = self.compile_rules()
+        if rule_set is None:
+            return
+        
+        issues = analyze_rules(rule_set)
+        if not issues:
+            self.log(f"规则检查: {len(rule_set)} 条规则中没有发现重复、冲突或不起作用的规则")
+            return
+        for issue in issues:
+            self.log(str(issue))
+        
+        removable = {issue.index for issue in issues if issue.removable}
+        self.log(f"规则检查: 发现 {len(issues)} 个问题，其中 {len(removable)} 条规则可以删除")
+        if removable and messagebox.askyesno(
+                "规则检查",
+                f"发现 {len(removable)} 条重复、冲突或不起作用的规则，删除后替换结果不变。\n"
+                "是否删除这些规则？（详情见日志，遮蔽和无法确定结果不变的问题需要手动处理）"):
+            self.replace_rules = [rule for index, rule in enumerate(self.replace_rules) if index not in removable]
+            self.refresh_rules_tree()
+            self.log(f"已删除 {len(removable)} 条规则")
+    
+    def schedule_rule_search(self, *args):
+        """输入搜索内容后延迟过滤，连续输入时只执行最后一次"""
+        if self.rule_search_job is not None:
+            self.root.after_cancel(self.rule_search_job)
+        self.rule_search_job = self.root.after(200, self.search_rules)
+    
+    def search_rules(self):
+        """按搜索内容过滤规则并显示第一页"""
+        self.rule_search_job = None
+        self.rule_view.search(self.rule_search_var.get())
+        self.show_rule_page(0)
+    
+    def rule_values(self, rule):
+        """规则在表格中一行的内容，用✓或✗表示是否启用正则"""
+        regex_mark = "✓" if rule.get("regex", False) else "✗"
+        return (rule.get("alias", ""), rule.get("find", ""), rule.get("replace", ""), regex_mark)
+    
+    def show_rule_page(self, page):
+        """显示规则视图的第 page 页（从 0 开始）"""
+        if not 0 <= page < self.rule_view.page_count():
+            return
+        self.rule_page = page
+        self.rules_tree.delete(*self.rules_tree.get_children())
+        for index in self.rule_view.page_indices(page):
+            self.rules_tree.insert("", tk.END, values=self.rule_values(self.replace_rules[index]))
+        self.update_rule_page_label()
+    
+    def update_rule_page_label(self):
+        """更新页码和规则数"""
+        count = len(self.rule_view)
+        if len(self.replace_rules) != count:
+            text = f"第 {self.rule_page + 1}/{self.rule_view.page_count()} 页，匹配 {count}/{len(self.replace_rules)} 条"
+        else:
+            text = f"第 {self.rule_page + 1}/{self.rule_view.page_count()} 页，共 {count} 条"
+        self.rule_page_label.config(text=text)
+    
+    def refresh_rules_tree(self):
+        """规则列表整体替换（加载、清空）后重新过滤，显示当前页"""
+        self.rule_view.reset(self.replace_rules)
+        self.show_rule_page(min(self.rule_page, self.rule_view.page_count() - 1))
+    
+    def log(self, message):
+        """添加日志消息"""
+        self.log_sink.emit(message)
+    
+    def flush_log(self):
+        """定时把缓冲的日志一次性显示到界面，只保留最近 max_log_lines 行"""
+        self.show_pending_log()
+        self.root.after(self.log_flush_interval, self.flush_log)
+    
+    def show_pending_log(self):
+        """显示缓冲区中的全部日志"""
+        lines, dropped = self.log_sink.drain()
+        if not lines:
+            return
+        if dropped:
+            lines.insert(0, f"...（省略 {dropped} 行，完整日志见 {self.log_sink.file_path}）")
+        
+        self.log_text.config(state=tk.NORMAL)
+        self.log_text.insert(tk.END, "\n".join(lines) + "\n")
+        # 超出的旧行从顶部删除（末尾有一个空行）
+        excess = int(self.log_text.index("end-1c").split(".")[0]) - 1 - self.max_log_lines
+        if excess > 0:
+            self.log_text.delete("1.0", f"{excess + 1}.0")
+        self.log_text.see(tk.END)
+        self.log_text.config(state=tk.DISABLED)
+    
+    def change_log_level(self, event=None):
+        """修改界面显示的最低日志级别（文件日志始终记录全部级别）"""
+        self.log_sink.display_level = LEVEL_NAMES[self.log_level_var.get()]
+    
+    def execute_replace(self, dry_run=False):
+        """执行替换操作（任务在后台线程中运行，界面保持响应）；dry_run 为 True 时只预览"""
+        if self.job_thread is not None:
+            return
+            
+        # 重置失败文件列表
+        self.failed_files = []
+        
+        # 在替换前更新文件列表
+        self.update_file_list()
+        
+        if not self.file_list:
+            self.log("错误: 没有选择要处理的文件")
+            return
+            
+        rule_set = self.compile_rules()
+        if rule_set is None:
+            return
+            
+        # 更新状态栏
+        self.status_bar.config(text="正在预览..." if dry_run else "正在处理文件...")
+        self.progress["value"] = 0
+        
+        engine = self.create_engine(rule_set, dry_run)
+        if dry_run:
+            self.preview = None
+            self.preview_file_list = list(self.file_list)
+        self.start_job(engine, list(self.file_list))
+    
+    def start_watch(self):
+        """监视目录：先处理目录中的全部文件，之后持续处理新增或修改的文件，直到点击取消"""
+        if self.job_thread is not None:
+            return
+        if self.file_mode.get() != "directory":
+            messagebox.showwarning("无法监视", "监视模式只支持选择目录")
+            return
+        
+        self.failed_files = []
+        self.update_file_list()
+        root = self.path_entry.get().strip()
+        if not os.path.isdir(root):
+            return
+        
+        rule_set = self.compile_rules()
+        if rule_set is None:
+            return
+        
+        self.status_bar.config(text="正在监视目录...")
+        self.progress["value"] = 0
+        engine = self.create_engine(rule_set)
+        # 界面变量只能在主线程中读取，监视参数在这里取好再交给后台线程
+        watch = {
+            'root': root,
+            'filter_text': self.filter_var.get(),
+            'recursive': self.recursive_var.get(),
+            'exclude_text': self.exclude_var.get(),
+        }
+        self.start_job(engine, list(self.file_list), watch=watch)
+    
+    def preview_replace(self):
+        """预览替换：记录每个文件的替换位置，不修改文件"""
+        self.execute_replace(dry_run=True)
+    
+    def apply_preview(self):
+        """应用最近一次预览；预览后未变化的文件直接使用记录的替换位置"""
+        if self.job_thread is not None:
+            return
+        if self.preview is None:
+            self.log("错误: 没有可以应用的预览")
+            return
+        
+        rule_set = self.compile_rules()
+        if rule_set is None:
+            return
+        engine = self.create_engine(rule_set)
+        if engine.fingerprint() != self.preview.fingerprint:
+            messagebox.showwarning("无法应用预览", "规则或编码设置在预览后已变化，请重新预览")
+            return
+        
+        self.failed_files = []
+        self.status_bar.config(text="正在应用预览...")
+        self.progress["value"] = 0
+        previews = self.preview
+        self.preview = None
+        self.start_job(engine, list(self.preview_file_list), previews)
+    
+    def compile_rules(self):
+        """在处理任何文件之前编译并校验所有规则，无效时返回 None"""
+        if not self.replace_rules:
+            self.log("错误: 没有定义替换规则")
+            return None
+        
+        try:
+            rule_set = RuleSet(self.replace_rules, self.rule_mode.get())
+        except RuleError as e:
+            self.log(f"错误: 规则无效\n{str(e)}")
+            messagebox.showerror("规则错误", str(e))
+            return None
+        if rule_set.unfused:
+            self.log("以下正则规则使用了反向引用或独立标志，无法合并，将单独执行: "
+                     + ", ".join(rule.alias for rule in rule_set.unfused))
+        return rule_set
+    
+    def create_engine(self, rule_set, dry_run=False):
+        """按界面设置创建替换引擎（预览不使用增量清单）"""
+        use_manifest = self.incremental_var.get() and not dry_run
+        if use_manifest or self.index_var.get():
+            # 清单与索引都按目标根目录保存
+            if self.file_mode.get() == "directory":
+                root = self.path_entry.get()
+            else:
+                root = common_root(self.file_list)
+        
+        manifest = None
+        if use_manifest:
+            try:
+                manifest = RunManifest(
+                    default_manifest_path(root),
+                    rule_fingerprint(rule_set, self.read_encoding.get(), self.write_encoding.get())
+                )
+            except Exception as e:
+                self.log(f"错误: 打开增量清单时出错，将处理全部文件 - {str(e)}")
+            else:
+                if manifest.invalidated:
+                    self.log("规则或编码设置已变化，清单失效，所有文件重新处理")
+        
+        content_index = None
+        if self.index_var.get():
+            try:
+                content_index = ContentIndex(default_index_path(root))
+            except Exception as e:
+                self.log(f"错误: 打开内容索引时出错，将不使用索引 - {str(e)}")
+        
+        try:
+            regex_timeout = max(0, self.regex_timeout_var.get())
+        except tk.TclError:
+            regex_timeout = DEFAULT_REGEX_TIMEOUT
+        
+        return ReplaceEngine(
+            rule_set,
+            read_encoding=self.read_encoding.get(),
+            write_encoding=self.write_encoding.get(),
+            log=self.post_log,
+            manifest=manifest,
+            dry_run=dry_run,
+            profile=self.profile_var.get(),
+            regex_timeout=regex_timeout or None,
+            content_index=content_index,
+            backup=BackupStore() if self.backup_var.get() and not dry_run else None
+        )
+    
+    def start_job(self, engine, file_list, previews=None, watch=None):
+        """在后台线程中启动任务；watch 为监视参数时处理完文件列表后持续监视目录"""
+        try:
+            workers = max(1, self.workers_var.get())
+        except tk.TclError:
+            workers = 1
+        self.start_thread(self.run_job, (engine, file_list, workers, previews, watch), len(file_list))
+    
+    def start_thread(self, target, args, total, cancellable=True):
+        """在后台线程中运行 target，任务结束前禁用其他操作"""
+        self.job_progress = (0, total)
+        self.cancel_event = threading.Event()
+        self.preview_btn.config(state=tk.DISABLED)
+        self.execute_btn.config(state=tk.DISABLED)
+        self.watch_btn.config(state=tk.DISABLED)
+        self.undo_btn.config(state=tk.DISABLED)
+        if cancellable:
+            self.cancel_btn.config(state=tk.NORMAL)
+        self.job_thread = threading.Thread(target=target, args=args, daemon=True)
+        self.job_thread.start()
+        self.root.after(self.poll_interval, self.poll_job_queue)
+    
+    def undo_last_run(self):
+        """撤销最近一次保存了备份的运行：把该次运行修改的文件恢复为原内容"""
+        if self.job_thread is not None:
+            return
+        store = BackupStore()
+        run_id = store.latest_run()
+        if run_id is None:
+            messagebox.showinfo("撤销", "没有可以撤销的运行（需要勾选“备份原文件”）")
+            return
+        try:
+            run = store.load_run(run_id)
+        except ValueError as e:
+            messagebox.showerror("撤销", str(e))
+            return
+        if not messagebox.askokcancel(
+                "撤销", f"将把 {run.time} 的运行修改的 {len(run.entries)} 个文件恢复为原内容，"
+                        f"之后又被修改过的文件不会恢复。\n确定要撤销吗?"):
+            return
+        
+        self.failed_files = []
+        self.status_bar.config(text="正在撤销...")
+        self.progress["value"] = 0
+        # 恢复到一半停止会留下部分撤销的运行，撤销不允许取消
+        self.start_thread(self.run_undo, (store, run_id), 0, cancellable=False)
+    
+    def run_undo(self, store, run_id):
+        """后台线程：从备份恢复一次运行修改的文件"""
+        try:
+            result = store.restore(run_id, self.post_log)
+        except Exception as e:
+            self.job_queue.put(("error", str(e)))
+        else:
+            self.job_queue.put(("undone", result))
+    
+    def run_job(self, engine, file_list, workers, previews=None, watch=None):
+        """后台线程：执行替换任务（或监视目录直到取消），结果通过队列交给界面"""
+        try:
+            if watch is not None:
+                result = watch_directory(engine, workers=workers, file_list=file_list,
+                                         on_progress=self.post_progress, stop_event=self.cancel_event, **watch)
+            else:
+                result = engine.run(file_list, on_progress=self.post_progress, workers=workers,
+                                    cancel_event=self.cancel_event, previews=previews)
+        except Exception as e:
+            self.job_queue.put(("error", str(e)))
+        else:
+            if result.profile is not None:
+                self.report_profile(result.profile, engine.rule_set)
+            self.job_queue.put(("done", result))
+        finally:
+            if engine.manifest is not None:
+                engine.manifest.close()
+            if engine.content_index is not None:
+                engine.content_index.close()
+            engine.cleanup()
+    
+    def report_profile(self, profile, rule_set):
+        """后台线程：输出性能统计汇总表，并把完整统计保存为 JSON"""
+        for line in profile.summary_lines(rule_set):
+            self.post_log(line)
+        file_path = os.path.join(cache_dir(), time.strftime("profile-%Y%m%d-%H%M%S.json"))
+        try:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            profile.save(file_path, rule_set)
+        except Exception as e:
+            self.post_log(f"警告: 保存性能统计时出错 - {str(e)}")
+        else:
+            self.post_log(f"性能统计已保存到: {file_path}")
+    
+    def post_log(self, message):
+        """后台线程：提交日志消息（日志缓冲区是线程安全的）"""
+        self.log_sink.emit(message)
+    
+    def post_progress(self, done, total):
+        """后台线程：记录进度，由界面定时读取"""
+        self.job_progress = (done, total)
+    
+    def poll_job_queue(self):
+        """定时拉取后台任务的进度与结果，更新界面"""
+        try:
+            finished = self.job_queue.get_nowait()
+        except queue.Empty:
+            finished = None
+        
+        done, total = self.job_progress
+        if total:
+            self.progress["value"] = done / total * 100
+            self.status_bar.config(text=f"正在处理文件... {done}/{total}")
+        elif done:
+            self.status_bar.config(text=f"正在处理文件... {done}")
+        
+        if finished is None:
+            self.root.after(self.poll_interval, self.poll_job_queue)
+        else:
+            self.finish_job(finished)
+    
+    def finish_job(self, finished):
+        """后台任务结束后恢复界面并显示结果"""
+        self.job_thread = None
+        self.log_sink.flush()
+        self.preview_btn.config(state=tk.NORMAL)
+        self.execute_btn.config(state=tk.NORMAL)
+        self.watch_btn.config(state=tk.NORMAL)
+        self.undo_btn.config(state=tk.NORMAL)
+        self.cancel_btn.config(state=tk.DISABLED)
+        
+        if finished[0] == "error":
+            self.status_bar.config(text="处理失败")
+            self.log(f"错误: 执行替换时出错 - {finished[1]}")
+            self.show_pending_log()
+            messagebox.showerror("错误", finished[1])
+            return
+        
+        result = finished[1]
+        self.failed_files = result.failed_files
+        if finished[0] == "undone":
+            summary = f"撤销完成: 恢复 {result.success_count} 个文件，未恢复 {result.failed_count} 个"
+            self.status_bar.config(text=summary)
+            log_failed_files(self.failed_files, self.log)
+            self.log(summary)
+            self.show_pending_log()
+            messagebox.showinfo("撤销完成", summary)
+            return
+        success_count = result.success_count
+        failed_count = result.failed_count
+        title = "已取消" if result.cancelled else "处理完成"
+        
+        if result.preview is not None:
+            self.finish_preview(result)
+            return
+        
+        # 更新状态栏
+        self.status_bar.config(text=f"{title}: {result.summary()}")
+        
+        # 显示失败文件列表（在弹出结果对话框之前显示全部日志）
+        log_failed_files(self.failed_files, self.log)
+        self.show_pending_log()
+        
+        # 显示结果消息
+        messagebox.showinfo(title, 
+                           f"{title}!\n成功: {success_count} 个\n失败: {failed_count} 个"
+                           + (f"\n未变化跳过: {result.unchanged_count} 个" if result.unchanged_count else "")
+                           + (f"\n索引排除: {result.excluded_count} 个" if result.excluded_count else "")
+                           + (f"\n预筛选跳过: {result.skipped_count} 个" if result.skipped_count else ""))
+    
+    def finish_preview(self, result):
+        """预览结束：保存结果并打开分页的预览窗口"""
+        self.preview = result.preview
+        title = "预览已取消" if result.cancelled else "预览完成"
+        summary = (f"{title}: 将修改 {len(self.preview.changed)} 个文件，"
+                   f"共 {self.preview.replacements} 处替换；{result.summary()}")
+        self.status_bar.config(text=summary)
+        log_failed_files(self.failed_files, self.log)
+        self.log(summary)
+        self.show_pending_log()
+        PreviewWindow(self.root, self, self.preview)
+    
+    def cancel_replace(self):
+        """请求取消正在运行的任务，当前文件处理完成后停止"""
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+            self.cancel_btn.config(state=tk.DISABLED)
+            self.status_bar.config(text="正在取消...")
+    
+    def on_closing(self):
+        """程序关闭时清理资源"""
+        if self.job_thread is not None:
+            if not messagebox.askokcancel("退出", "替换任务正在运行，确定要取消任务并退出吗?"):
+                return
+            # 等待当前文件处理完成，避免留下写入到一半的文件
+            self.cancel_event.set()
+            self.job_thread.join()
+        elif not messagebox.askokcancel("退出", "确定要退出程序吗?"):
+            return
+        
+        self.log_sink.close()
+        self.root.destroy()
+
+class PreviewWindow:
+    """预览结果窗口：分页显示有替换的文件，选中文件时才读取并显示替换片段"""
+    def __init__(self, parent, app, preview):
+        self.app = app
+        self.preview = preview
+        self.page_size = 100  # 每页显示的文件数
+        self.snippet_limit = 200  # 每个文件最多显示的替换片段数
+        self.page = 0
+        
+        self.top = tk.Toplevel(parent)
+        self.top.title("替换预览")
+        self.top.geometry("800x600")
+        self.top.transient(parent)
+        
+        self.font = ('SimHei', 10)
+        
+        main_frame = ttk.Frame(self.top, padding=10)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+        
+        ttk.Label(main_frame, text=f"将修改 {len(preview.changed)} 个文件，共 {preview.replacements} 处替换",
+                  font=self.font).pack(anchor=tk.W, pady=(0, 5))
+        
+        paned_window = ttk.PanedWindow(main_frame, orient=tk.VERTICAL)
+        paned_window.pack(fill=tk.BOTH, expand=True)
+        
+        # 文件列表（当前页）
+        tree_frame = ttk.Frame(paned_window)
+        paned_window.add(tree_frame, weight=1)
+        self.file_tree = ttk.Treeview(tree_frame, columns=("file", "count"), show="headings", height=10)
+        self.file_tree.heading("file", text="文件")
+        self.file_tree.heading("count", text="替换数")
+        self.file_tree.column("file", width=600)
+        self.file_tree.column("count", width=80, anchor=tk.E)
+        tree_scroll = ttk.Scrollbar(tree_frame, orient=tk.VERTICAL, command=self.file_tree.yview)
+        self.file_tree.configure(yscrollcommand=tree_scroll.set)
+        self.file_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        tree_scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        self.file_tree.bind("<<TreeviewSelect>>", self.show_snippets)
+        
+        # 选中文件的替换片段
+        self.snippet_text = scrolledtext.ScrolledText(paned_window, wrap=tk.WORD, font=self.font, height=10)
+        paned_window.add(self.snippet_text, weight=1)
+        
+        # 翻页与操作按钮
+        btn_frame = ttk.Frame(main_frame)
+        btn_frame.pack(fill=tk.X, pady=(10, 0))
+        
+        ttk.Button(btn_frame, text="上一页", command=lambda: self.show_page(self.page - 1)).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(btn_frame, text="下一页", command=lambda: self.show_page(self.page + 1)).pack(side=tk.LEFT, padx=(0, 5))
+        self.page_label = ttk.Label(btn_frame, font=self.font)
+        self.page_label.pack(side=tk.LEFT, padx=(5, 0))
+        
+        ttk.Button(btn_frame, text="关闭", command=self.top.destroy).pack(side=tk.RIGHT)
+        ttk.Button(btn_frame, text="应用预览", command=self.on_apply).pack(side=tk.RIGHT, padx=(0, 5))
+        
+        self.show_page(0)
+    
+    def show_page(self, page):
+        """显示第 page 页（从 0 开始）的文件"""
+        page_count = self.preview.page_count(self.page_size)
+        if not 0 <= page < page_count:
+            return
+        self.page = page
+        self.file_tree.delete(*self.file_tree.get_children())
+        for file_preview in self.preview.page(page, self.page_size):
+            self.file_tree.insert("", tk.END, iid=file_preview.path,
+                                  values=(file_preview.path, file_preview.replacements))
+        self.page_label.config(text=f"第 {page + 1}/{page_count} 页")
+    
+    def show_snippets(self, event=None):
+        """读取选中的文件，显示其替换片段"""
+        selected = self.file_tree.selection()
+        if not selected:
+            return
+        file_preview = self.preview.get(selected[0])
+        
+        self.snippet_text.delete(1.0, tk.END)
+        try:
+            snippets = load_snippets(file_preview, self.preview.aliases, self.snippet_limit)
+        except Exception as e:
+            self.snippet_text.insert(tk.END, f"无法读取文件: {str(e)}")
+            return
+        
+        lines = []
+        for alias, before, after in snippets:
+            lines.append(f"[{alias}]\n- {before}\n+ {after}\n")
+        if file_preview.replacements > len(snippets):
+            lines.append(f"……（仅显示前 {len(snippets)} 处，共 {file_preview.replacements} 处）")
+        self.snippet_text.insert(tk.END, "\n".join(lines))
+    
+    def on_apply(self):
+        """应用预览并关闭窗口"""
+        self.top.destroy()
+        self.app.apply_preview()
+
+class RuleDialog:
+    """替换规则对话框"""
+    def __init__(self, parent, app, title, rule_index=None):
+        self.app = app
+        self.rule_index = rule_index
+        
+        self.top = tk.Toplevel(parent)
+        self.top.title(title)
+        self.top.geometry("500x450")  # 增加高度以容纳正则选项
+        self.top.resizable(True, True)
+        self.top.transient(parent)
+        self.top.grab_set()
+        
+        # 设置中文字体
+        self.font = ('SimHei', 10)
+        
+        # 创建UI
+        main_frame = ttk.Frame(self.top, padding=10)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+        
+        # 规则别名
+        ttk.Label(main_frame, text="规则别名:", font=self.font).pack(anchor=tk.W, pady=(0, 5))
+        self.alias_var = tk.StringVar()
+        ttk.Entry(main_frame, textvariable=self.alias_var, font=self.font).pack(fill=tk.X, pady=(0, 10))
+        
+        # 查找内容
+        ttk.Label(main_frame, text="查找内容:", font=self.font).pack(anchor=tk.W, pady=(0, 5))
+        self.find_var = tk.StringVar()
+        ttk.Entry(main_frame, textvariable=self.find_var, font=self.font).pack(fill=tk.X, pady=(0, 10))
+        
+        # 替换内容
+        ttk.Label(main_frame, text="替换内容:", font=self.font).pack(anchor=tk.W, pady=(0, 5))
+        self.replace_text = scrolledtext.ScrolledText(main_frame, wrap=tk.WORD, height=10, font=self.font)
+        self.replace_text.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
+        
+        # 正则表达式选项
+        regex_frame = ttk.Frame(main_frame)
+        regex_frame.pack(fill=tk.X, pady=(5, 10))
+        
+        self.regex_var = tk.BooleanVar()
+        ttk.Checkbutton(regex_frame, text="使用正则表达式", variable=self.regex_var).pack(anchor=tk.W)
+        
+        # 按钮
+        btn_frame = ttk.Frame(main_frame)
+        btn_frame.pack(fill=tk.X)
+        
+        ttk.Button(btn_frame, text="确定", command=self.on_ok).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(btn_frame, text="取消", command=self.top.destroy).pack(side=tk.LEFT)
+        
+        # 如果是编辑模式，加载现有规则
+        if rule_index is not None and 0 <= rule_index < len(app.replace_rules):
+            rule = app.replace_rules[rule_index]
+            self.alias_var.set(rule["alias"])
+            self.find_var.set(rule["find"])
+            self.replace_text.delete(1.0, tk.END)
+            self.replace_text.insert(tk.END, rule["replace"])
+            self.regex_var.set(rule.get("regex", False))
+    
+    def on_ok(self):
+        """确定按钮处理"""
+        alias = self.alias_var.get().strip()
+        find_text = self.find_var.get()
+        replace_text = self.replace_text.get(1.0, tk.END).rstrip()
+        use_regex = self.regex_var.get()
+        
+        if not alias:
+            messagebox.showerror("错误", "规则别名不能为空")
+            return
+            
+        if not find_text:
+            messagebox.showerror("错误", "查找内容不能为空")
+            return
+        
+        # 提示容易灾难性回溯的正则，由用户决定是否保留
+        if use_regex:
+            risks = backtracking_risks(find_text)
+            if risks and not messagebox.askyesno(
+                    "正则警告",
+                    "此正则可能导致灾难性回溯，处理大文件时非常缓慢：\n\n"
+                    + "\n".join(f"• {risk}" for risk in risks)
+                    + "\n\n运行时超过“正则超时”的文件会被中止并记为失败。仍要保存此规则吗?",
+                    parent=self.top):
+                return
+            
+        rule = {
+            "alias": alias,
+            "find": find_text,
+            "replace": replace_text,
+            "regex": use_regex
+        }
+        
+        # 添加或更新规则（编辑时保留 max_span 等对话框中没有的字段）
+        if self.rule_index is not None and 0 <= self.rule_index < len(self.app.replace_rules):
+            rule = dict(self.app.replace_rules[self.rule_index], **rule)
+            self.app.replace_rules[self.rule_index] = rule
+            self.app.log(f"已更新规则: {alias}")
+        else:
+            self.app.replace_rules.append(rule)
+            self.app.log(f"已添加规则: {alias}")
+        
+        # 关闭对话框
+        self.top.destroy()
+
+def main():
+    """不带参数时打开界面；带参数时作为命令行工具运行（参数同 python -m adrts），不加载 Tk"""
+    if len(sys.argv) > 1:
+        from adrts.cli import main as cli_main
+        return cli_main()
+    root = load_tk().Tk()
+    TextReplaceTool(root)
+    root.mainloop()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
+### 主要改进点：
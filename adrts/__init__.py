@@ -0,0 +1,7 @@
+"""Adrts 文本替换引擎（无界面，可供 GUI、命令行与脚本调用）"""
+from .engine import (
+    AVAILABLE_ENCODINGS, ReplaceEngine, JobResult,
+    load_rules, save_rules, detect_encoding, log_failed_files,
+)
+from .scanner import collect_files
+from .rules import RuleSet, RuleError
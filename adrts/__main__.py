@@ -0,0 +1,6 @@
+"""支持 python -m adrts 运行命令行版本"""
+import sys
+
+from .cli import main
+
+sys.exit(main())
@@ -0,0 +1,189 @@
+"""规则检查：找出重复、冲突、不起作用或被前面的规则遮蔽的规则
+
+上万条规则的词表里常有重复或互相冲突的条目，运行前删除它们可以减少替换步骤，
+也能避免意料之外的结果。检查按规则集的执行顺序进行：
+- 查找内容相同的两条规则，前一条已替换全部匹配，后一条不会生效（替换内容相同为
+  重复，不同为冲突）；
+- 字面量规则的查找内容包含前面另一条字面量规则的查找内容时，这部分已先被替换，
+  这条规则通常不会再匹配（遮蔽）；
+- 字面量规则的替换内容与查找内容相同，不起作用。
+两条规则之间如果有规则的替换结果可能重新产生这些内容，不视为问题。替换结果与
+相邻文本拼接后也可能恰好组成查找内容（如把 ab 删除后 aabb 变为 ab），因此只有
+能确定不会出现这种情况的重复和冲突才标记为可删除（见 _can_recur），其余问题和
+遮蔽一样只作为提示。
+"""
+import bisect
+
+# 问题类型
+DUPLICATE = 'duplicate'
+CONFLICT = 'conflict'
+NO_OP = 'no-op'
+SHADOWED = 'shadowed'
+
+ISSUE_NAMES = {DUPLICATE: '重复', CONFLICT: '冲突', NO_OP: '无效', SHADOWED: '遮蔽'}
+
+
+class RuleIssue:
+    """规则检查发现的一个问题
+
+    index 为有问题的规则序号，other 为与之相关的前一条规则序号（没有时为 None）；
+    removable 为 True 时删除这条规则后替换结果一定不变，否则只是提示，不自动删除。
+    """
+    __slots__ = ('kind', 'index', 'other', 'message', 'removable')
+
+    def __init__(self, kind, index, other, message, removable=False):
+        self.kind = kind
+        self.index = index
+        self.other = other
+        self.message = message
+        self.removable = removable
+
+    def __str__(self):
+        return f"{ISSUE_NAMES[self.kind]}: {self.message}"
+
+
+def _label(rule):
+    """问题描述中的规则名称（别名可能重复，同时给出序号）"""
+    return f"第 {rule.index + 1} 条规则“{rule.alias}”"
+
+
+def _output(rule):
+    """规则的替换结果；正则模板引用分组时结果取决于匹配内容，返回 None"""
+    return rule.literal if rule.regex else rule.replace
+
+
+def _can_recur(find_text, output):
+    """把匹配替换为 output 后，output 与相邻文本拼接是否可能组成新的 find_text
+
+    新出现的查找内容必然与某处替换结果重叠，或跨过被删除内容留下的接缝：
+    output 为空时，长度大于 1 的查找内容可能跨过接缝；否则需要 output 与查找内容
+    互相包含，或 output 的后缀是查找内容的前缀、前缀是查找内容的后缀。
+    output 为 None（替换引用分组）时结果不确定，视为可能。
+    """
+    if output is None:
+        return True
+    if not output:
+        return len(find_text) > 1
+    if find_text in output or output in find_text:
+        return True
+    for size in range(1, min(len(find_text), len(output)) + 1):
+        if output.endswith(find_text[:size]) or output.startswith(find_text[-size:]):
+            return True
+    return False
+
+
+def _step_numbers(rule_set):
+    """每条规则所在的执行步骤序号；同一步骤中的规则一遍扫描，互不链式作用"""
+    starts = []
+    for step in rule_set.steps:
+        targets = getattr(step, 'targets', None)
+        branches = getattr(step, 'branches', None)
+        if targets is not None:
+            starts.append(min(index for _, index in targets.values()))
+        elif branches is not None:
+            starts.append(min(rule.index for rule in branches.values()))
+        else:
+            starts.append(step.index)
+    # 步骤按顺序覆盖连续的规则
+    return [bisect.bisect_right(starts, index) - 1 for index in range(len(rule_set.rules))]
+
+
+def _any_between(indices, first, last):
+    """升序列表 indices 中是否有落在 [first, last) 内的序号"""
+    pos = bisect.bisect_left(indices, first)
+    return pos < len(indices) and indices[pos] < last
+
+
+class _FindIndex:
+    """字面量查找内容的前缀树，用于找出一段文本中出现的全部查找内容"""
+    __slots__ = ('root',)
+
+    def __init__(self, find_texts):
+        self.root = {}
+        for find_text in find_texts:
+            node = self.root
+            for ch in find_text:
+                node = node.setdefault(ch, {})
+            node[''] = find_text
+
+    def occurrences(self, text):
+        """逐个产出 text 中出现的查找内容（同一内容出现多次时重复产出）"""
+        root = self.root
+        length = len(text)
+        for start in range(length):
+            node = root
+            for pos in range(start, length):
+                node = node.get(text[pos])
+                if node is None:
+                    break
+                found = node.get('')
+                if found is not None:
+                    yield found
+
+
+def analyze_rules(rule_set):
+    """检查编译后的规则集，返回按规则顺序排列的 RuleIssue 列表"""
+    rules = rule_set.rules
+    step_of = _step_numbers(rule_set)
+    finds = _FindIndex({rule.find for rule in rules if not rule.regex})
+
+    # 字面量查找内容 -> 替换结果中含有它的规则序号（升序）；替换引用分组的规则可能产生任何内容
+    producers = {}
+    wildcards = []
+    for rule in rules:
+        output = _output(rule)
+        if output is None:
+            wildcards.append(rule.index)
+            continue
+        for find_text in set(finds.occurrences(output)):
+            producers.setdefault(find_text, []).append(rule.index)
+
+    def reproduced(rule, first, last):
+        """rule 能匹配的内容是否可能由序号在 [first, last) 内的规则重新产生"""
+        if not rule.regex:
+            return (_any_between(wildcards, first, last)
+                    or _any_between(producers.get(rule.find, ()), first, last))
+        for other in rules[first:last]:
+            output = _output(other)
+            if output is None or rule.pattern.search(output) is not None:
+                return True
+        return False
+
+    issues = []
+    live = {}  # (查找内容, 是否正则) -> 前面最后一条仍会生效的规则
+    for rule in rules:
+        if not rule.regex and rule.find == rule.replace:
+            issues.append(RuleIssue(NO_OP, rule.index, None,
+                                    f"{_label(rule)}的替换内容与查找内容相同，不起作用", True))
+            continue
+
+        key = (rule.find, rule.regex)
+        earlier = live.get(key)
+        same_step = earlier is not None and step_of[earlier.index] == step_of[rule.index]
+        if earlier is not None and (same_step or not reproduced(rule, earlier.index, rule.index)):
+            # 同一步骤中后一条规则不会被使用；否则前一条及之间的规则都不能拼出新的查找内容
+            removable = same_step or (not rule.regex and not any(
+                _can_recur(rule.find, _output(other)) for other in rules[earlier.index:rule.index]))
+            if earlier.replace == rule.replace:
+                issues.append(RuleIssue(DUPLICATE, rule.index, earlier.index,
+                                        f"{_label(rule)}与{_label(earlier)}完全相同", removable))
+            else:
+                issues.append(RuleIssue(CONFLICT, rule.index, earlier.index,
+                                        f"{_label(rule)}与{_label(earlier)}的查找内容相同但替换不同，"
+                                        f"后者已替换全部匹配，此规则{'不会' if removable else '通常不会'}生效",
+                                        removable))
+            continue
+        live[key] = rule
+
+        if rule.regex:
+            continue
+        for find_text in finds.occurrences(rule.find):
+            other = live.get((find_text, False))
+            if (find_text != rule.find and other is not None
+                    and step_of[other.index] < step_of[rule.index]
+                    and not reproduced(other, other.index, rule.index)):
+                issues.append(RuleIssue(SHADOWED, rule.index, other.index,
+                                        f"{_label(rule)}的查找内容包含{_label(other)}的查找内容“{find_text}”，"
+                                        f"后者先执行，此规则通常不会匹配"))
+                break
+    return issues
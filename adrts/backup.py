@@ -0,0 +1,356 @@
+"""运行备份与撤销：只保存实际被修改的文件的原内容，存入按内容寻址、自动去重的备份仓库
+
+仓库目录结构：
+    objects/ab/abcdef...   按 SHA-256 命名的原文件内容，相同内容只保存一份
+    runs/<运行编号>.jsonl   每次运行一个记录文件：首行为运行信息，之后每行一个被修改的文件
+    tmp/                   保存过程中的暂存文件
+
+写回时原文件不会被原地修改：新内容写入旁边的临时文件后改名覆盖，原文件的 inode
+在覆盖之前仍然完整。因此在覆盖之前把原文件硬链接到仓库（只有一个链接的文件，
+且仓库与目标在同一文件系统时），不需要复制任何数据；不能硬链接时用 reflink
+（FICLONE，btrfs / XFS 等共享数据块）复制，再不行才普通复制。覆盖成功后计算
+暂存文件的摘要并移入 objects，已有相同内容时丢弃暂存文件。
+
+撤销时按记录文件把原内容复制回原路径（同样原子替换），并恢复原来的权限和修改
+时间。运行之后又被修改或已删除的文件默认不恢复，避免覆盖之后的修改。
+"""
+import os
+import json
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl，不使用 reflink
+    fcntl = None
+
+from .engine import JobResult, FileResult, _no_log
+from .fileio import TEMP_SUFFIX, _fsync_directory
+from .manifest import cache_dir
+
+# 记录文件格式版本
+BACKUP_VERSION = 1
+# Linux 的 FICLONE ioctl：目标文件与源文件共享数据块（写时复制）
+FICLONE = 0x40049409
+# 计算摘要和复制时每次读取的字节数
+COPY_CHUNK_SIZE = 1024 * 1024
+# 清理时删除超过此秒数的残留暂存文件（进程中途退出时留下）
+STALE_TEMP_SECONDS = 24 * 3600
+
+
+def default_backup_dir():
+    """备份仓库的默认目录（用户缓存目录下的 backups）"""
+    return os.path.join(cache_dir(), 'backups')
+
+
+def _copy_data(source, target):
+    """把已打开的 source 的内容复制到已打开的 target，返回使用的方式（reflink 或 copy）"""
+    if fcntl is not None:
+        try:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+            return 'reflink'
+        except OSError:
+            pass
+    while True:
+        chunk = source.read(COPY_CHUNK_SIZE)
+        if not chunk:
+            break
+        target.write(chunk)
+    return 'copy'
+
+
+def _digest(file_path):
+    """文件内容的 SHA-256"""
+    import hashlib
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        while True:
+            chunk = f.read(COPY_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class StagedOriginal:
+    """已暂存到仓库、等待原文件被覆盖的原内容"""
+    __slots__ = ('store', 'path', 'temp_path', 'stat', 'method')
+
+    def __init__(self, store, path, temp_path, stat, method):
+        self.store = store
+        self.path = path
+        self.temp_path = temp_path
+        self.stat = stat  # 原文件的状态
+        self.method = method  # link / reflink / copy
+
+    def discard(self):
+        """原文件没有被覆盖，删除暂存文件"""
+        try:
+            os.remove(self.temp_path)
+        except OSError:
+            pass
+
+    def store_object(self):
+        """原文件已被覆盖：把暂存文件移入 objects，返回记录（字典）"""
+        digest = _digest(self.temp_path)
+        object_path = self.store.object_path(digest)
+        if os.path.exists(object_path):
+            # 相同内容已经保存过
+            os.remove(self.temp_path)
+        else:
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            os.replace(self.temp_path, object_path)
+        current = os.stat(self.path)
+        return {
+            'path': self.path,
+            'object': digest,
+            'size': self.stat.st_size,
+            'mode': self.stat.st_mode & 0o7777,
+            'mtime_ns': self.stat.st_mtime_ns,
+            'new_size': current.st_size,
+            'new_mtime_ns': current.st_mtime_ns,
+            'method': self.method,
+        }
+
+
+class RunJournal:
+    """一次运行的记录文件，只在主进程中写入；第一次记录时才创建文件"""
+    def __init__(self, store, run_id):
+        self.store = store
+        self.run_id = run_id
+        self.count = 0
+        self.linked = 0  # 用硬链接保存、没有复制数据的文件数
+        self._file = None
+
+    def record(self, entry):
+        """记录一个被修改的文件"""
+        if self._file is None:
+            path = self.store.run_path(self.run_id)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._file = open(path, 'x', encoding='utf-8')
+            header = {'run': self.run_id, 'version': BACKUP_VERSION,
+                      'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'cwd': os.getcwd()}
+            self._file.write(json.dumps(header, ensure_ascii=False) + '\n')
+        self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        # 每条记录立即写出，中途退出时已修改的文件仍可撤销
+        self._file.flush()
+        self.count += 1
+        if entry.get('method') == 'link':
+            self.linked += 1
+
+    def close(self):
+        if self._file is not None:
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+
+
+class RunInfo:
+    """已保存的一次运行"""
+    __slots__ = ('run_id', 'time', 'entries', 'undone')
+
+    def __init__(self, run_id, time_text, entries, undone):
+        self.run_id = run_id
+        self.time = time_text
+        self.entries = entries  # 每个被修改文件的记录
+        self.undone = undone  # 撤销的时间，未撤销时为 None
+
+
+class BackupStore:
+    """按内容寻址的备份仓库；只保存目录路径，可传给工作进程使用"""
+    __slots__ = ('root',)
+
+    def __init__(self, root=None):
+        self.root = os.path.abspath(root or default_backup_dir())
+
+    def object_path(self, digest):
+        return os.path.join(self.root, 'objects', digest[:2], digest)
+
+    def run_path(self, run_id):
+        return os.path.join(self.root, 'runs', f'{run_id}.jsonl')
+
+    def stage(self, file_path):
+        """在原文件被覆盖之前暂存它的内容，返回 StagedOriginal；无法保存时抛出 OSError"""
+        stat = os.stat(file_path)
+        temp_dir = os.path.join(self.root, 'tmp')
+        os.makedirs(temp_dir, exist_ok=True)
+        temp_path = os.path.join(temp_dir, f'{os.getpid()}-{os.urandom(8).hex()}{TEMP_SUFFIX}')
+        method = None
+        # 有多个硬链接的文件覆盖后旧 inode 仍被其他路径使用，可能被原地修改，只能复制
+        if stat.st_nlink == 1:
+            try:
+                os.link(file_path, temp_path)
+                method = 'link'
+            except OSError:
+                pass
+        if method is None:
+            try:
+                with open(file_path, 'rb') as source, open(temp_path, 'xb') as target:
+                    method = _copy_data(source, target)
+                    target.flush()
+                    os.fsync(target.fileno())
+            except BaseException:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+                raise
+        _fsync_directory(temp_dir)
+        return StagedOriginal(self, os.path.abspath(file_path), temp_path, stat, method)
+
+    def open_run(self):
+        """开始一次运行，返回 RunJournal"""
+        run_id = time.strftime('%Y%m%d-%H%M%S') + '-' + os.urandom(3).hex()
+        return RunJournal(self, run_id)
+
+    def load_run(self, run_id):
+        """读取一次运行的记录，不存在时抛出 ValueError"""
+        try:
+            with open(self.run_path(run_id), 'r', encoding='utf-8') as f:
+                lines = [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            raise ValueError(f"没有找到运行 {run_id} 的备份")
+        except ValueError as e:
+            raise ValueError(f"运行 {run_id} 的备份记录已损坏 - {str(e)}")
+        header = lines[0] if lines else {}
+        entries = [line for line in lines[1:] if 'path' in line]
+        undone = [line['undone'] for line in lines[1:] if 'undone' in line]
+        return RunInfo(run_id, header.get('time'), entries, undone[-1] if undone else None)
+
+    def run_ids(self):
+        """全部运行编号，按时间从早到晚排列"""
+        try:
+            names = os.listdir(os.path.join(self.root, 'runs'))
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-len('.jsonl')] for name in names if name.endswith('.jsonl'))
+
+    def runs(self):
+        """全部运行的 RunInfo，按时间从早到晚排列；记录损坏的运行跳过"""
+        runs = []
+        for run_id in self.run_ids():
+            try:
+                runs.append(self.load_run(run_id))
+            except ValueError:
+                continue
+        return runs
+
+    def latest_run(self):
+        """最近一次尚未撤销的运行编号，没有时返回 None"""
+        for run_id in reversed(self.run_ids()):
+            try:
+                if self.load_run(run_id).undone is None:
+                    return run_id
+            except ValueError:
+                continue
+        return None
+
+    def restore(self, run_id, log=None, force=False, job=None):
+        """撤销一次运行：把记录的文件恢复为原内容，返回 JobResult
+
+        文件在运行之后又被修改（大小或修改时间与写回后不同）或已被删除时不恢复，
+        记为失败；force 为 True 时仍然恢复。
+        """
+        log = log or _no_log
+        if job is None:
+            job = JobResult()
+        run = self.load_run(run_id)
+        if run.undone is not None:
+            log(f"警告: 运行 {run_id} 已于 {run.undone} 撤销过")
+        log(f"撤销运行 {run_id}（{run.time}）: {len(run.entries)} 个文件")
+        # 按记录的相反顺序恢复
+        for entry in reversed(run.entries):
+            result = FileResult(entry['path'])
+            try:
+                self._restore_entry(entry, force)
+            except Exception as e:
+                result.error = str(e)
+                log(f"未恢复: {entry['path']} - {result.error}")
+            else:
+                log(f"已恢复: {entry['path']}")
+            job.add(result)
+        restored = job.success_count
+        if restored:
+            self._mark_undone(run_id, restored)
+        return job
+
+    def _restore_entry(self, entry, force):
+        """恢复一个文件的原内容、权限和修改时间"""
+        path = entry['path']
+        object_path = self.object_path(entry['object'])
+        if not os.path.exists(object_path):
+            raise Exception("备份内容已不存在")
+        try:
+            current = os.stat(path)
+        except FileNotFoundError:
+            if not force:
+                raise Exception("文件已被删除（可强制恢复）")
+            current = None
+        if (current is not None and not force
+                and (current.st_size, current.st_mtime_ns) != (entry['new_size'], entry['new_mtime_ns'])):
+            raise Exception("文件在替换之后又被修改过（可强制恢复）")
+
+        import tempfile
+        directory, name = os.path.split(path)
+        fd, temp_path = tempfile.mkstemp(prefix=f'.{name}.', suffix=TEMP_SUFFIX, dir=directory)
+        try:
+            with open(object_path, 'rb') as source, open(fd, 'wb') as target:
+                _copy_data(source, target)
+                target.flush()
+                os.fsync(target.fileno())
+            os.chmod(temp_path, entry['mode'])
+            os.utime(temp_path, ns=(time.time_ns(), entry['mtime_ns']))
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+        _fsync_directory(directory)
+
+    def _mark_undone(self, run_id, restored):
+        """在记录文件末尾追加撤销时间"""
+        with open(self.run_path(run_id), 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'undone': time.strftime('%Y-%m-%d %H:%M:%S'), 'restored': restored}) + '\n')
+
+    def prune(self, keep):
+        """只保留最近 keep 次运行的记录，删除不再被引用的内容和残留的暂存文件
+
+        返回 (删除的运行数, 删除的内容数)。不要在替换运行期间清理：刚保存、尚未记录的
+        内容会被当作不再引用而删除。
+        """
+        run_ids = self.run_ids()
+        removed_runs = run_ids[:max(0, len(run_ids) - keep)]
+        for run_id in removed_runs:
+            os.remove(self.run_path(run_id))
+
+        referenced = set()
+        for run_id in run_ids[len(removed_runs):]:
+            try:
+                referenced.update(entry['object'] for entry in self.load_run(run_id).entries)
+            except ValueError:
+                # 无法读取的记录中引用了哪些内容未知，不删除任何内容
+                return len(removed_runs), 0
+
+        removed_objects = 0
+        objects_dir = os.path.join(self.root, 'objects')
+        if os.path.isdir(objects_dir):
+            for prefix in os.listdir(objects_dir):
+                directory = os.path.join(objects_dir, prefix)
+                for digest in os.listdir(directory):
+                    if digest not in referenced:
+                        os.remove(os.path.join(directory, digest))
+                        removed_objects += 1
+
+        temp_dir = os.path.join(self.root, 'tmp')
+        if os.path.isdir(temp_dir):
+            deadline = time.time() - STALE_TEMP_SECONDS
+            for name in os.listdir(temp_dir):
+                path = os.path.join(temp_dir, name)
+                try:
+                    # 硬链接的暂存文件保留原文件的修改时间，按状态变化时间判断
+                    if os.stat(path).st_ctime < deadline:
+                        os.remove(path)
+                except OSError:
+                    pass
+        return len(removed_runs), removed_objects
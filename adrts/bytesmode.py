@@ -0,0 +1,374 @@
+"""字节模式：写入编码为 UTF-8 时，直接在原始字节上替换，不解码为 str 再编码回去
+
+适用于两类内容，其余情况退回文本模式：
+- 纯 ASCII 内容，读取编码与 ASCII 兼容（所有常用的单字节编码、GBK、UTF-8）；
+- 合法的 UTF-8 内容，读取编码为 UTF-8。
+UTF-8 是自同步的，编码后的查找文本只会在字符边界上匹配，因此字面量规则总能
+在字节上执行；正则规则只有在字节语义与文本语义相同时才能执行（见
+regex_byte_semantics），否则该类内容需要解码。两种模式的输出完全相同。
+"""
+import re
+import time
+import codecs
+import functools
+
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:  # Python 3.10 及更早
+    import sre_parse
+    import sre_constants
+
+from .rules import CompiledRule, _probe_template, _build_expander
+from .multipattern import LiteralAutomaton, FusedRegex, _trie_regex
+
+# 内容类别
+ASCII = 'ascii'
+UTF8 = 'utf-8'
+
+# 分块检查内容时每块的字节数（内存映射的文件按块复制，内存占用与文件大小无关）
+CHECK_CHUNK_SIZE = 1024 * 1024
+
+# Python 3.11 新增的操作码，早期版本没有
+_POSSESSIVE_REPEAT = getattr(sre_constants, 'POSSESSIVE_REPEAT', None)
+_ATOMIC_GROUP = getattr(sre_constants, 'ATOMIC_GROUP', None)
+_REPEATS = {sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT, _POSSESSIVE_REPEAT}
+_SPACE_CATEGORIES = {sre_constants.CATEGORY_SPACE, sre_constants.CATEGORY_NOT_SPACE}
+_SAFE_AT = {sre_constants.AT_BEGINNING, sre_constants.AT_BEGINNING_STRING,
+            sre_constants.AT_END, sre_constants.AT_END_STRING}
+
+# 替换模板中无法按字节拆分的占位字符（见 rules._probe_template）
+_TEMPLATE_MARKS = '\ufdd0\ufdd1\ufdd2\ufdd3'
+
+
+@functools.lru_cache(maxsize=None)
+def ascii_compatible(encoding):
+    """编码解码 ASCII 字节的结果是否与 ASCII 相同"""
+    try:
+        return bytes(range(128)).decode(encoding) == ''.join(map(chr, range(128)))
+    except (UnicodeDecodeError, LookupError):
+        return False
+
+
+def is_ascii(buffer):
+    """内容（bytes 或内存映射）是否为纯 ASCII"""
+    for start in range(0, len(buffer), CHECK_CHUNK_SIZE):
+        if not buffer[start:start + CHECK_CHUNK_SIZE].isascii():
+            return False
+    return True
+
+
+def is_utf8(buffer):
+    """内容是否为合法的 UTF-8（分块校验，不生成完整的 str）"""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        for start in range(0, len(buffer), CHECK_CHUNK_SIZE):
+            decoder.decode(buffer[start:start + CHECK_CHUNK_SIZE])
+        decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def _nodes(items):
+    """递归产出正则语法树的全部节点 (操作码, 参数)"""
+    for op, av in items:
+        yield op, av
+        if op in _REPEATS:
+            yield from _nodes(av[2])
+        elif op is sre_constants.SUBPATTERN:
+            yield from _nodes(av[-1])
+        elif op is sre_constants.BRANCH:
+            for branch in av[1]:
+                yield from _nodes(branch)
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            yield from _nodes(av[1])
+        elif op is sre_constants.GROUPREF_EXISTS:
+            yield from _nodes(av[1])
+            if av[2]:
+                yield from _nodes(av[2])
+        elif op is _ATOMIC_GROUP:
+            yield from _nodes(av)
+
+
+def _ascii_class(members, flags):
+    """字符集合在 UTF-8 字节上是否与文本语义相同：只含 ASCII 字符，不取反"""
+    for kind, value in members:
+        if kind is sre_constants.LITERAL:
+            if value >= 128:
+                return False
+        elif kind is sre_constants.RANGE:
+            if value[1] >= 128:
+                return False
+        elif kind is sre_constants.CATEGORY:
+            if not flags & re.ASCII:
+                return False
+        else:
+            return False
+    return True
+
+
+def _utf8_safe(items, flags):
+    """语法树在合法 UTF-8 内容上的字节匹配是否与文本匹配相同
+
+    只接受每个原子都匹配完整字符的结构：字面量、只含 ASCII 的字符集合、锚点、
+    分组、分支、断言和反向引用。任意字符（.）、取反的集合和非 ASCII 模式下的
+    \\w \\d \\s \\b 以及忽略大小写都依赖 Unicode 语义；量词直接作用于非 ASCII 字符时，
+    编码后只会重复其最后一个字节。
+    """
+    if flags & re.IGNORECASE and not flags & re.ASCII:
+        return False
+    for op, av in items:
+        if op is sre_constants.LITERAL or op is sre_constants.GROUPREF:
+            continue
+        if op is sre_constants.IN:
+            if not _ascii_class(av, flags):
+                return False
+        elif op in _REPEATS:
+            body = av[2]
+            if len(body) == 1 and body[0][0] is sre_constants.LITERAL and body[0][1] >= 128:
+                return False
+            if not _utf8_safe(body, flags):
+                return False
+        elif op is sre_constants.SUBPATTERN:
+            add_flags, del_flags = av[1], av[2]
+            if not _utf8_safe(av[-1], (flags | add_flags) & ~del_flags):
+                return False
+        elif op is sre_constants.BRANCH:
+            if not all(_utf8_safe(branch, flags) for branch in av[1]):
+                return False
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            if not _utf8_safe(av[1], flags):
+                return False
+        elif op is sre_constants.GROUPREF_EXISTS:
+            if not _utf8_safe(av[1], flags) or (av[2] and not _utf8_safe(av[2], flags)):
+                return False
+        elif op is _ATOMIC_GROUP:
+            if not _utf8_safe(av, flags):
+                return False
+        elif op is sre_constants.AT:
+            if av not in _SAFE_AT and not flags & re.ASCII:
+                return False
+        else:
+            return False
+    return True
+
+
+@functools.lru_cache(maxsize=None)
+def regex_byte_semantics(find_text):
+    """正则编码为 UTF-8 字节后，在 (纯 ASCII 内容, 合法 UTF-8 内容) 上是否与文本模式匹配相同
+
+    纯 ASCII 内容上，ASCII 正则只有 \\s 不同（文本模式还匹配 \\x1c-\\x1f）；
+    非 ASCII 内容的条件见 _utf8_safe，此外能匹配空串的正则（如 x*、b?、(?!a)）在
+    字节上会在多字节字符内部的每个位置匹配，不能用于非 ASCII 内容。
+    """
+    try:
+        parsed = sre_parse.parse(find_text, re.DOTALL)
+        re.compile(find_text.encode('utf-8'), re.DOTALL)
+    except (re.error, UnicodeEncodeError, RecursionError, OverflowError):
+        return False, False
+    state = getattr(parsed, 'state', None) or parsed.pattern  # Python 3.11 起改名为 state
+    flags = state.flags
+    items = list(parsed)
+    ascii_ok = find_text.isascii() and (bool(flags & re.ASCII) or not any(
+        op is sre_constants.IN and any(kind is sre_constants.CATEGORY and value in _SPACE_CATEGORIES
+                                       for kind, value in av)
+        for op, av in _nodes(items)))
+    return ascii_ok, parsed.getwidth()[0] > 0 and _utf8_safe(items, flags)
+
+
+class _LiteralStep:
+    """字面量规则：bytes.replace"""
+    __slots__ = ('find', 'replace', 'index')
+
+    def __init__(self, rule):
+        self.find = rule.find.encode('utf-8')
+        self.replace = rule.replace.encode('utf-8')
+        self.index = rule.index
+
+    def substitute(self, buffer, counts):
+        if buffer.find(self.find) < 0:
+            return buffer
+        data = buffer if isinstance(buffer, bytes) else bytes(buffer)
+        counts[self.index] += data.count(self.find)
+        return data.replace(self.find, self.replace)
+
+
+def _byte_replacement(rule):
+    """正则规则的字节替换：常量 bytes（可直接作为模板）或展开函数；无法按字节展开时返回 None"""
+    if rule.literal is not None:
+        literal = rule.literal.encode('utf-8')
+        if b'\\' not in literal:
+            return literal
+        return lambda match: literal
+    if any(mark in rule.replace for mark in _TEMPLATE_MARKS):
+        return None
+    pieces = _probe_template(rule.pattern, rule.replace)
+    return _build_expander([piece.encode('utf-8') if isinstance(piece, str) else piece
+                            for piece in pieces], b"")
+
+
+class _RegexStep:
+    """单条正则规则：编码为 UTF-8 的字节正则"""
+    __slots__ = ('pattern', 'template', 'index')
+
+    def __init__(self, rule, pattern, template):
+        self.pattern = pattern
+        self.template = template
+        self.index = rule.index
+
+    def substitute(self, buffer, counts):
+        # 先查找一次：没有匹配时原样返回，内存映射的内容不会被复制
+        if self.pattern.search(buffer) is None:
+            return buffer
+        data, count = self.pattern.subn(self.template, buffer)
+        counts[self.index] += count
+        return data
+
+
+class _DispatchStep:
+    """合并为一个正则的多条规则：按命中的分组分派替换"""
+    __slots__ = ('pattern', 'dispatch')
+
+    def __init__(self, pattern, dispatch):
+        self.pattern = pattern
+        self.dispatch = dispatch  # dispatch(match) -> (替换内容, 规则序号)
+
+    def substitute(self, buffer, counts):
+        if self.pattern.search(buffer) is None:
+            return buffer
+        dispatch = self.dispatch
+
+        def replace(match):
+            replacement, index = dispatch(match)
+            counts[index] += 1
+            return replacement
+
+        return self.pattern.sub(replace, buffer)
+
+
+def _automaton_step(automaton):
+    """字面量自动机的字节版本：前缀树按 UTF-8 字节构建，最左最长语义不变"""
+    targets = {}
+    trie = {}
+    for find_text, (replace_text, index) in automaton.targets.items():
+        find = find_text.encode('utf-8')
+        targets[find] = (replace_text.encode('utf-8'), index)
+        node = trie
+        for ch in find.decode('latin-1'):
+            node = node.setdefault(ch, {})
+        node[''] = {}
+    pattern = re.compile(_trie_regex(trie).encode('latin-1'))
+    return _DispatchStep(pattern, lambda match: targets[match.group()])
+
+
+def _fused_step(fused):
+    """合并正则的字节版本，分组结构与文本版本相同"""
+    branches = {}
+    parts = []
+    for group, rule in fused.branches.items():
+        pattern = re.compile(rule.find.encode('utf-8'), re.DOTALL)
+        replacement = _byte_replacement(rule)
+        if replacement is None:
+            return None
+        branches[group] = (rule, pattern, replacement)
+        parts.append(b'(' + rule.find.encode('utf-8') + b')')
+    fused_pattern = re.compile(b'|'.join(parts), re.DOTALL)
+
+    def dispatch(match):
+        rule, pattern, replacement = branches[match.lastindex]
+        if isinstance(replacement, bytes):
+            return replacement, rule.index
+        # 模板引用了分组：用规则自身的正则在同一位置重新匹配后展开
+        return replacement(pattern.match(match.string, match.start())), rule.index
+
+    return _DispatchStep(fused_pattern, dispatch)
+
+
+def _rule_output_ascii(rule):
+    """规则替换进去的文本（引用的分组内容除外）是否只有 ASCII 字符"""
+    if not rule.regex:
+        return rule.replace.isascii()
+    if rule.literal is not None:
+        return rule.literal.isascii()
+    # 模板含有占位字符时无法拆分，按非 ASCII 处理
+    return all(piece.isascii() for piece in _probe_template(rule.pattern, rule.replace)[0::2])
+
+
+def _step_output_ascii(step):
+    """规则步骤在纯 ASCII 内容上替换后，内容是否仍为纯 ASCII"""
+    if isinstance(step, LiteralAutomaton):
+        return all(replace_text.isascii() for replace_text, _ in step.targets.values())
+    if isinstance(step, FusedRegex):
+        return all(_rule_output_ascii(rule) for rule in step.branches.values())
+    return _rule_output_ascii(step)
+
+
+def _compile_step(step):
+    """编译一个规则步骤，返回 (字节步骤, 纯 ASCII 内容可用, UTF-8 内容可用)；无法按字节执行时字节步骤为 None"""
+    try:
+        if isinstance(step, LiteralAutomaton):
+            return _automaton_step(step), True, True
+        if isinstance(step, FusedRegex):
+            semantics = [regex_byte_semantics(rule.find) for rule in step.branches.values()]
+            return (_fused_step(step), all(a for a, _ in semantics), all(u for _, u in semantics))
+        if isinstance(step, CompiledRule) and not step.regex:
+            return _LiteralStep(step), True, True
+        ascii_ok, utf8_ok = regex_byte_semantics(step.find)
+        if not (ascii_ok or utf8_ok):
+            return None, False, False
+        pattern = re.compile(step.find.encode('utf-8'), re.DOTALL)
+        template = _byte_replacement(step)
+        if template is None:
+            return None, False, False
+        return _RegexStep(step, pattern, template), ascii_ok, utf8_ok
+    except (UnicodeEncodeError, re.error):
+        # 含有无法编码为 UTF-8 的字符（如孤立的代理项），文本模式写入时会报错
+        return None, False, False
+
+
+class ByteRuleSet:
+    """规则集的 UTF-8 字节版本，每个任务只编译一次
+
+    ascii_ok / utf8_ok 表示全部步骤在纯 ASCII / 合法 UTF-8 内容上能否按字节执行；
+    两者都为 False 时字节模式不可用。前面的步骤可能插入非 ASCII 文本时，纯 ASCII
+    内容在之后的步骤中已是一般的 UTF-8 内容，这些步骤需要在 UTF-8 内容上可用。
+    """
+    def __init__(self, rule_set):
+        self.rule_count = len(rule_set.rules)
+        self.steps = []  # (原步骤, 字节步骤)
+        self.ascii_ok = True
+        self.utf8_ok = True
+        inserted = False  # 前面的步骤可能在纯 ASCII 内容中插入了非 ASCII 文本
+        for step in rule_set.steps:
+            byte_step, ascii_ok, utf8_ok = _compile_step(step)
+            if byte_step is None:
+                self.ascii_ok = self.utf8_ok = False
+                self.steps = []
+                break
+            self.steps.append((step, byte_step))
+            self.ascii_ok = self.ascii_ok and (utf8_ok if inserted else ascii_ok)
+            self.utf8_ok = self.utf8_ok and utf8_ok
+            inserted = inserted or not _step_output_ascii(step)
+
+    @property
+    def usable(self):
+        return self.ascii_ok or self.utf8_ok
+
+    def apply(self, buffer, profile=None, guard=None):
+        """应用所有步骤，返回 (新内容, 各规则的替换次数)；没有替换时原样返回 buffer
+
+        profile / guard 的含义同 RuleSet.apply()。
+        """
+        counts = [0] * self.rule_count
+        for i, (step, byte_step) in enumerate(self.steps):
+            start = time.perf_counter()
+            if guard is None:
+                buffer = byte_step.substitute(buffer, counts)
+            else:
+                with guard.limit(step):
+                    buffer = byte_step.substitute(buffer, counts)
+            if profile is not None:
+                profile.step_time[i] += time.perf_counter() - start
+        if profile is not None:
+            profile.add_counts(counts)
+        return buffer, counts
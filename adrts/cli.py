@@ -0,0 +1,391 @@
+"""命令行入口：使用 GUI 保存的规则 JSON 在无界面环境中批量替换
+
+用法示例：
+    python -m adrts rules.json ./docs --filter "*.txt,*.md"
+    python -m adrts rules.json a.txt b.txt --read-encoding auto-detect
+    python -m adrts glossary.jsonl --check-rules
+    python -m adrts rules.json ./incoming --watch
+    python -m adrts rules.json ./docs --backup
+    python -m adrts --undo
+    python -m adrts rules.json /mnt/share/docs --coordinate /mnt/share/job.sqlite
+    python -m adrts --work /mnt/share/job.sqlite -j 4
+"""
+import os
+import sys
+import argparse
+import itertools
+
+from .engine import ReplaceEngine, load_rules, log_failed_files, DEFAULT_STREAM_THRESHOLD
+from .rules import RuleSet, RuleError, RULE_MODES, MODE_SEQUENTIAL
+from .scanner import collect_files, iter_files, DEFAULT_EXCLUDES
+from .parallel import default_workers
+from .manifest import RunManifest, default_manifest_path, common_root, rule_fingerprint
+from .contentindex import ContentIndex, default_index_path
+from .profiling import timed_iter
+from .guard import DEFAULT_REGEX_TIMEOUT, rule_warnings
+from .pipeline import DEFAULT_IO_THREADS, DEFAULT_IO_BUDGET
+from .analysis import analyze_rules
+from .watch import DEFAULT_WATCH_DELAY, DEFAULT_POLL_INTERVAL, watch_directory
+from .backup import BackupStore
+from .distributed import (JobQueue, DEFAULT_BATCH_SIZE, DEFAULT_LEASE, enqueue, run_worker,
+                          wait_for_job)
+
+
+def build_parser():
+    """构建命令行参数解析器"""
+    parser = argparse.ArgumentParser(
+        prog="adrts",
+        description="Adrts超级文本替换工具（命令行版）"
+    )
+    parser.add_argument("rules", nargs="?",
+                        help="规则文件（GUI 中“保存规则”生成的 JSON，或每行一条规则的 .jsonl）")
+    parser.add_argument("paths", nargs="*", help="要处理的文件，或单个目录")
+    parser.add_argument("--check-rules", action="store_true",
+                        help="只检查规则：列出重复、冲突、不起作用和被前面规则遮蔽的规则后退出，不处理文件")
+    parser.add_argument("--filter", default="*.*",
+                        help="目录模式的文件过滤，多个模式用逗号分隔（默认 *.*）")
+    parser.add_argument("--exclude", default=DEFAULT_EXCLUDES,
+                        help="目录模式下排除的文件名、目录名或相对路径模式，多个用逗号分隔，"
+                             "被排除的目录不会被进入（默认 %(default)s，传空字符串不排除）")
+    parser.add_argument("--no-recursive", dest="recursive", action="store_false",
+                        help="目录模式下不递归子文件夹")
+    parser.add_argument("--read-encoding", default="try-all",
+                        help="读取编码，支持 auto-detect / try-all（默认 try-all）")
+    parser.add_argument("--write-encoding", default="utf-8",
+                        help="写入编码（默认 utf-8）")
+    parser.add_argument("--mode", choices=RULE_MODES, default=MODE_SEQUENTIAL,
+                        help="规则执行模式：sequential 依次链式替换；single-pass 合并字面量规则单遍替换；"
+                             "fused 再把独立的正则规则合并为一次扫描")
+    parser.add_argument("--stream-threshold", type=float, default=DEFAULT_STREAM_THRESHOLD / 1024 / 1024,
+                        metavar="MB",
+                        help="不小于此大小（MB）的文件分块流式替换，0 表示不使用流式模式（默认 64）")
+    parser.add_argument("--no-prefilter", dest="prefilter", action="store_false",
+                        help="不做字节级预筛选，所有文件都解码检查")
+    parser.add_argument("--no-bytes-mode", dest="bytes_mode", action="store_false",
+                        help="不在原始字节上直接替换，所有文件都先解码")
+    parser.add_argument("--regex-timeout", type=float, default=DEFAULT_REGEX_TIMEOUT, metavar="SECONDS",
+                        help="每条正则规则在单个文件上的最长运行时间，超时的文件记为失败，0 表示不限制"
+                             "（默认 %(default)s）")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="只预览：列出每个文件的替换次数，不修改任何文件")
+    parser.add_argument("--incremental", action="store_true",
+                        help="增量运行：跳过上次用相同规则和编码处理后未变化的文件")
+    parser.add_argument("--manifest", metavar="PATH",
+                        help="增量运行的清单文件（默认按目标根目录保存在用户缓存目录中）")
+    parser.add_argument("--index", action="store_true",
+                        help="使用持久化内容索引：未变化的文件不打开，直接排除不可能含有查找内容的文件"
+                             "（首次运行需读取全部文件建立索引）")
+    parser.add_argument("--index-path", metavar="PATH",
+                        help="内容索引文件（默认按目标根目录保存在用户缓存目录中，隐含 --index）")
+    parser.add_argument("--profile", action="store_true",
+                        help="统计各阶段耗时、每条规则的耗时与命中数，结束后输出汇总表（输出到标准错误）")
+    parser.add_argument("--profile-json", metavar="PATH",
+                        help="把性能统计保存为 JSON 文件（隐含 --profile）")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="并行工作进程数，0 表示使用全部 CPU 核（默认 1，串行处理）")
+    parser.add_argument("--io-threads", type=int, default=DEFAULT_IO_THREADS, metavar="N",
+                        help="单进程处理时预读和写回各使用 N 个线程，与替换计算重叠，0 表示不使用流水线"
+                             "（默认 %(default)s）")
+    parser.add_argument("--io-budget", type=float, default=DEFAULT_IO_BUDGET / 1024 / 1024, metavar="MB",
+                        help="流水线中已读取但尚未写完的文件最多占用的内存（MB，默认 64）")
+    parser.add_argument("--watch", action="store_true",
+                        help="监视模式（只支持单个目录）：处理完目录后继续运行，新增或修改的文件写入完成后自动处理，"
+                             "按 Ctrl+C 停止")
+    parser.add_argument("--watch-delay", type=float, default=DEFAULT_WATCH_DELAY, metavar="SECONDS",
+                        help="监视模式下文件最后一次变化后等待的秒数，连续的写入只处理一次（默认 %(default)s）")
+    parser.add_argument("--poll", action="store_true",
+                        help="监视模式下不使用 inotify，始终按修改时间轮询（如网络文件系统）")
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL, metavar="SECONDS",
+                        help="轮询目录的间隔秒数（默认 %(default)s）")
+    parser.add_argument("--backup", action="store_true",
+                        help="覆盖文件之前把原内容保存到备份仓库（只保存被修改的文件，相同内容只存一份，"
+                             "能硬链接时不复制数据），可用 --undo 撤销")
+    parser.add_argument("--backup-dir", metavar="PATH",
+                        help="备份仓库目录（默认在用户缓存目录中，隐含 --backup）；与目标文件在同一文件系统时"
+                             "通过硬链接保存原文件")
+    parser.add_argument("--undo", nargs="?", const="", metavar="RUN",
+                        help="撤销一次运行：把该次运行修改的文件恢复为原内容（默认最近一次未撤销的运行），"
+                             "不需要规则文件")
+    parser.add_argument("--force", action="store_true",
+                        help="撤销时也恢复运行之后又被修改或已删除的文件")
+    parser.add_argument("--list-backups", action="store_true", help="列出备份仓库中保存的运行")
+    parser.add_argument("--prune-backups", type=int, metavar="N",
+                        help="只保留最近 N 次运行的备份，删除不再需要的内容")
+    parser.add_argument("--coordinate", metavar="JOB",
+                        help="分布式协调者（只支持单个目录）：把目录中的文件分批写入共享存储上的任务数据库"
+                             "（新文件），等待各机器上的 --work 工作者处理完成后汇总报告失败的文件")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, metavar="N",
+                        help="分布式任务每批的文件数（默认 %(default)s）")
+    parser.add_argument("--no-wait", dest="wait", action="store_false",
+                        help="协调者写入全部批次后立即退出，之后用 --job-status 查看结果")
+    parser.add_argument("--work", metavar="JOB",
+                        help="分布式工作者：领取并处理任务数据库中的批次，直到任务全部完成；规则和编码等设置"
+                             "来自任务，不需要规则文件，可在多台机器上同时运行")
+    parser.add_argument("--mount", metavar="PATH",
+                        help="工作者所在机器上目标目录的路径（默认与协调者相同）")
+    parser.add_argument("--lease", type=float, default=DEFAULT_LEASE, metavar="SECONDS",
+                        help="工作者领取批次的租约秒数，工作者失联这么久后批次由其他工作者重新处理"
+                             "（默认 %(default)s）")
+    parser.add_argument("--job-status", metavar="JOB", help="查看分布式任务的进度和失败的文件")
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="只输出失败文件和汇总信息")
+    return parser
+
+
+def check_rules(rule_set, log):
+    """输出规则检查结果，返回退出码（发现问题时为 1）"""
+    issues = analyze_rules(rule_set)
+    for issue in issues:
+        log(str(issue))
+    removable = sum(1 for issue in issues if issue.removable)
+    log(f"规则检查完成: 共 {len(rule_set)} 条规则，发现 {len(issues)} 个问题（可删除 {removable} 条）")
+    return 1 if issues else 0
+
+
+def backup_command(args, log, error_log):
+    """处理 --undo / --list-backups / --prune-backups，返回退出码"""
+    store = BackupStore(args.backup_dir)
+    if args.list_backups:
+        runs = store.runs()
+        for run in runs:
+            state = f"已撤销 ({run.undone})" if run.undone else ""
+            log(f"{run.run_id}\t{run.time}\t{len(run.entries)} 个文件\t{state}".rstrip())
+        log(f"备份仓库: {store.root}，共 {len(runs)} 次运行")
+        return 0
+    if args.prune_backups is not None:
+        removed_runs, removed_objects = store.prune(max(0, args.prune_backups))
+        log(f"清理完成: 删除 {removed_runs} 次运行的记录，{removed_objects} 份不再需要的内容")
+        return 0
+
+    run_id = args.undo or store.latest_run()
+    if run_id is None:
+        error_log("错误: 没有可以撤销的运行")
+        return 2
+    try:
+        result = store.restore(run_id, None if args.quiet else log, args.force)
+    except ValueError as e:
+        error_log(f"错误: {str(e)}")
+        return 2
+    log_failed_files(result.failed_files, error_log)
+    log(f"撤销完成: 恢复 {result.success_count} 个文件，未恢复 {result.failed_count} 个")
+    return 1 if result.failed_count else 0
+
+
+def report_job(queue, log, error_log):
+    """输出分布式任务的汇总结果，返回退出码（有失败文件或任务未完成时为 1）"""
+    result = queue.report()
+    progress = queue.progress()
+    log_failed_files(result.failed_files, error_log)
+    finished = not progress['scanning'] and not progress['pending'] and not progress['leased']
+    state = "任务完成" if finished else f"任务进行中（{progress['finished']}/{progress['files']} 个文件已处理）"
+    log(f"{state}: {result.summary()}，共 {progress['replacements']} 处替换")
+    return 1 if result.failed_count or not finished else 0
+
+
+def distributed_command(args, log, error_log):
+    """处理 --work / --job-status，返回退出码"""
+    try:
+        queue = JobQueue(args.work or args.job_status)
+    except ValueError as e:
+        error_log(f"错误: {str(e)}")
+        return 2
+    try:
+        if args.job_status:
+            return report_job(queue, log, error_log)
+
+        import signal
+        import threading
+        stop_event = threading.Event()
+
+        def on_interrupt(signum, frame):
+            # 第一次 Ctrl+C 处理完当前文件后释放批次，再按一次立即退出
+            if stop_event.is_set():
+                raise KeyboardInterrupt
+            stop_event.set()
+            error_log("正在停止：当前文件处理完成后释放批次（再按一次 Ctrl+C 立即退出）")
+
+        previous = signal.signal(signal.SIGINT, on_interrupt)
+        try:
+            result = run_worker(queue, None if args.quiet else log, workers=args.jobs or default_workers(),
+                                lease=args.lease, root=args.mount, stop_event=stop_event,
+                                io_threads=max(0, args.io_threads), io_budget=int(args.io_budget * 1024 * 1024),
+                                backup=BackupStore(args.backup_dir) if args.backup or args.backup_dir else None)
+        except RuleError as e:
+            error_log(f"错误: 规则无效\n{str(e)}")
+            return 2
+        finally:
+            signal.signal(signal.SIGINT, previous)
+        log_failed_files(result.failed_files, error_log)
+        log(f"工作者{'已停止' if result.cancelled else '完成'}: {result.summary()}")
+        return 1 if result.failed_count else 0
+    finally:
+        queue.close()
+
+
+def coordinate_command(args, rules, file_list, log, error_log):
+    """处理 --coordinate：写入任务，等待完成后汇总报告，返回退出码"""
+    stream_threshold = int(args.stream_threshold * 1024 * 1024) if args.stream_threshold > 0 else None
+    options = {
+        'read_encoding': args.read_encoding,
+        'write_encoding': args.write_encoding,
+        'stream_threshold': stream_threshold,
+        'prefilter': args.prefilter,
+        'regex_timeout': args.regex_timeout or None,
+        'bytes_mode': args.bytes_mode,
+    }
+    try:
+        queue = JobQueue(args.coordinate, create=True)
+    except ValueError as e:
+        error_log(f"错误: {str(e)}")
+        return 2
+    try:
+        queue.setup(rules, args.mode, options, args.paths[0])
+        count = enqueue(queue, file_list, args.paths[0], max(1, args.batch_size))
+        log(f"任务已创建: {count} 个文件，每批 {max(1, args.batch_size)} 个，任务数据库 {args.coordinate}")
+        if not args.wait:
+            log(f"在各机器上运行: python -m adrts --work {args.coordinate}")
+            return 0
+        try:
+            wait_for_job(queue, None if args.quiet else log)
+        except KeyboardInterrupt:
+            log(f"已停止等待，任务仍在进行，可用 python -m adrts --job-status {args.coordinate} 查看")
+            return 1
+        return report_job(queue, log, error_log)
+    finally:
+        queue.close()
+
+
+def main(argv=None):
+    """命令行主函数，返回进程退出码（有失败文件时为 1）"""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.undo is not None or args.list_backups or args.prune_backups is not None:
+        return backup_command(args, print, lambda message: print(message, file=sys.stderr))
+    if args.work or args.job_status:
+        return distributed_command(args, print, lambda message: print(message, file=sys.stderr))
+    if args.rules is None:
+        parser.error("需要指定规则文件")
+    if not args.paths and not args.check_rules:
+        parser.error("需要指定要处理的文件或目录")
+    if args.watch and not (len(args.paths) == 1 and os.path.isdir(args.paths[0])):
+        parser.error("--watch 只支持单个目录")
+    if args.watch and args.dry_run:
+        parser.error("--watch 不能与 --dry-run 同时使用")
+    if args.coordinate and not (len(args.paths) == 1 and os.path.isdir(args.paths[0])):
+        parser.error("--coordinate 只支持单个目录")
+    if args.coordinate and (args.dry_run or args.watch):
+        parser.error("--coordinate 不能与 --dry-run 或 --watch 同时使用")
+
+    def log(message):
+        print(message)
+
+    def error_log(message):
+        print(message, file=sys.stderr)
+
+    verbose_log = None if args.quiet else log
+
+    try:
+        rules = load_rules(args.rules)
+    except Exception as e:
+        error_log(f"错误: 加载规则时出错 - {str(e)}")
+        return 2
+
+    if not rules:
+        error_log("错误: 没有定义替换规则")
+        return 2
+
+    # 提示容易灾难性回溯的正则，运行时由时间限制兜底
+    for warning in rule_warnings(rules):
+        error_log(warning)
+
+    try:
+        rule_set = RuleSet(rules, args.mode)
+    except RuleError as e:
+        error_log(f"错误: 规则无效\n{str(e)}")
+        return 2
+    if rule_set.unfused and verbose_log:
+        verbose_log("以下正则规则使用了反向引用或独立标志，无法合并，将单独执行: "
+                    + ", ".join(rule.alias for rule in rule_set.unfused))
+
+    if args.check_rules:
+        return check_rules(rule_set, log)
+
+    profiling = args.profile or bool(args.profile_json)
+    scan_phases = {}
+    directory_mode = len(args.paths) == 1 and os.path.isdir(args.paths[0])
+    if directory_mode:
+        # 边扫描边处理，不必等待整个目录树遍历完成
+        file_list = iter_files("directory", args.paths[0], args.filter,
+                               args.recursive, log=verbose_log, exclude_text=args.exclude)
+        if profiling:
+            file_list = timed_iter(file_list, scan_phases, 'scan')
+        first = next(file_list, None)
+        if first is not None:
+            file_list = itertools.chain([first], file_list)
+    else:
+        file_list = collect_files("multiple", ",".join(args.paths), log=verbose_log)
+        first = file_list[0] if file_list else None
+
+    if first is None and not args.watch:
+        error_log("错误: 没有选择要处理的文件")
+        return 2
+
+    if args.coordinate:
+        return coordinate_command(args, rules, file_list, log, error_log)
+
+    manifest = None
+    if (args.incremental or args.manifest) and not args.dry_run:
+        manifest_path = args.manifest or default_manifest_path(
+            args.paths[0] if directory_mode else common_root(file_list))
+        manifest = RunManifest(manifest_path, rule_fingerprint(rule_set, args.read_encoding, args.write_encoding))
+        if manifest.invalidated and verbose_log:
+            verbose_log("规则或编码设置已变化，清单失效，所有文件重新处理")
+
+    content_index = None
+    if args.index or args.index_path:
+        content_index = ContentIndex(args.index_path or default_index_path(
+            args.paths[0] if directory_mode else common_root(file_list)))
+
+    stream_threshold = int(args.stream_threshold * 1024 * 1024) if args.stream_threshold > 0 else None
+    engine = ReplaceEngine(rule_set, args.read_encoding, args.write_encoding, log=verbose_log,
+                           stream_threshold=stream_threshold, prefilter=args.prefilter,
+                           manifest=manifest, dry_run=args.dry_run, profile=profiling,
+                           regex_timeout=args.regex_timeout or None, bytes_mode=args.bytes_mode,
+                           io_threads=max(0, args.io_threads), io_budget=int(args.io_budget * 1024 * 1024),
+                           content_index=content_index,
+                           backup=BackupStore(args.backup_dir) if args.backup or args.backup_dir else None)
+    try:
+        if args.watch:
+            # 空目录也可以监视；初始处理之后持续处理变化的文件，直到 Ctrl+C
+            result = watch_directory(engine, args.paths[0], args.filter, args.recursive, args.exclude,
+                                     workers=args.jobs or default_workers(),
+                                     file_list=file_list if first is not None else None,
+                                     delay=args.watch_delay, poll_interval=args.poll_interval, polling=args.poll)
+        else:
+            result = engine.run(file_list, workers=args.jobs or default_workers())
+    finally:
+        engine.cleanup()
+        if manifest is not None:
+            manifest.close()
+        if content_index is not None:
+            content_index.close()
+
+    if result.profile is not None:
+        # 扫描与处理交替进行，扫描耗时在处理结束后才完整
+        result.profile.phases.update(scan_phases)
+        for line in result.profile.summary_lines(rule_set):
+            error_log(line)
+        if args.profile_json:
+            result.profile.save(args.profile_json, rule_set)
+
+    log_failed_files(result.failed_files, error_log)
+    if result.preview is not None:
+        for file_path in result.preview.changed:
+            log(f"{result.preview.get(file_path).replacements}\t{file_path}")
+        log(f"预览完成: 将修改 {len(result.preview.changed)} 个文件，共 {result.preview.replacements} 处替换；"
+            f"{result.summary()}")
+    else:
+        log(f"处理完成: {result.summary()}")
+        if engine.run_id is not None and not args.watch:
+            log(f"撤销本次运行: python -m adrts --undo {engine.run_id}")
+    return 1 if result.failed_count else 0
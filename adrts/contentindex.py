@@ -0,0 +1,201 @@
+"""持久化内容索引：记录每个文件含有的字节三元组，文件未变化时不打开就能排除不可能匹配的文件
+
+每个文件保存一个三元组布隆过滤器（只有一个哈希函数的位图）。规则必需的字面量
+（与预筛选相同，按各候选编码编码为字节）的全部三元组都在过滤器中时，文件才可能
+含有该字面量；一个字面量都不可能出现的文件不需要处理。判断只会多选、不会漏选，
+候选文件照常经过预筛选和替换。
+
+索引只与文件内容有关，规则变化后仍然可用。文件的大小或修改时间变化时重新读取
+并更新记录；本工具写回的文件在索引中作废，下次运行重新索引。sqlite3 在打开索引时才导入。
+"""
+import os
+import threading
+
+from .manifest import cache_dir, COMMIT_INTERVAL
+from .prefilter import required_literal, _encode_candidates
+
+# 索引格式版本；哈希或分词方式变化时递增，旧索引整体重建
+INDEX_VERSION = 1
+# 超过此大小（字节）的文件不建立索引，总是作为候选
+MAX_INDEX_SIZE = 16 * 1024 * 1024
+# 必需字面量的字节形式超过此数量时不使用索引：逐个检查比直接预筛选更慢
+MAX_QUERY_NEEDLES = 256
+# 过滤器的位数不少于三元组数的这么多倍（取 2 的幂），单个三元组的误判率不超过 22%
+BITS_PER_GRAM = 4
+MIN_FILTER_BITS = 64
+MAX_FILTER_BITS = 1 << 20
+
+_GOLDEN = 0x9E3779B1
+
+
+def default_index_path(root):
+    """目标根目录对应的索引文件路径，每个根目录一个索引"""
+    import hashlib
+    key = hashlib.sha1(os.path.abspath(root).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache_dir(), f'index-{key}.sqlite')
+
+
+def _positions(grams, mask):
+    """三字节组合在 mask + 1 位的过滤器中对应的位（乘法哈希取第 12 位起的 20 位）"""
+    return {(a << 16 | b << 8 | c) * _GOLDEN >> 12 & mask for a, b, c in grams}
+
+
+def file_grams(data):
+    """文件字节中各空白分隔片段内的全部三字节组合
+
+    字面量按同样的空白切分后只检查片段内的三元组，因此先对片段去重，重复的词
+    只计算一次；片段拼接处多出的三元组只会增加候选，不会漏选。
+    """
+    text = b'\n'.join(set(data.split()))
+    return set(zip(text, text[1:], text[2:]))
+
+
+def needle_grams(needle):
+    """字面量字节形式中各空白分隔片段内的全部三字节组合"""
+    grams = set()
+    for piece in needle.split():
+        grams.update(zip(piece, piece[1:], piece[2:]))
+    return grams
+
+
+def build_filter(grams):
+    """由三字节组合构建过滤器位图（小端字节序）"""
+    bits = MIN_FILTER_BITS
+    while bits < len(grams) * BITS_PER_GRAM and bits < MAX_FILTER_BITS:
+        bits <<= 1
+    bitmap = bytearray(bits // 8)
+    for position in _positions(grams, bits - 1):
+        bitmap[position >> 3] |= 1 << (position & 7)
+    return bytes(bitmap)
+
+
+class IndexQuery:
+    """规则集在索引中的查询：任一必需字面量的全部三元组都在文件的过滤器中时，文件是候选"""
+    __slots__ = ('needles', '_masks')
+
+    def __init__(self, needles):
+        self.needles = needles  # 每个字面量字节形式的三字节组合集合
+        self._masks = {}  # 过滤器位数 -> 各字面量对应的位掩码
+
+    def masks(self, bits):
+        """各字面量在 bits 位的过滤器中对应的位掩码"""
+        masks = self._masks.get(bits)
+        if masks is None:
+            masks = {sum(1 << position for position in _positions(grams, bits - 1)) for grams in self.needles}
+            self._masks[bits] = masks = list(masks)
+        return masks
+
+    def may_contain(self, bitmap):
+        """过滤器对应的文件是否可能含有任一必需字面量"""
+        value = int.from_bytes(bitmap, 'little')
+        for mask in self.masks(len(bitmap) * 8):
+            if value & mask == mask:
+                return True
+        return False
+
+
+def build_query(rule_set, encodings):
+    """为规则集构建索引查询
+
+    有规则无法确定必需字面量、字面量的某个字节形式没有完整的三元组（过短）或
+    字节形式过多时返回 None，此时索引无法缩小范围。
+    """
+    needles = set()
+    for rule in rule_set.rules:
+        literal = required_literal(rule)
+        if literal is None:
+            return None
+        needles |= _encode_candidates(literal, encodings)
+    if not needles or len(needles) > MAX_QUERY_NEEDLES:
+        return None
+    grams = [needle_grams(needle) for needle in needles]
+    if not all(grams):
+        return None
+    return IndexQuery(grams)
+
+
+class ContentIndex:
+    """SQLite 保存的内容索引
+
+    files 表以路径为键，记录文件建立索引时的大小、修改时间（纳秒）和三元组过滤器，
+    过大而未建立索引的文件过滤器为 NULL。与 RunManifest 相同，连接允许跨线程使用，
+    所有数据库操作和计数都在锁内进行（并行处理时由派发线程查询，主线程作废记录）。
+    """
+    def __init__(self, db_path):
+        import sqlite3
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS files "
+                          "(path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, grams BLOB)")
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if row is None or row[0] != str(INDEX_VERSION):
+            self.conn.execute("DELETE FROM files")
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (str(INDEX_VERSION),))
+        self.conn.commit()
+        self._pending = 0
+        self.indexed = 0  # 本次打开后新建立或更新索引的文件数
+
+    @staticmethod
+    def _key(file_path):
+        return os.path.abspath(file_path)
+
+    def grams(self, file_path):
+        """文件当前内容的三元组过滤器，文件过大未建立索引时返回 None；读取失败时抛出 OSError
+
+        文件自上次建立索引后大小和修改时间都没有变化时直接返回记录，否则读取文件并
+        更新记录。记录的是读取之前的文件状态，读取期间文件被修改时下次会重新索引。
+        """
+        stat = os.stat(file_path)
+        key = self._key(file_path)
+        with self._lock:
+            row = self.conn.execute("SELECT size, mtime_ns, grams FROM files WHERE path = ?",
+                                    (key,)).fetchone()
+        if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return row[2]
+
+        bitmap = None
+        if stat.st_size <= MAX_INDEX_SIZE:
+            with open(file_path, 'rb') as f:
+                bitmap = build_filter(file_grams(f.read()))
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                              (key, stat.st_size, stat.st_mtime_ns, bitmap))
+            self.indexed += 1
+            self._pending += 1
+            full = self._pending >= COMMIT_INTERVAL
+        if full:
+            self.flush()
+        return bitmap
+
+    def may_contain(self, file_path, query):
+        """文件是否可能含有查询中的任一必需字面量；无法读取的文件交给替换阶段报告错误"""
+        try:
+            bitmap = self.grams(file_path)
+        except OSError:
+            return True
+        return bitmap is None or query.may_contain(bitmap)
+
+    def invalidate(self, file_path):
+        """文件已被改写，删除它的记录"""
+        with self._lock:
+            self.conn.execute("DELETE FROM files WHERE path = ?", (self._key(file_path),))
+            self._pending += 1
+            full = self._pending >= COMMIT_INTERVAL
+        if full:
+            self.flush()
+
+    def flush(self):
+        """提交尚未写入的记录"""
+        with self._lock:
+            self.conn.commit()
+            self._pending = 0
+
+    def close(self):
+        """提交并关闭索引"""
+        self.flush()
+        self.conn.close()
@@ -0,0 +1,380 @@
+"""分布式任务：协调者把目录扫描得到的文件分批写入共享的任务数据库，多台机器上的工作者领取批次并处理
+
+任务数据库是放在共享存储（各机器都能访问的挂载目录）上的 SQLite 文件，不需要
+额外的服务：meta 表保存规则、规则模式、编码等所有工作者必须一致的引擎设置和
+目标根目录；batches 表每行一批文件（相对根目录的路径）；results 表记录每个文件
+的处理结果，失败原因由协调者（或 --job-status）统一汇总报告。
+
+工作者领取批次时取得租约，处理期间由后台线程定期续约；工作者崩溃或失联后租约
+过期，批次由其他工作者重新领取，已有结果的文件不再处理。修改了文件的结果在写回
+后立即提交，重试时不会重复替换（只有崩溃时正在写回的文件可能被再处理一次）；
+没有修改的文件在批次结束时一并提交。同一批次领取 MAX_ATTEMPTS 次仍未完成时，
+其中还没有结果的文件记为失败。
+
+租约按各机器的系统时间比较，各机器的时钟需要同步；共享存储需要支持 SQLite 的
+文件锁（数据库使用默认的回滚日志，不使用 WAL）。sqlite3 在打开任务数据库时才导入。
+"""
+import os
+import json
+import time
+import threading
+import contextlib
+
+from .engine import ReplaceEngine, JobResult
+from .rules import RuleSet
+
+# 任务数据库格式版本
+JOB_VERSION = 1
+# 每批文件数
+DEFAULT_BATCH_SIZE = 200
+# 租约秒数：工作者失联这么久之后，它的批次可以被重新领取
+DEFAULT_LEASE = 120.0
+# 同一批次最多领取的次数
+MAX_ATTEMPTS = 3
+# 没有可领取的批次时等待的秒数；协调者按此间隔检查进度
+POLL_INTERVAL = 2.0
+# 由协调者决定、所有工作者必须一致的引擎设置
+SHARED_OPTIONS = ('read_encoding', 'write_encoding', 'stream_threshold', 'prefilter', 'regex_timeout',
+                  'bytes_mode')
+
+
+def _no_log(message):
+    """默认的日志回调：丢弃消息"""
+
+
+def worker_name():
+    """工作者标识：主机名和进程号"""
+    import socket
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobQueue:
+    """SQLite 保存的分布式任务
+
+    batches 表的 state 为 pending（等待领取）、leased（已被 worker 领取，租约到
+    lease_until 为止）、done（完成）或 failed（领取次数用完）。连接允许跨线程使用
+    （续约线程），所有数据库操作都在锁内进行；多条语句的修改在 BEGIN IMMEDIATE
+    事务中完成，多个工作者同时领取时同一批次只会被一个取得。
+    """
+    def __init__(self, db_path, create=False):
+        import sqlite3
+        if create:
+            if os.path.exists(db_path):
+                raise ValueError(f"任务数据库已存在（每个任务使用新的数据库文件）: {db_path}")
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        elif not os.path.isfile(db_path):
+            raise ValueError(f"任务数据库不存在: {db_path}")
+        self.db_path = db_path
+        # 自动提交模式：单条语句立即提交，多条语句的修改显式开启事务
+        self.conn = sqlite3.connect(db_path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        if create:
+            with self._transaction():
+                self.conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+                self.conn.execute("CREATE TABLE batches (id INTEGER PRIMARY KEY, state TEXT, worker TEXT, "
+                                  "lease_until REAL, attempts INTEGER, size INTEGER, files TEXT)")
+                self.conn.execute("CREATE INDEX batches_state ON batches (state)")
+                self.conn.execute("CREATE TABLE results (path TEXT PRIMARY KEY, batch INTEGER, worker TEXT, "
+                                  "replacements INTEGER, skipped INTEGER, error TEXT)")
+                self.conn.execute("CREATE INDEX results_batch ON results (batch)")
+                self.conn.execute("INSERT INTO meta VALUES ('version', ?)", (str(JOB_VERSION),))
+        else:
+            with self._lock:
+                row = self.conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            if row is None or row[0] != str(JOB_VERSION):
+                raise ValueError(f"不是本版本创建的任务数据库: {db_path}")
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """在锁内执行一个写事务，出错时回滚"""
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def _meta(self, key):
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def setup(self, rules, mode, options, root):
+        """保存任务的规则、引擎设置和目标根目录，标记为正在扫描"""
+        values = {
+            'rules': json.dumps(rules, ensure_ascii=False),
+            'mode': mode,
+            'options': json.dumps(options),
+            'root': os.path.abspath(root),
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'scanning': '1',
+        }
+        with self._transaction():
+            self.conn.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", values.items())
+
+    def settings(self):
+        """任务的 (规则字典列表, 规则模式, 引擎设置, 根目录)"""
+        return (json.loads(self._meta('rules')), self._meta('mode'), json.loads(self._meta('options')),
+                self._meta('root'))
+
+    def add_batch(self, files):
+        """写入一批文件（相对根目录的路径），写入后即可被领取"""
+        with self._lock:
+            self.conn.execute("INSERT INTO batches (state, attempts, size, files) VALUES ('pending', 0, ?, ?)",
+                              (len(files), json.dumps(files, ensure_ascii=False)))
+
+    def finish_scan(self):
+        """目录扫描完成，之后不再有新的批次"""
+        with self._lock:
+            self.conn.execute("UPDATE meta SET value = '0' WHERE key = 'scanning'")
+
+    def _fail_exhausted(self, now):
+        """领取次数用完且租约已过期的批次记为失败，其中还没有结果的文件记为失败（在事务中调用）"""
+        rows = self.conn.execute("SELECT id, worker, attempts, files FROM batches WHERE state = 'leased' "
+                                 "AND lease_until < ? AND attempts >= ?", (now, MAX_ATTEMPTS)).fetchall()
+        for batch_id, worker, attempts, files in rows:
+            error = f"领取 {attempts} 次都未能完成（最后由 {worker} 处理），工作者可能在处理这批文件时崩溃"
+            self.conn.executemany("INSERT OR IGNORE INTO results VALUES (?, ?, ?, 0, 0, ?)",
+                                  [(path, batch_id, worker, error) for path in json.loads(files)])
+            self.conn.execute("UPDATE batches SET state = 'failed', lease_until = NULL WHERE id = ?", (batch_id,))
+
+    def expire(self):
+        """处理领取次数用完的过期批次"""
+        with self._transaction():
+            self._fail_exhausted(time.time())
+
+    def claim(self, worker, lease):
+        """领取一个等待中或租约已过期的批次，返回 (批次编号, 还没有结果的文件列表)，没有时返回 None"""
+        now = time.time()
+        with self._transaction():
+            self._fail_exhausted(now)
+            row = self.conn.execute("SELECT id, files FROM batches WHERE state = 'pending' "
+                                    "OR (state = 'leased' AND lease_until < ?) ORDER BY id LIMIT 1",
+                                    (now,)).fetchone()
+            if row is None:
+                return None
+            batch_id, files = row
+            self.conn.execute("UPDATE batches SET state = 'leased', worker = ?, lease_until = ?, "
+                              "attempts = attempts + 1 WHERE id = ?", (worker, now + lease, batch_id))
+            done = {path for (path,) in self.conn.execute("SELECT path FROM results WHERE batch = ?",
+                                                           (batch_id,))}
+        return batch_id, [path for path in json.loads(files) if path not in done]
+
+    def renew(self, batch_id, worker, lease):
+        """延长租约，返回批次是否仍由 worker 持有"""
+        with self._lock:
+            cursor = self.conn.execute("UPDATE batches SET lease_until = ? WHERE id = ? AND worker = ? "
+                                       "AND state = 'leased'", (time.time() + lease, batch_id, worker))
+        return cursor.rowcount == 1
+
+    @staticmethod
+    def _row(batch_id, worker, path, result):
+        return path, batch_id, worker, result.replacements, int(result.skipped), result.error
+
+    def record(self, batch_id, worker, path, result):
+        """立即提交一个文件的处理结果"""
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                              self._row(batch_id, worker, path, result))
+
+    def finish(self, batch_id, worker, results, state='done'):
+        """提交批次中其余文件的结果 [(路径, FileResult)]，并把仍由 worker 持有的批次改为 state
+
+        state 为 pending 时释放批次（如工作者被停止），不计入领取次数。
+        """
+        with self._transaction():
+            self.conn.executemany("INSERT OR IGNORE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                                  [self._row(batch_id, worker, path, result) for path, result in results])
+            attempts = "attempts - 1" if state == 'pending' else "attempts"
+            self.conn.execute(f"UPDATE batches SET state = ?, lease_until = NULL, attempts = {attempts} "
+                              "WHERE id = ? AND worker = ? AND state = 'leased'", (state, batch_id, worker))
+
+    def progress(self):
+        """任务进度字典：各状态的批次数、文件总数、已有结果的文件数、失败数、替换总数和是否仍在扫描"""
+        with self._lock:
+            states = dict(self.conn.execute("SELECT state, COUNT(*) FROM batches GROUP BY state").fetchall())
+            files = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM batches").fetchone()[0]
+            finished, failed, replacements = self.conn.execute(
+                "SELECT COUNT(*), COUNT(error), COALESCE(SUM(replacements), 0) FROM results").fetchone()
+        return {
+            'batches': sum(states.values()),
+            'pending': states.get('pending', 0),
+            'leased': states.get('leased', 0),
+            'done': states.get('done', 0),
+            'failed_batches': states.get('failed', 0),
+            'files': files,
+            'finished': finished,
+            'failed': failed,
+            'replacements': replacements,
+            'scanning': self._meta('scanning') == '1',
+        }
+
+    def finished(self):
+        """扫描已完成且所有批次都已完成或失败"""
+        progress = self.progress()
+        return not progress['scanning'] and not progress['pending'] and not progress['leased']
+
+    def report(self):
+        """汇总所有已有结果的文件，返回 JobResult（失败文件为完整路径，按路径排序）"""
+        root = self._meta('root')
+        job = JobResult()
+        with self._lock:
+            success, skipped = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(skipped), 0) FROM results WHERE error IS NULL").fetchone()
+            failed = self.conn.execute("SELECT path, error FROM results WHERE error IS NOT NULL "
+                                       "ORDER BY path").fetchall()
+        job.success_count = success
+        job.skipped_count = skipped
+        job.failed_count = len(failed)
+        job.failed_files = [(os.path.join(root, path), error) for path, error in failed]
+        return job
+
+    def close(self):
+        self.conn.close()
+
+
+def enqueue(queue, file_list, root, batch_size=DEFAULT_BATCH_SIZE):
+    """把文件（可以是边扫描边产出的迭代器）按 batch_size 个一批写入任务，返回文件总数
+
+    每写入一批，工作者即可领取，不必等待扫描完成。
+    """
+    batch = []
+    count = 0
+    for file_path in file_list:
+        batch.append(os.path.relpath(file_path, root))
+        if len(batch) >= batch_size:
+            queue.add_batch(batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        queue.add_batch(batch)
+        count += len(batch)
+    queue.finish_scan()
+    return count
+
+
+def wait_for_job(queue, log=None, interval=POLL_INTERVAL, stop_event=None):
+    """等待任务全部完成，期间输出进度并处理领取次数用完的过期批次；返回是否已完成"""
+    log = log or _no_log
+    last = None
+    while stop_event is None or not stop_event.is_set():
+        queue.expire()
+        progress = queue.progress()
+        if not progress['scanning'] and not progress['pending'] and not progress['leased']:
+            return True
+        state = (progress['finished'], progress['leased'], progress['batches'])
+        if state != last:
+            log(f"进度: {progress['finished']}/{progress['files']} 个文件已处理（失败 {progress['failed']} 个），"
+                f"{progress['leased']} 批处理中，{progress['pending']} 批等待领取")
+            last = state
+        if stop_event is not None:
+            stop_event.wait(interval)
+        else:
+            time.sleep(interval)
+    return False
+
+
+class _Lease(threading.Thread):
+    """续约线程：处理批次期间每隔租约的三分之一延长一次租约
+
+    租约已被其他工作者接管（本工作者失联过久）或 stop_event 被设置时设置 cancel，
+    由引擎在两个文件之间停止这一批。
+    """
+    def __init__(self, queue, batch_id, worker, lease, stop_event=None):
+        super().__init__(name='adrts-lease', daemon=True)
+        self.queue = queue
+        self.batch_id = batch_id
+        self.worker = worker
+        self.lease = lease
+        self.stop_event = stop_event
+        self.cancel = threading.Event()
+        self.lost = False
+        self._done = threading.Event()
+
+    def run(self):
+        renew_at = time.monotonic() + self.lease / 3
+        while not self._done.wait(0.5):
+            if self.stop_event is not None and self.stop_event.is_set():
+                self.cancel.set()
+            if time.monotonic() < renew_at:
+                continue
+            try:
+                owned = self.queue.renew(self.batch_id, self.worker, self.lease)
+            except Exception:
+                # 数据库暂时被锁住等，下一次再试
+                continue
+            if not owned:
+                self.lost = True
+                self.cancel.set()
+                return
+            renew_at = time.monotonic() + self.lease / 3
+
+    def finish(self):
+        self._done.set()
+        self.join()
+
+
+def run_batch(queue, engine, worker, batch_id, files, root, lease=DEFAULT_LEASE, workers=1, stop_event=None):
+    """处理一个已领取的批次并提交结果，返回这批文件的 JobResult"""
+    paths = {os.path.join(root, path): path for path in files}
+    quiet = []  # 没有修改文件的结果，批次结束时一并提交
+
+    def on_result(result):
+        path = paths[result.path]
+        if result.replacements:
+            queue.record(batch_id, worker, path, result)
+        else:
+            quiet.append((path, result))
+
+    keeper = _Lease(queue, batch_id, worker, lease, stop_event)
+    keeper.start()
+    try:
+        job = engine.run(list(paths), workers=workers, cancel_event=keeper.cancel, on_result=on_result)
+    finally:
+        keeper.finish()
+    if keeper.lost:
+        engine.log(f"警告: 批次 {batch_id} 的租约已过期并被其他工作者接管，停止处理这一批")
+    queue.finish(batch_id, worker, quiet, 'pending' if job.cancelled else 'done')
+    return job
+
+
+def run_worker(queue, log=None, workers=1, lease=DEFAULT_LEASE, root=None, stop_event=None, **engine_options):
+    """领取并处理任务中的批次，直到任务全部完成或 stop_event 被设置，返回本工作者的 JobResult
+
+    引擎使用任务中保存的规则和设置创建（规则只编译一次），engine_options 为只影响
+    本机的设置（如 io_threads、io_budget、backup）。root 为本机上目标根目录的路径，
+    为 None 时使用协调者记录的路径（各机器挂载位置相同时）。没有可领取的批次但
+    还有其他工作者在处理时继续等待，以便接管租约过期的批次。规则无效时抛出 RuleError。
+    """
+    log = log or _no_log
+    rules, mode, options, job_root = queue.settings()
+    root = root or job_root
+    engine = ReplaceEngine(RuleSet(rules, mode), log=log, **options, **engine_options)
+    worker = worker_name()
+    total = JobResult()
+    total.profile = engine.profile
+    log(f"工作者 {worker} 开始处理任务: {root}")
+    try:
+        while stop_event is None or not stop_event.is_set():
+            claimed = queue.claim(worker, lease)
+            if claimed is None:
+                if queue.finished():
+                    break
+                if stop_event is not None:
+                    stop_event.wait(POLL_INTERVAL)
+                else:
+                    time.sleep(POLL_INTERVAL)
+                continue
+            batch_id, files = claimed
+            log(f"\n领取批次 {batch_id}: {len(files)} 个文件")
+            job = run_batch(queue, engine, worker, batch_id, files, root, lease, workers, stop_event)
+            total.merge(job)
+            if job.cancelled:
+                total.cancelled = True
+    finally:
+        engine.cleanup()
+    return total
@@ -0,0 +1,170 @@
+"""编码检测：文件只读取一次，在内存中按启发式顺序尝试候选编码"""
+import re
+import codecs
+import functools
+
+# 可用的编码器列表（try-all 模式的候选编码及其默认优先顺序）
+AVAILABLE_ENCODINGS = [
+    'utf-8', 'utf-8-sig', 'gbk', 'gb2312', 'latin-1', 'ascii',
+    'iso-8859-1', 'iso-8859-2', 'iso-8859-3', 'iso-8859-4',
+    'iso-8859-5', 'iso-8859-6', 'iso-8859-7', 'iso-8859-8',
+    'iso-8859-9', 'iso-8859-10', 'iso-8859-11', 'iso-8859-13',
+    'iso-8859-14', 'iso-8859-15', 'iso-8859-16',
+    'windows-1250', 'windows-1251', 'windows-1252', 'windows-1253',
+    'windows-1254', 'windows-1255', 'windows-1256', 'windows-1257',
+    'windows-1258'
+]
+
+# 先用前缀样本快速排除候选编码，再对整个文件确认
+SAMPLE_SIZE = 64 * 1024
+
+# GBK 双字节字符中首尾字节都在 0xA1-0xFE（GB2312 汉字区）的比例超过此值时视为中文文本
+GBK_PAIR_RATIO = 0.8
+
+# BOM 与对应编码，这些编码解码时会去掉 BOM（UTF-32 LE 的 BOM 以 UTF-16 LE 的 BOM 开头，需先检查）
+_BOMS = [
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+# 带 BOM 的文件可能使用的编码（按字节形式列出，供预筛选编码查找内容）
+BOM_ENCODINGS = ['utf-8', 'utf-16-le', 'utf-16-be', 'utf-32-le', 'utf-32-be']
+
+
+# 中文双字节编码，样本不像中文时排到其他编码之后
+_GBK_CODECS = ('gbk', 'gb2312', 'gb18030')
+
+# GBK 双字节字符：首字节 0x81-0xFE 加任意尾字节（从左到右不重叠，与解码时的对齐一致）
+_GBK_PAIR = re.compile(rb'[\x81-\xfe].', re.DOTALL)
+
+
+@functools.lru_cache(maxsize=None)
+def _codec_name(encoding):
+    """编码的规范名称，用于去重（如 latin-1 与 iso-8859-1）"""
+    try:
+        return codecs.lookup(encoding).name
+    except LookupError:
+        return encoding
+
+
+@functools.lru_cache(maxsize=None)
+def _decodes_every_byte(encoding):
+    """单字节编码是否能解码任意字节（如 latin-1），此后的候选编码不会被尝试到"""
+    try:
+        bytes(range(256)).decode(encoding)
+        return True
+    except (UnicodeDecodeError, LookupError):
+        return False
+
+
+def detect_bom(data):
+    """根据 BOM 判断编码，没有 BOM 时返回 None"""
+    for bom, encoding in _BOMS:
+        if data.startswith(bom):
+            return encoding
+    return None
+
+
+def sample_decodes(data, encoding):
+    """前缀样本能否用该编码解码（样本末尾被截断的多字节字符不算错误）"""
+    try:
+        codecs.getincrementaldecoder(encoding)().decode(data[:SAMPLE_SIZE], final=len(data) <= SAMPLE_SIZE)
+        return True
+    except (UnicodeDecodeError, LookupError):
+        return False
+
+
+def looks_like_gbk(data):
+    """根据双字节统计判断是否像 GBK 中文文本
+
+    西文单字节编码中的重音字母后面通常紧跟 ASCII 字母，同样能被 GBK 解码；
+    真正的中文文本里绝大多数双字节字符的两个字节都在 0xA1-0xFE 之间。
+    """
+    pairs = _GBK_PAIR.findall(data[:SAMPLE_SIZE])
+    if not pairs:
+        return False
+    hanzi = sum(1 for pair in pairs if pair[0] >= 0xA1 and pair[1] >= 0xA1)
+    return hanzi >= len(pairs) * GBK_PAIR_RATIO
+
+
+def rank_encodings(data, encodings):
+    """按启发式为候选编码排序
+
+    有 UTF-16/UTF-32 的 BOM 时对应编码排在最前；UTF-8 的 BOM 不提前，按配置顺序由
+    utf-8 解码为 \\ufeff 并随内容写回，输出与逐个尝试编码时相同。其余保持配置顺序，
+    但样本不像中文时把 GBK 类编码移到其他编码之后、第一个能解码任意字节的编码
+    （如 latin-1）之前：开头全是 ASCII 或繁体字较多的 GBK 文件仍会用 GBK 解码。
+    能解码任意字节的编码之后的候选永远不会被用到，直接去掉。
+    """
+    candidates = []
+    bom_encoding = detect_bom(data)
+    if bom_encoding and bom_encoding != 'utf-8-sig':
+        candidates.append(bom_encoding)
+
+    gbk_like = looks_like_gbk(data)
+    deferred = []
+    for encoding in encodings:
+        if not gbk_like and _codec_name(encoding) in _GBK_CODECS:
+            deferred.append(encoding)
+            continue
+        if deferred and _decodes_every_byte(encoding):
+            candidates.extend(deferred)
+            deferred = []
+        candidates.append(encoding)
+    candidates.extend(deferred)
+
+    ranked = []
+    seen = set()
+    for encoding in candidates:
+        name = _codec_name(encoding)
+        if name in seen:
+            continue
+        seen.add(name)
+        ranked.append(encoding)
+        if _decodes_every_byte(encoding):
+            break
+    return ranked
+
+
+def decode_bytes(data, encodings):
+    """依次尝试候选编码解码字节，返回 (内容, 编码)；全部失败时抛出异常
+
+    先用前缀样本排除明显不符的编码，只对通过的编码做完整解码。
+    """
+    for encoding in rank_encodings(data, encodings):
+        if not sample_decodes(data, encoding):
+            continue
+        try:
+            return data.decode(encoding), encoding
+        except UnicodeDecodeError:
+            continue
+    raise Exception("无法使用任何可用的编码器读取文件")
+
+
+def detect_encoding_from_bytes(data):
+    """根据 BOM、UTF-8 合法性和 GBK 双字节统计推断编码，默认 utf-8"""
+    bom_encoding = detect_bom(data)
+    if bom_encoding:
+        return bom_encoding
+    if sample_decodes(data, 'utf-8'):
+        return 'utf-8'
+    if looks_like_gbk(data) and sample_decodes(data, 'gbk'):
+        return 'gbk'
+    return 'utf-8'
+
+
+def detect_encoding(file_path):
+    """检测文件编码（只读取前缀样本）"""
+    with open(file_path, 'rb') as f:
+        # 多读一个字节，样本末尾被截断的多字节字符不会被误判为解码错误
+        return detect_encoding_from_bytes(f.read(SAMPLE_SIZE + 1))
+
+
+def translate_newlines(content):
+    """与文本模式读取一致，把 \\r\\n 和 \\r 统一为 \\n"""
+    if '\r' in content:
+        content = content.replace('\r\n', '\n').replace('\r', '\n')
+    return content
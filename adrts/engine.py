@@ -0,0 +1,748 @@
+"""替换引擎：文件解码、规则替换与写回，不依赖 Tk，可在无界面环境中使用"""
+import os
+import json
+import mmap
+import codecs
+import threading
+
+from .encoding import (AVAILABLE_ENCODINGS, BOM_ENCODINGS, SAMPLE_SIZE, _codec_name, decode_bytes,
+                       detect_encoding, detect_encoding_from_bytes, rank_encodings,
+                       sample_decodes, translate_newlines)
+from .bytesmode import ByteRuleSet, ascii_compatible, is_ascii, is_utf8
+from .fileio import AtomicFile, encode_text, write_text_atomic, write_bytes_atomic
+from .guard import RegexGuard, can_interrupt, is_regex_step, timeout_supported
+from .manifest import rule_fingerprint
+from .preview import FilePreview, Preview
+from .profiling import Profile, NO_PHASE
+from .rules import RuleSet
+from .streaming import DEFAULT_CHUNK_SIZE, is_streamable, stream_replace
+from .prefilter import build_prefilter
+from .contentindex import build_query
+from .pipeline import DEFAULT_IO_BUDGET, DEFAULT_IO_THREADS, run_pipelined
+
+# 不小于此大小（字节）的文件使用流式替换
+DEFAULT_STREAM_THRESHOLD = 64 * 1024 * 1024
+
+
+def _no_log(message):
+    """默认的日志回调：丢弃消息"""
+
+
+def is_jsonl(file_path):
+    """规则文件是否为每行一条规则的 JSON Lines 格式（按扩展名判断）"""
+    return file_path.lower().endswith('.jsonl')
+
+
+def load_rules(file_path):
+    """从规则文件加载替换规则
+
+    .jsonl 文件每行一条规则（JSON 对象），适合上万条规则的词表：可以逐行追加和比较，
+    加载时把所有行拼成一个数组交给 json 一次解析；其他文件为 GUI 保存的 JSON 数组。
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        if not is_jsonl(file_path):
+            return json.load(f)
+        # 只按 \n 分行：JSON 字符串中可能含有 \u2028 等 splitlines 也会拆开的字符
+        lines = [line for line in f.read().split('\n') if line.strip()]
+    try:
+        rules = json.loads('[' + ','.join(lines) + ']')
+    except ValueError:
+        rules = None
+    if rules is None or not all(isinstance(rule, dict) for rule in rules):
+        # 逐行解析，指出出错的行
+        rules = []
+        for number, line in enumerate(lines, 1):
+            try:
+                rule = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"第 {number} 条规则格式错误 - {str(e)}")
+            if not isinstance(rule, dict):
+                raise ValueError(f"第 {number} 条规则不是 JSON 对象")
+            rules.append(rule)
+    return rules
+
+
+def save_rules(rules, file_path):
+    """保存替换规则到 JSON 文件；.jsonl 文件每行写入一条规则"""
+    with open(file_path, 'w', encoding='utf-8') as f:
+        if is_jsonl(file_path):
+            for rule in rules:
+                f.write(json.dumps(rule, ensure_ascii=False))
+                f.write('\n')
+        else:
+            json.dump(rules, f, ensure_ascii=False, indent=4)
+
+
+class FileResult:
+    """单个文件的处理结果，可在进程间传递"""
+    __slots__ = ('path', 'replacements', 'encoding', 'error', 'skipped', 'messages', 'preview', 'profile',
+                 'output', 'backup')
+
+    def __init__(self, path):
+        self.path = path
+        self.replacements = 0
+        self.skipped = False  # 预筛选判定不可能匹配，未读取内容
+        self.encoding = None  # 实际用于读取的编码
+        self.error = None  # 失败原因，成功时为 None
+        self.messages = None  # 工作进程中产生的日志消息
+        self.preview = None  # 预览模式下记录的 FilePreview
+        self.profile = None  # 工作进程中该文件的性能统计
+        self.output = None  # 流水线运行时等待写入线程写回的字节
+        self.backup = None  # 写回前保存的原文件的备份记录
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class JobResult:
+    """一次替换任务的汇总结果
+
+    并行处理时，进程池的派发线程在消费文件迭代器时汇总增量运行跳过和索引排除的
+    文件，主线程同时汇总处理结果，因此计数的修改都在锁内进行。
+    """
+    def __init__(self):
+        self.success_count = 0
+        self.failed_count = 0
+        self.failed_files = []  # (文件路径, 错误原因)
+        self.skipped_count = 0  # 成功的文件中被预筛选跳过的数量
+        self.unchanged_count = 0  # 成功的文件中自上次运行后未变化、未打开的数量
+        self.excluded_count = 0  # 成功的文件中被内容索引排除、未打开的数量
+        self.cancelled = False  # 任务是否被中途取消
+        self.preview = None  # 预览模式下汇总的 Preview
+        self.profile = None  # 开启性能统计时的 Profile
+        self._lock = threading.Lock()
+
+    def add(self, result):
+        """汇总单个文件的处理结果"""
+        with self._lock:
+            if result.ok:
+                self.success_count += 1
+                if result.skipped:
+                    self.skipped_count += 1
+                if self.preview is not None and result.preview is not None:
+                    self.preview.add(result.preview)
+            else:
+                self.failed_count += 1
+                self.failed_files.append((result.path, result.error))
+
+    def merge(self, other):
+        """汇总另一次任务的结果（如监视模式中的各批文件）；预览、性能统计和取消状态不合并"""
+        with self._lock:
+            self.success_count += other.success_count
+            self.failed_count += other.failed_count
+            self.failed_files.extend(other.failed_files)
+            self.skipped_count += other.skipped_count
+            self.unchanged_count += other.unchanged_count
+            self.excluded_count += other.excluded_count
+
+    def add_unchanged(self, count):
+        """汇总增量运行中未变化而跳过的文件"""
+        with self._lock:
+            self.success_count += count
+            self.unchanged_count += count
+
+    def add_excluded(self, count):
+        """汇总内容索引排除的文件"""
+        with self._lock:
+            self.success_count += count
+            self.excluded_count += count
+
+    def summary(self):
+        """汇总说明，如“成功 10 个，失败 1 个（预筛选跳过 8 个）”"""
+        text = f"成功 {self.success_count} 个，失败 {self.failed_count} 个"
+        notes = []
+        if self.unchanged_count:
+            notes.append(f"未变化跳过 {self.unchanged_count} 个")
+        if self.excluded_count:
+            notes.append(f"索引排除 {self.excluded_count} 个")
+        if self.skipped_count:
+            notes.append(f"预筛选跳过 {self.skipped_count} 个")
+        if notes:
+            text += "（" + "，".join(notes) + "）"
+        return text
+
+
+class ReplaceEngine:
+    """批量替换引擎
+
+    rules 为规则字典列表（alias/find/replace/regex）或已编译的 RuleSet，
+    规则在构造时统一编译校验，无效时抛出 RuleError；log 为接收日志消息的回调。
+    不小于 stream_threshold 字节的文件按 chunk_size 个字符分块流式替换，
+    stream_threshold 为 None 时始终整文件处理。prefilter 为 True 时，先在原始
+    字节中查找各规则必需的字面量，不可能匹配的文件不解码直接跳过。
+    manifest 为 RunManifest 时增量运行：自上次成功处理后未变化的文件不打开，
+    每个文件的结果在主进程中记入清单。dry_run 为 True 时只预览：记录每个文件
+    的替换位置（JobResult.preview），不写回任何文件；预览总是整文件读取。
+    profile 为 True 时记录各阶段与各规则的耗时和命中（JobResult.profile），
+    统计在引擎的生命周期内累计；关闭时没有额外开销。
+    regex_timeout 为每个正则步骤在单个文件上的时间限制（秒），超时的文件记为
+    失败；限制只能打断主线程，因此在其他线程中调用 run() 时交给工作进程处理。
+    bytes_mode 为 True 且写入编码为 UTF-8 时，纯 ASCII 或合法 UTF-8 的文件（规则在
+    其上的字节语义与文本相同时）直接在原始字节上替换，不解码，结果与文本模式相同。
+    io_threads 为单进程流水线中读取、写入线程池各自的线程数（0 表示逐个文件依次
+    读取、替换、写回），io_budget 为已预读但尚未写完的文件共用的字节预算。
+    content_index 为 ContentIndex 时，先按索引排除不可能含有任何规则必需字面量的
+    文件（未变化的文件不打开）；被改写的文件在索引中作废，下次运行重新索引。
+    backup 为 BackupStore 时，每个文件被覆盖之前把原内容保存到备份仓库，每次 run()
+    的记录写入一个运行记录（run_id 为最近一次运行的编号），可据此撤销。
+    """
+    def __init__(self, rules, read_encoding="try-all", write_encoding="utf-8",
+                 temp_dir=None, log=None, stream_threshold=DEFAULT_STREAM_THRESHOLD,
+                 chunk_size=DEFAULT_CHUNK_SIZE, prefilter=True, manifest=None, dry_run=False,
+                 profile=False, regex_timeout=None, bytes_mode=True, io_threads=DEFAULT_IO_THREADS,
+                 io_budget=DEFAULT_IO_BUDGET, content_index=None, backup=None):
+        self.rule_set = rules if isinstance(rules, RuleSet) else RuleSet(rules)
+        self.read_encoding = read_encoding
+        self.write_encoding = write_encoding
+        self.available_encodings = AVAILABLE_ENCODINGS
+        self.log = log or _no_log
+        self.stream_threshold = stream_threshold
+        self.chunk_size = chunk_size
+        self.streamable = is_streamable(self.rule_set)
+        self.prefilter = build_prefilter(self.rule_set, self.candidate_encodings()) if prefilter else None
+        self.manifest = manifest
+        self.dry_run = dry_run
+        self.profile = Profile(self.rule_set) if profile else None
+        self.regex_timeout = regex_timeout
+        # 只有含正则步骤的规则集需要时间限制，看门狗在首次处理文件时创建
+        self.guarded = bool(regex_timeout) and any(is_regex_step(step) for step in self.rule_set.steps)
+        self._guard = None
+        self.byte_rules = None
+        if bytes_mode and _codec_name(write_encoding) == 'utf-8':
+            byte_rules = ByteRuleSet(self.rule_set)
+            if byte_rules.usable:
+                self.byte_rules = byte_rules
+        self.io_threads = io_threads
+        self.io_budget = io_budget
+        self.defer_writes = False  # 流水线运行时替换结果交给写入线程写回
+        self.content_index = content_index
+        self.index_query = build_query(self.rule_set, self.candidate_encodings()) if content_index else None
+        self.backup = backup
+        self.run_id = None  # 最近一次保存了备份的运行编号
+        self._journal = None
+        self._on_result = None
+
+        # 临时文件夹：未指定时在首次需要时创建，由 cleanup() 删除
+        # （写回文件不经过临时文件夹，临时文件直接创建在目标文件旁）
+        self.temp_dir = temp_dir
+        self._owns_temp_dir = False
+
+    def options(self):
+        """构造参数（规则集、临时文件夹、日志、清单和索引除外），用于在工作进程中创建相同配置的引擎"""
+        return {
+            'read_encoding': self.read_encoding,
+            'write_encoding': self.write_encoding,
+            'stream_threshold': self.stream_threshold,
+            'chunk_size': self.chunk_size,
+            'prefilter': self.prefilter is not None,
+            'dry_run': self.dry_run,
+            'profile': self.profile is not None,
+            'regex_timeout': self.regex_timeout,
+            'bytes_mode': self.byte_rules is not None,
+            'io_threads': self.io_threads,
+            'io_budget': self.io_budget,
+            'backup': self.backup,
+        }
+
+    def _phase(self, name):
+        """累计 name 阶段耗时的上下文管理器；统计关闭时为空操作"""
+        if self.profile is None:
+            return NO_PHASE
+        return self.profile.phase(name)
+
+    def fingerprint(self):
+        """规则集与编码设置的摘要，用于判断预览能否应用"""
+        return rule_fingerprint(self.rule_set, self.read_encoding, self.write_encoding)
+
+    def candidate_encodings(self):
+        """按读取编码设置，文件可能被解码使用的全部编码"""
+        if self.read_encoding == "try-all":
+            return self.available_encodings + BOM_ENCODINGS
+        if self.read_encoding == "auto-detect":
+            return ['gbk'] + BOM_ENCODINGS
+        return [self.read_encoding]
+
+    def read_content(self, file_path, encoding=None, data=None):
+        """一次读取文件的全部字节并在内存中解码，返回 (内容, 编码)
+
+        指定 encoding 时直接使用该编码（如预览时确定的编码），不再检测；
+        data 为已经读取的文件字节时不再读取。
+        """
+        if data is None:
+            with self._phase('read'), open(file_path, 'rb') as f:
+                data = f.read()
+            if self.profile is not None:
+                self.profile.bytes_read += len(data)
+
+        read_encoding = encoding or self.read_encoding
+        with self._phase('decode'):
+            content, read_encoding = self._decode(file_path, data, encoding, read_encoding)
+
+        # 与文本模式读取的换行处理保持一致
+        return translate_newlines(content), read_encoding
+
+    def _decode(self, file_path, data, encoding, read_encoding):
+        """按读取编码设置解码字节，返回 (内容, 编码)"""
+        try:
+            if encoding is not None:
+                content = data.decode(read_encoding)
+            elif read_encoding == "auto-detect":
+                read_encoding = detect_encoding_from_bytes(data)
+                self.log(f"自动检测编码: {read_encoding}")
+                content = data.decode(read_encoding)
+            elif read_encoding == "try-all":
+                # 候选编码按 BOM 和内容统计排序，只对通过样本检查的编码做完整解码
+                content, read_encoding = decode_bytes(data, self.available_encodings)
+                self.log(f"成功使用 {read_encoding} 编码读取文件")
+            else:
+                content = data.decode(read_encoding)
+        except UnicodeDecodeError as e:
+            error_msg = f"编码错误: 文件 {file_path} 无法使用 {read_encoding} 编码读取 - {str(e)}"
+            self.log(error_msg)
+            raise Exception(error_msg)
+        return content, read_encoding
+
+    def _get_temp_dir(self):
+        """获取临时文件夹，必要时创建"""
+        if self.temp_dir is None:
+            import tempfile
+            self.temp_dir = tempfile.mkdtemp()
+            self._owns_temp_dir = True
+        return self.temp_dir
+
+    def _get_guard(self):
+        """获取正则时间限制；不需要限制或当前线程无法被打断时返回 None"""
+        if self._guard is None and self.guarded and can_interrupt():
+            self._guard = RegexGuard(self.rule_set, self.regex_timeout)
+        return self._guard
+
+    def cleanup(self):
+        """删除引擎自行创建的临时文件夹，停止正则时间限制的看门狗"""
+        if self._guard is not None:
+            self._guard.close()
+            self._guard = None
+        if self._owns_temp_dir and os.path.exists(self.temp_dir):
+            import shutil
+            shutil.rmtree(self.temp_dir)
+            self.temp_dir = None
+            self._owns_temp_dir = False
+
+    def process_file(self, file_path, result=None, preview=None, data=None, stat=None):
+        """处理单个文件，返回 FileResult；出错时抛出异常
+
+        preview 为该文件此前的 FilePreview 时，若文件自预览后未变化，直接按
+        记录的位置替换（没有替换的文件不再打开）；文件已变化则重新查找。
+        data / stat 为流水线预读的文件字节和读取之前的文件状态。
+        """
+        if result is None:
+            result = FileResult(file_path)
+
+        if preview is not None and not preview.is_current():
+            self.log("文件在预览后已变化，重新查找")
+            preview = None
+        if preview is not None and not preview.replacements:
+            result.skipped = True
+            self.log("预览: 文件没有需要替换的内容，跳过")
+            return result
+
+        # 预览需要记录读取之前的文件状态
+        if self.dry_run and stat is None:
+            stat = os.stat(file_path)
+
+        # 原始字节中不含任何规则必需的字面量，无需解码
+        if preview is None and self.prefilter is not None and not self._may_match(file_path, data):
+            result.skipped = True
+            if self.dry_run:
+                result.preview = FilePreview.from_stat(file_path, stat)
+            self.log("预筛选: 文件中没有任何规则的查找内容，跳过")
+            return result
+
+        guard = self._get_guard()
+        if guard is not None:
+            guard.start_file()
+
+        # 大文件使用流式替换（预览和应用预览除外；预读的文件都小于阈值）
+        if (data is None and not self.dry_run and preview is None and self.stream_threshold is not None
+                and os.path.getsize(file_path) >= self.stream_threshold):
+            if self.streamable:
+                return self._process_streaming(file_path, result, guard)
+            self.log("规则中有未声明 max_span 的正则，匹配长度无界，使用整文件模式")
+
+        # 纯 ASCII / UTF-8 文件在原始字节上替换；内容不适用时沿用已读取的字节解码
+        if self.byte_rules is not None and not self.dry_run and preview is None:
+            handled, data = self._process_bytes(file_path, result, guard, data)
+            if handled:
+                return result
+
+        content, read_encoding = self.read_content(file_path, preview.encoding if preview else None, data)
+
+        try:
+            result.encoding = read_encoding
+
+            if self.dry_run:
+                # 只记录替换位置，不写回
+                with self._phase('replace'):
+                    content, step_edits, counts = self.rule_set.preview(content, guard)
+                if self.profile is not None:
+                    self.profile.add_counts(counts)
+                self.rule_set.log_counts(counts, self.log)
+                result.preview = FilePreview.from_stat(file_path, stat, read_encoding, step_edits)
+                result.replacements = result.preview.replacements
+                if result.replacements:
+                    self.log(f"预览: 共 {result.replacements} 处替换")
+                else:
+                    self.log("没有需要替换的内容")
+                return result
+
+            # 应用所有替换规则；有未变化的预览时按记录的位置替换，不再查找
+            if preview is not None:
+                with self._phase('replace'):
+                    content, counts = self.rule_set.replay(content, preview.steps)
+                if self.profile is not None:
+                    self.profile.add_counts(counts)
+                self.rule_set.log_counts(counts, self.log)
+                replacements = sum(counts)
+            else:
+                with self._phase('replace'):
+                    content, replacements = self.rule_set.apply(content, self.log, self.profile, guard)
+            result.replacements = replacements
+            modified = replacements > 0
+
+            # 如果内容被修改，则保存
+            if modified:
+                self.log(f"共执行 {replacements} 处替换")
+
+                if self.defer_writes:
+                    # 流水线运行：编码后交给写入线程写回
+                    with self._phase('write'):
+                        result.output = encode_text(content, self.write_encoding)
+                    return result
+
+                # 在原文件旁写入临时文件，落盘后原子替换原文件
+                with self._phase('write'):
+                    result.backup = write_text_atomic(file_path, content, self.write_encoding, self.backup)
+                if self.profile is not None:
+                    self.profile.bytes_written += os.path.getsize(file_path)
+                self.log(f"已保存修改到: {file_path}")
+            else:
+                self.log("没有需要替换的内容")
+
+            return result
+
+        except Exception as e:
+            # 记录其他错误
+            error_msg = f"处理文件 {file_path} 时出错 - {str(e)}"
+            self.log(error_msg)
+            raise
+
+    def _byte_encoding(self, buffer):
+        """判断内容能否按字节处理，返回 (读取编码, 需要去掉的 BOM 长度)；不能时读取编码为 None
+
+        读取编码与文本模式的选择一致：auto-detect 按样本检测；try-all 取排序后第一个
+        通过样本检查的候选编码。纯 ASCII 内容用任何兼容 ASCII 的编码解码结果都相同，
+        其他内容只有确认是完整合法的 UTF-8 时才与文本模式解码的结果相同。
+        """
+        sample = buffer[:SAMPLE_SIZE + 1]
+        if self.read_encoding == "auto-detect":
+            read_encoding = detect_encoding_from_bytes(sample)
+        elif self.read_encoding == "try-all":
+            read_encoding = next((encoding for encoding in rank_encodings(sample, self.available_encodings)
+                                  if sample_decodes(sample, encoding)), None)
+            if read_encoding is None:
+                return None, 0
+        else:
+            read_encoding = self.read_encoding
+
+        if is_ascii(buffer):
+            if self.byte_rules.ascii_ok and ascii_compatible(read_encoding):
+                return read_encoding, 0
+            return None, 0
+        name = _codec_name(read_encoding)
+        if not self.byte_rules.utf8_ok or name not in ('utf-8', 'utf-8-sig') or not is_utf8(buffer):
+            return None, 0
+        # utf-8-sig 解码时去掉 BOM；指定 utf-8 时 BOM 作为普通字符保留
+        bom = len(codecs.BOM_UTF8) if name == 'utf-8-sig' and buffer[:3] == codecs.BOM_UTF8 else 0
+        return read_encoding, bom
+
+    def _process_bytes(self, file_path, result, guard=None, data=None):
+        """字节模式处理单个文件，返回 (是否已处理, 已读取的字节)
+
+        内容不适用字节模式时不做任何处理，返回读取到的字节交给文本模式解码。
+        data 为流水线预读的字节时不再读取文件。
+        """
+        buffer = data
+        if buffer is None:
+            with self._phase('read'), open(file_path, 'rb') as f:
+                buffer = b''
+                if os.fstat(f.fileno()).st_size:
+                    try:
+                        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    except (OSError, ValueError):
+                        buffer = f.read()
+            if self.profile is not None:
+                self.profile.bytes_read += len(buffer)
+
+        mapped = buffer
+        try:
+            with self._phase('decode'):
+                read_encoding, bom = self._byte_encoding(buffer)
+            if read_encoding is None:
+                return False, buffer[:]
+
+            result.encoding = read_encoding
+            if self.read_encoding == "auto-detect":
+                self.log(f"自动检测编码: {read_encoding}")
+            elif self.read_encoding == "try-all":
+                self.log(f"成功使用 {read_encoding} 编码读取文件")
+
+            if bom:
+                buffer = buffer[bom:]
+            if buffer.find(b'\r') >= 0:
+                # 与文本模式读取的换行处理保持一致（UTF-8 多字节字符中不会出现 \r 和 \n）
+                buffer = buffer[:].replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+
+            try:
+                with self._phase('replace'):
+                    output, counts = self.byte_rules.apply(buffer, self.profile, guard)
+                self.rule_set.log_counts(counts, self.log)
+                result.replacements = sum(counts)
+
+                if result.replacements:
+                    self.log(f"共执行 {result.replacements} 处替换")
+                    if os.linesep != '\n':
+                        # 与文本模式写入一致，换行写为系统的换行符
+                        output = output.replace(b'\n', os.linesep.encode('ascii'))
+                    if self.defer_writes:
+                        result.output = output
+                        return True, None
+                    with self._phase('write'):
+                        result.backup = write_bytes_atomic(file_path, output, self.backup)
+                    if self.profile is not None:
+                        self.profile.bytes_written += len(output)
+                    self.log(f"已保存修改到: {file_path}")
+                else:
+                    self.log("没有需要替换的内容")
+            except Exception as e:
+                self.log(f"处理文件 {file_path} 时出错 - {str(e)}")
+                raise
+            return True, None
+        finally:
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+
+    def _stream_encoding(self, file_path):
+        """确定流式读取的编码；try-all 模式先用前缀样本排序和排除，再分块试读整个文件"""
+        if self.read_encoding == "auto-detect":
+            detected_encoding = detect_encoding(file_path)
+            self.log(f"自动检测编码: {detected_encoding}")
+            return detected_encoding
+        if self.read_encoding != "try-all":
+            return self.read_encoding
+
+        with open(file_path, 'rb') as f:
+            sample = f.read(SAMPLE_SIZE + 1)
+        for encoding in rank_encodings(sample, self.available_encodings):
+            if not sample_decodes(sample, encoding):
+                continue
+            try:
+                with open(file_path, 'r', encoding=encoding) as f:
+                    while f.read(self.chunk_size):
+                        pass
+                self.log(f"成功使用 {encoding} 编码读取文件")
+                return encoding
+            except UnicodeDecodeError:
+                continue
+        raise Exception("无法使用任何可用的编码器读取文件")
+
+    def _process_streaming(self, file_path, result, guard=None):
+        """分块流式处理大文件，内存占用与文件大小无关"""
+        read_encoding = self._stream_encoding(file_path)
+        result.encoding = read_encoding
+        self.log(f"流式处理大文件 (每块 {self.chunk_size} 字符)")
+        source_size = os.path.getsize(file_path) if self.profile is not None else 0
+
+        try:
+            # 没有替换或出错时不提交，临时文件被删除，原文件保持不变
+            with self._phase('stream'), open(file_path, 'r', encoding=read_encoding) as source, \
+                    AtomicFile(file_path, self.write_encoding, self.backup) as target:
+                counts = stream_replace(self.rule_set, source, target, self.chunk_size, guard)
+                if any(counts):
+                    target.commit()
+            result.backup = target.saved
+        except UnicodeDecodeError as e:
+            error_msg = f"编码错误: 文件 {file_path} 无法使用 {read_encoding} 编码读取 - {str(e)}"
+            self.log(error_msg)
+            raise Exception(error_msg)
+        except Exception as e:
+            error_msg = f"处理文件 {file_path} 时出错 - {str(e)}"
+            self.log(error_msg)
+            raise
+
+        if self.profile is not None:
+            self.profile.add_counts(counts)
+            self.profile.bytes_read += source_size
+            if any(counts):
+                self.profile.bytes_written += os.path.getsize(file_path)
+        self.rule_set.log_counts(counts, self.log)
+        result.replacements = sum(counts)
+        if result.replacements:
+            self.log(f"共执行 {result.replacements} 处替换")
+            self.log(f"已保存修改到: {file_path}")
+        else:
+            self.log("没有需要替换的内容")
+        return result
+
+    def _may_match(self, file_path, data=None):
+        """预筛选：文件中是否可能有匹配；data 为已读取的文件字节时不再读取"""
+        with self._phase('prefilter'):
+            if data is not None:
+                return self.prefilter.may_match_bytes(data)
+            return self.prefilter.may_match(file_path)
+
+    def run_one(self, file_path, preview=None, data=None, stat=None):
+        """处理单个文件并捕获错误，返回 FileResult（data / stat 见 process_file）"""
+        result = FileResult(file_path)
+        try:
+            self.log(f"\n处理文件: {file_path}")
+            self.process_file(file_path, result, preview, data, stat)
+        except Exception as e:
+            result.error = str(e)
+            self.log(f"错误: 处理文件时出错 - {result.error}")
+        return result
+
+    def collect_result(self, job, result):
+        """汇总单个文件的结果，增量运行时同时记入清单（预览不记入）"""
+        job.add(result)
+        if self.profile is not None:
+            if result.profile is not None:
+                self.profile.merge(result.profile)
+                result.profile = None
+            self.profile.add_file(result)
+        if self.manifest is not None and not self.dry_run:
+            self.manifest.record(result)
+        if self.content_index is not None and result.replacements and not self.dry_run:
+            self.content_index.invalidate(result.path)
+        if self._journal is not None and result.backup is not None:
+            self._journal.record(result.backup)
+            result.backup = None
+        if self._on_result is not None:
+            self._on_result(result)
+
+    def run(self, file_list, on_progress=None, workers=1, cancel_event=None, previews=None, on_result=None):
+        """处理文件列表，返回 JobResult
+
+        file_list 可以是列表，也可以是边扫描边产出路径的迭代器（此时文件总数未知）。
+        on_progress(已完成数, 总数) 在每个文件处理后调用，总数未知时为 None。
+        workers 大于 1 时把文件分片交给多个工作进程并行处理，汇总结果与串行模式一致；
+        单进程处理多个文件时，io_threads 大于 0 则在预读、替换、写回流水线中处理。
+        cancel_event（threading.Event 等）被设置后，在两个文件之间停止任务。
+        增量运行时未变化的文件和内容索引排除的文件不参与处理，进度按需要处理的文件计算。
+        previews 为此前预览得到的 Preview 时应用预览，未变化的文件复用记录的替换位置。
+        on_result(FileResult) 在每个文件的结果汇总后、在调用 run() 的线程中调用
+        （此时文件已经写回），增量运行跳过和索引排除的文件不调用。
+        """
+        job = JobResult()
+        job.profile = self.profile
+        if self.dry_run:
+            job.preview = Preview(self.fingerprint(), [rule.alias for rule in self.rule_set.rules])
+        total_files = len(file_list) if hasattr(file_list, '__len__') else None
+        if self.manifest is not None:
+            file_list = self.manifest.pending(file_list, lambda file_path: job.add_unchanged(1))
+            if total_files is not None:
+                file_list = list(file_list)
+                total_files = len(file_list)
+                self._log_unchanged(job)
+        if self.content_index is not None:
+            if self.index_query is None:
+                self.log("内容索引: 有规则无法确定必需的查找内容，或查找内容过短、过多，不使用索引")
+            else:
+                file_list = self._indexed(file_list, job)
+                if total_files is not None:
+                    file_list = list(file_list)
+                    total_files = len(file_list)
+                    self._log_excluded(job)
+
+        if self.backup is not None and not self.dry_run:
+            self._journal = self.backup.open_run()
+        self._on_result = on_result
+        try:
+            parallel = workers > 1 and (total_files is None or total_files > 1)
+            if self.guarded and not timeout_supported():
+                self.log("警告: 当前平台不支持正则超时保护，正则规则不受时间限制")
+            elif not parallel and self.guarded and not can_interrupt() and total_files != 0:
+                # 正则时间限制只能打断主线程，在后台线程中（如 GUI）交给一个工作进程处理
+                parallel, workers = True, 1
+            if parallel:
+                from .parallel import run_parallel
+                return run_parallel(self, file_list, workers, on_progress, cancel_event, job, total_files,
+                                    previews)
+            if self.io_threads > 0 and total_files != 1:
+                return run_pipelined(self, file_list, on_progress, cancel_event, job, total_files, previews)
+
+            for i, file_path in enumerate(file_list):
+                if cancel_event is not None and cancel_event.is_set():
+                    job.cancelled = True
+                    self.log("任务已取消")
+                    break
+
+                preview = previews.get(file_path) if previews is not None else None
+                self.collect_result(job, self.run_one(file_path, preview))
+
+                if on_progress is not None:
+                    on_progress(i + 1, total_files)
+
+            return job
+        finally:
+            self._on_result = None
+            if self.manifest is not None:
+                if total_files is None:
+                    self._log_unchanged(job)
+                self.manifest.flush()
+            if self.index_query is not None:
+                if total_files is None:
+                    self._log_excluded(job)
+                self.content_index.flush()
+            if self._journal is not None:
+                self._close_journal()
+
+    def _indexed(self, file_list, job):
+        """逐个产出内容索引判断可能匹配的文件，其余文件计为索引排除"""
+        for file_path in file_list:
+            with self._phase('index'):
+                candidate = self.content_index.may_contain(file_path, self.index_query)
+            if candidate:
+                yield file_path
+            else:
+                job.add_excluded(1)
+
+    def _log_excluded(self, job):
+        """记录本次更新索引的文件数和内容索引排除的文件数"""
+        if self.content_index.indexed:
+            self.log(f"内容索引: 更新了 {self.content_index.indexed} 个新增或已变化文件的索引")
+        if job.excluded_count:
+            self.log(f"内容索引: {job.excluded_count} 个文件不含任何规则的查找内容，跳过")
+
+    def _close_journal(self):
+        """结束本次运行的备份记录，有文件被修改时记录运行编号"""
+        journal, self._journal = self._journal, None
+        journal.close()
+        if journal.count:
+            self.run_id = journal.run_id
+            self.log(f"备份: 已保存 {journal.count} 个文件的原内容（其中 {journal.linked} 个通过硬链接保存），"
+                     f"运行编号 {journal.run_id}")
+
+    def _log_unchanged(self, job):
+        """记录增量运行中跳过的未变化文件数"""
+        if job.unchanged_count:
+            self.log(f"增量运行: {job.unchanged_count} 个文件自上次处理后未变化，跳过")
+
+def log_failed_files(failed_files, log):
+    """输出替换失败的文件列表"""
+    if not failed_files:
+        return
+    log("\n========== 替换失败的文件 ==========")
+    for file_path, error_msg in failed_files:
+        log(f"文件: {file_path}")
+        log(f"错误: {error_msg}")
+        log("-------------------------------")
@@ -0,0 +1,118 @@
+"""文件写回：在目标文件旁写临时文件，落盘后原子替换原文件
+
+shutil 和 tempfile 在第一次写回时才导入，没有需要写回的文件时不加载。
+"""
+import os
+
+# 写回过程中临时文件的后缀（进程中途退出时残留的文件可按此识别）
+TEMP_SUFFIX = '.adrts-tmp'
+
+
+def _copy_metadata(source, target):
+    """把原文件的权限、时间戳（以及可能时的属主）复制到新文件"""
+    import shutil
+    stat = os.stat(source)
+    shutil.copystat(source, target)
+    if hasattr(os, 'chown'):
+        try:
+            os.chown(target, stat.st_uid, stat.st_gid)
+        except OSError:
+            # 非特权用户无法改为其他属主，保持当前用户
+            pass
+
+
+def _fsync_directory(directory):
+    """把目录项的修改（rename）落盘；不支持打开目录的平台（Windows）直接跳过"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class AtomicFile:
+    """在目标文件旁写入的临时文本文件，commit() 时原子替换原文件
+
+    临时文件与目标位于同一目录（同一文件系统），内容 fsync 后用 os.replace
+    改名覆盖原文件，数据只写一次；任何时刻原文件要么是旧内容，要么是完整的新内容。
+    临时文件名唯一，多个进程同时写不同文件（包括同名文件）互不干扰。
+    未 commit 就离开 with 块（出错或无需写回）时删除临时文件，原文件保持不变。
+    符号链接会写回到其指向的文件。encoding 为 None 时以二进制方式写入字节。
+    backup 为 BackupStore 时，覆盖之前把原文件暂存到备份仓库，覆盖成功后保存，
+    备份记录存入 saved；无法备份时不覆盖原文件。
+    """
+    __slots__ = ('target', 'temp_path', 'file', 'committed', 'backup', 'saved')
+
+    def __init__(self, file_path, encoding, backup=None):
+        self.backup = backup
+        self.saved = None
+        self.target = os.path.realpath(file_path)
+        directory, name = os.path.split(self.target)
+        import tempfile
+        fd, self.temp_path = tempfile.mkstemp(prefix=f'.{name}.', suffix=TEMP_SUFFIX, dir=directory)
+        self.file = open(fd, 'w', encoding=encoding) if encoding is not None else open(fd, 'wb')
+        self.committed = False
+
+    def write(self, text):
+        return self.file.write(text)
+
+    def commit(self):
+        """内容落盘后替换原文件，保留原文件的权限和时间戳"""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        _copy_metadata(self.target, self.temp_path)
+        staged = self.backup.stage(self.target) if self.backup is not None else None
+        try:
+            os.replace(self.temp_path, self.target)
+        except BaseException:
+            if staged is not None:
+                staged.discard()
+            raise
+        self.committed = True
+        _fsync_directory(os.path.dirname(self.target))
+        if staged is not None:
+            self.saved = staged.store_object()
+
+    def discard(self):
+        """放弃写入，删除临时文件"""
+        self.file.close()
+        try:
+            os.remove(self.temp_path)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self.committed:
+            self.discard()
+
+
+def write_text_atomic(file_path, content, encoding, backup=None):
+    """把文本内容原子写回文件，返回备份记录（未备份时为 None）"""
+    with AtomicFile(file_path, encoding, backup) as f:
+        f.write(content)
+        f.commit()
+    return f.saved
+
+
+def encode_text(content, encoding):
+    """文本内容按文本方式写入时的字节：换行转换为系统的换行符后编码"""
+    if os.linesep != '\n':
+        content = content.replace('\n', os.linesep)
+    return content.encode(encoding)
+
+
+def write_bytes_atomic(file_path, data, backup=None):
+    """把字节内容原子写回文件，返回备份记录（未备份时为 None）"""
+    with AtomicFile(file_path, None, backup) as f:
+        f.write(data)
+        f.commit()
+    return f.saved
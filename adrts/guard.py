@@ -0,0 +1,392 @@
+"""正则超时保护：限制每条规则在单个文件上的运行时间，并静态检查容易灾难性回溯的正则
+
+正则引擎匹配时持有 GIL，普通的 Python 线程无法在匹配过程中运行，但引擎会
+定期检查信号。因此超时由操作系统的定时器发出信号：POSIX 上为 SIGALRM
+（setitimer），Windows 上由线程池定时器调用 PyErr_SetInterrupt 模拟 SIGINT，
+主线程的信号处理函数抛出 RegexTimeout。信号只在进程的主线程中处理，
+在其他线程中运行的任务需要交给工作进程处理。
+"""
+import re
+import sys
+import time
+import signal
+import threading
+
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:  # Python 3.10 及更早
+    import sre_parse
+    import sre_constants
+
+from .multipattern import FusedRegex
+from .profiling import step_label
+
+# 默认的时间限制：每条规则在单个文件上最多运行的秒数
+DEFAULT_REGEX_TIMEOUT = 30
+
+# Windows 定时器方案只适用于 64 位进程（见 _WindowsTimer）；ctypes 在创建定时器时才导入
+_WINDOWS_TIMER = sys.platform == 'win32' and sys.maxsize > 2 ** 32
+
+
+class RegexTimeout(Exception):
+    """正则步骤在单个文件上超过了时间限制"""
+
+
+def is_regex_step(step):
+    """步骤是否执行正则匹配（字面量步骤的耗时是线性的，不需要限制）"""
+    return isinstance(step, FusedRegex) or getattr(step, 'regex', False)
+
+
+class _AlarmTimer:
+    """POSIX：用 setitimer 发出 SIGALRM"""
+    signum = signal.SIGALRM if hasattr(signal, 'SIGALRM') else None
+
+    def start(self, seconds):
+        signal.setitimer(signal.ITIMER_REAL, max(seconds, 0.001))
+
+    def cancel(self):
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+class _WindowsTimer:
+    """Windows：线程池定时器到期时直接调用 PyErr_SetInterrupt（无需 GIL），模拟 SIGINT
+
+    定时器回调的签名与 PyErr_SetInterrupt 不同，只有在多余参数由调用方清理的
+    64 位调用约定下才能这样使用。
+    """
+    signum = signal.SIGINT
+    WT_EXECUTEONLYONCE = 0x8
+
+    def __init__(self):
+        import ctypes
+        self.ctypes = ctypes
+        self.kernel32 = ctypes.windll.kernel32
+        self.callback = ctypes.cast(ctypes.pythonapi.PyErr_SetInterrupt, ctypes.c_void_p)
+        self.handle = None
+
+    def start(self, seconds):
+        self.cancel()
+        handle = self.ctypes.c_void_p()
+        if self.kernel32.CreateTimerQueueTimer(self.ctypes.byref(handle), None, self.callback, None,
+                                               max(1, int(seconds * 1000)), 0, self.WT_EXECUTEONLYONCE):
+            self.handle = handle
+
+    def cancel(self):
+        if self.handle is not None:
+            # 最后一个参数为 INVALID_HANDLE_VALUE：等待正在执行的回调结束
+            self.kernel32.DeleteTimerQueueTimer(None, self.handle, self.ctypes.c_void_p(-1))
+            self.handle = None
+
+
+def _make_timer():
+    """当前平台可用的定时器，不支持时返回 None"""
+    if hasattr(signal, 'setitimer'):
+        return _AlarmTimer()
+    if _WINDOWS_TIMER:
+        return _WindowsTimer()
+    return None
+
+
+def timeout_supported():
+    """当前平台能否强制中止超时的正则"""
+    return hasattr(signal, 'setitimer') or _WINDOWS_TIMER
+
+
+def can_interrupt():
+    """当前线程能否被超时信号打断（只有主线程处理信号）"""
+    return timeout_supported() and threading.current_thread() is threading.main_thread()
+
+
+class _NoLimit:
+    """不需要限制时使用的空上下文管理器"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NO_LIMIT = _NoLimit()
+
+
+class _StepLimit:
+    """一个步骤的一次运行，耗时累计到该步骤在当前文件上的用量"""
+    __slots__ = ('guard', 'index', 'step', 'start')
+
+    def __init__(self, guard, index, step):
+        self.guard = guard
+        self.index = index
+        self.step = step
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        self.guard._arm(self.start + self.guard.timeout - self.guard.used[self.index])
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # 超时信号可能恰好在解除计时的过程中到达，此时同样视为超时
+        while True:
+            try:
+                self.guard._disarm()
+                break
+            except RegexTimeout:
+                exc_type = RegexTimeout
+        self.guard.used[self.index] += time.monotonic() - self.start
+        if exc_type is RegexTimeout:
+            raise RegexTimeout(f"规则 {step_label(self.step)} 在此文件上运行超过 {self.guard.timeout:g} 秒，"
+                               f"已中止（正则可能存在灾难性回溯）") from None
+        return False
+
+
+class RegexGuard:
+    """正则步骤的时间限制
+
+    每个正则步骤在一个文件上的累计运行时间（流式处理时为各块之和）不超过
+    timeout 秒，超时后抛出 RegexTimeout。必须在主线程中创建，创建时接管定时器
+    信号的处理函数，close() 恢复原来的处理函数。Windows 上定时器信号为 SIGINT：
+    到达截止时间之前收到的 SIGINT 仍按原来的方式处理（Ctrl+C）。
+    """
+    def __init__(self, rule_set, timeout):
+        self.timeout = timeout
+        self.regex_steps = {id(step): i for i, step in enumerate(rule_set.steps) if is_regex_step(step)}
+        self.used = [0.0] * len(rule_set.steps)
+        self._timer = _make_timer()
+        self._deadline = None  # 当前（或刚超时的）步骤的截止时间
+        self._active = False
+        self._previous_handler = signal.signal(self._timer.signum, self._on_signal)
+
+    def start_file(self):
+        """开始处理一个新文件，清零各步骤的用量"""
+        self.used = [0.0] * len(self.used)
+
+    def limit(self, step):
+        """限制 step 一次运行的上下文管理器；非正则步骤不受限制"""
+        index = self.regex_steps.get(id(step))
+        if index is None:
+            return NO_LIMIT
+        return _StepLimit(self, index, step)
+
+    def _arm(self, deadline):
+        self._deadline = deadline
+        self._active = True
+        self._timer.start(deadline - time.monotonic())
+
+    def _disarm(self):
+        self._active = False  # 之后到达的定时器信号都被忽略
+        self._timer.cancel()
+        if self._deadline is not None and time.monotonic() < self._deadline:
+            # 定时器尚未到期就被取消，不会再有信号；否则保留截止时间，用来识别迟到的信号
+            self._deadline = None
+
+    def _on_signal(self, signum, frame):
+        """定时器信号处理函数：步骤运行中时转为超时，迟到的信号忽略"""
+        if self._deadline is not None and time.monotonic() >= self._deadline:
+            self._deadline = None
+            if self._active:
+                raise RegexTimeout()
+            return None
+        # 不是定时器发出的信号（Windows 上的 Ctrl+C）
+        if callable(self._previous_handler):
+            return self._previous_handler(signum, frame)
+        if self._previous_handler == signal.SIG_IGN:
+            return None
+        raise KeyboardInterrupt
+
+    def close(self):
+        """停止定时器并恢复原来的信号处理函数"""
+        self._active = False
+        self._timer.cancel()
+        signal.signal(self._timer.signum, self._previous_handler)
+
+
+# ---------- 静态检查 ----------
+
+_REPEATS = {sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT}
+_ANY = None  # 首字符集合未知或为任意字符
+_NOT_REPEAT = object()
+
+# 字符类别（\d \s \w 及其反义）对应的正则，以及互不相交的类别对
+_CATEGORIES = {
+    sre_constants.CATEGORY_DIGIT: re.compile(r'\d'),
+    sre_constants.CATEGORY_NOT_DIGIT: re.compile(r'\D'),
+    sre_constants.CATEGORY_SPACE: re.compile(r'\s'),
+    sre_constants.CATEGORY_NOT_SPACE: re.compile(r'\S'),
+    sre_constants.CATEGORY_WORD: re.compile(r'\w'),
+    sre_constants.CATEGORY_NOT_WORD: re.compile(r'\W'),
+}
+_DISJOINT_CATEGORIES = {frozenset(pair) for pair in [
+    (sre_constants.CATEGORY_DIGIT, sre_constants.CATEGORY_NOT_DIGIT),
+    (sre_constants.CATEGORY_SPACE, sre_constants.CATEGORY_NOT_SPACE),
+    (sre_constants.CATEGORY_WORD, sre_constants.CATEGORY_NOT_WORD),
+    (sre_constants.CATEGORY_DIGIT, sre_constants.CATEGORY_SPACE),
+    (sre_constants.CATEGORY_WORD, sre_constants.CATEGORY_SPACE),
+    (sre_constants.CATEGORY_DIGIT, sre_constants.CATEGORY_NOT_WORD),
+]}
+
+
+def _is_unbounded(av):
+    return av[1] == sre_constants.MAXREPEAT or av[1] > 100
+
+
+def _first_chars(items, flags):
+    """序列可能的首字符集合；无法确定时返回 _ANY"""
+    chars = set()
+    for op, av in items:
+        first = _item_first(op, av, flags)
+        if first is _ANY:
+            return _ANY
+        chars |= first
+        if not _nullable(op, av):
+            return chars
+    return chars
+
+
+def _item_first(op, av, flags):
+    if op is sre_constants.LITERAL:
+        if flags & re.IGNORECASE:
+            return {chr(av).lower(), chr(av).upper()}
+        return {chr(av)}
+    if op is sre_constants.IN:
+        # 集合元素为单个字符或字符类别
+        chars = set()
+        for kind, value in av:
+            if kind is sre_constants.LITERAL:
+                chars.add(chr(value))
+            elif kind is sre_constants.CATEGORY and value in _CATEGORIES:
+                chars.add(value)
+            elif kind is sre_constants.RANGE and value[1] - value[0] < 256:
+                chars.update(chr(c) for c in range(value[0], value[1] + 1))
+            else:
+                return _ANY
+        return chars
+    if op is sre_constants.SUBPATTERN:
+        return _first_chars(av[-1], flags)
+    if op is sre_constants.BRANCH:
+        chars = set()
+        for branch in av[1]:
+            first = _first_chars(branch, flags)
+            if first is _ANY:
+                return _ANY
+            chars |= first
+        return chars
+    if op in _REPEATS:
+        return _first_chars(av[2], flags)
+    if op in (sre_constants.AT, sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+        return set()
+    return _ANY
+
+
+def _nullable(op, av):
+    """项是否可以匹配空串"""
+    if op in _REPEATS:
+        return av[0] == 0 or all(_nullable(o, a) for o, a in av[2])
+    if op is sre_constants.SUBPATTERN:
+        return all(_nullable(o, a) for o, a in av[-1])
+    if op is sre_constants.BRANCH:
+        return any(all(_nullable(o, a) for o, a in branch) for branch in av[1])
+    return op in (sre_constants.AT, sre_constants.ASSERT, sre_constants.ASSERT_NOT)
+
+
+def _element_overlaps(x, y):
+    if isinstance(x, str) and isinstance(y, str):
+        return x == y
+    if isinstance(x, str):
+        return _CATEGORIES[y].match(x) is not None
+    if isinstance(y, str):
+        return _CATEGORIES[x].match(y) is not None
+    return x == y or frozenset((x, y)) not in _DISJOINT_CATEGORIES
+
+
+def _overlaps(a, b):
+    """两个首字符集合是否可能有共同的字符"""
+    if a is _ANY or b is _ANY:
+        return True
+    if a & b:
+        return True
+    return any(_element_overlaps(x, y) for x in a if not isinstance(x, str) for y in b) or \
+        any(_element_overlaps(x, y) for x in a if isinstance(x, str) for y in b if not isinstance(y, str))
+
+
+def _repetitive(items):
+    """序列是否只由量词项组成（可以为空的项除外）且含有无上限量词，即同一段文本有多种切分方式"""
+    found = False
+    for op, av in items:
+        if op in _REPEATS and _is_unbounded(av):
+            found = True
+        elif op is sre_constants.SUBPATTERN and _repetitive(av[-1]):
+            found = True
+        elif not _nullable(op, av):
+            return False
+    return found
+
+
+def _ambiguous_branch(items, flags):
+    """序列中是否有首字符重叠或可以为空的分支"""
+    for op, av in items:
+        if op is sre_constants.SUBPATTERN:
+            if _ambiguous_branch(av[-1], flags):
+                return True
+        elif op is sre_constants.BRANCH:
+            seen = set()
+            for branch in av[1]:
+                if not branch or all(_nullable(o, a) for o, a in branch):
+                    return True
+                first = _first_chars(branch, flags)
+                if _overlaps(first, seen):
+                    return True
+                seen |= first
+    return False
+
+
+def _scan(items, flags, reasons):
+    previous = _NOT_REPEAT  # 上一项若为无上限的重复，记录其首字符集合
+    for op, av in items:
+        current = _NOT_REPEAT
+        if op in _REPEATS:
+            body = av[2]
+            if _is_unbounded(av):
+                if _repetitive(body):
+                    reasons.add("嵌套的无上限量词（如 (a+)+），可能指数级回溯")
+                if _ambiguous_branch(body, flags):
+                    reasons.add("重复的分组中有可以匹配相同内容的分支（如 (a|ab)*），可能指数级回溯")
+                current = _first_chars(body, flags)
+                if previous is not _NOT_REPEAT and _overlaps(previous, current):
+                    reasons.add("相邻的无上限量词可以匹配相同字符（如 .*.*），匹配失败时回溯次数随长度多项式增长")
+            _scan(body, flags, reasons)
+        elif op is sre_constants.SUBPATTERN:
+            _scan(av[-1], flags, reasons)
+        elif op is sre_constants.BRANCH:
+            for branch in av[1]:
+                _scan(branch, flags, reasons)
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            _scan(av[1], flags, reasons)
+        previous = current
+
+
+def backtracking_risks(find_text):
+    """静态检查正则，返回可能导致灾难性回溯的原因列表；无法解析的正则返回空列表
+
+    只是启发式检查，可能误报，也不能发现所有问题；运行时由 RegexGuard 兜底。
+    """
+    try:
+        parsed = sre_parse.parse(find_text, re.DOTALL)
+    except (re.error, RecursionError, OverflowError):
+        return []
+    state = getattr(parsed, 'state', None) or parsed.pattern  # Python 3.11 起改名为 state
+    reasons = set()
+    _scan(list(parsed), state.flags, reasons)
+    return sorted(reasons)
+
+
+def rule_warnings(rules):
+    """检查规则字典列表中的正则规则，返回警告消息列表"""
+    warnings = []
+    for index, rule in enumerate(rules):
+        if not rule.get("regex", False) or not isinstance(rule.get("find"), str):
+            continue
+        alias = rule.get("alias") or f"规则{index + 1}"
+        for reason in backtracking_risks(rule["find"]):
+            warnings.append(f"警告: 规则 {alias} 的正则{reason}")
+    return warnings
@@ -0,0 +1,100 @@
+"""日志汇集：带级别的线程安全缓冲，界面定时批量取出显示，完整日志写入轮转文件"""
+import os
+import threading
+import collections
+
+# 与 logging 模块的级别数值相同；logging 在需要写日志文件时才导入
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+# 界面中可选的显示级别
+LEVEL_NAMES = {'INFO': INFO, 'WARNING': WARNING, 'ERROR': ERROR}
+
+# 日志文件轮转：单个文件的最大字节数与保留的旧文件数
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUP_COUNT = 3
+
+# 文件日志在内存中累积的条数，达到后（或遇到错误消息时）一次写入磁盘
+FILE_BUFFER_CAPACITY = 1000
+
+
+def level_of(message):
+    """按消息前缀推断级别：“错误”为 ERROR，“警告”为 WARNING，其余为 INFO"""
+    text = message.lstrip()
+    if text.startswith("错误"):
+        return ERROR
+    if text.startswith("警告"):
+        return WARNING
+    return INFO
+
+
+class LogSink:
+    """日志缓冲区
+
+    emit() 可在任意线程调用，只把消息追加到内存队列；界面线程定时调用 drain()
+    一次取出全部待显示的行。待显示队列最多保留 max_pending 行，界面来不及
+    显示时丢弃最旧的行（drain 返回丢弃数）。file_path 不为 None 时，所有级别
+    的消息都经缓冲写入按大小轮转的日志文件，不受显示级别和行数限制。
+    """
+    def __init__(self, file_path=None, max_pending=5000, display_level=INFO):
+        self.display_level = display_level
+        self._lock = threading.Lock()
+        self._pending = collections.deque(maxlen=max_pending)
+        self._dropped = 0
+        self.file_path = file_path
+        self._logger = None
+        self._handler = None
+        if file_path is not None:
+            directory = os.path.dirname(file_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            import logging
+            import logging.handlers
+            target = logging.handlers.RotatingFileHandler(
+                file_path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+            target.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+            self._handler = logging.handlers.MemoryHandler(
+                FILE_BUFFER_CAPACITY, flushLevel=ERROR, target=target)
+            # 每个日志汇集使用独立的 logger，不传递给根 logger
+            self._logger = logging.getLogger(f'adrts.sink.{id(self)}')
+            self._logger.setLevel(DEBUG)
+            self._logger.propagate = False
+            self._logger.addHandler(self._handler)
+
+    def emit(self, message, level=None):
+        """记录一条消息；未指定级别时按前缀推断"""
+        if level is None:
+            level = level_of(message)
+        if self._logger is not None:
+            self._logger.log(level, message)
+        if level >= self.display_level:
+            with self._lock:
+                if len(self._pending) == self._pending.maxlen:
+                    self._dropped += 1
+                self._pending.append(message)
+
+    def drain(self):
+        """取出全部待显示的行，返回 (行列表, 被丢弃的行数)"""
+        with self._lock:
+            lines = list(self._pending)
+            self._pending.clear()
+            dropped = self._dropped
+            self._dropped = 0
+        return lines, dropped
+
+    def flush(self):
+        """把缓冲的文件日志写入磁盘"""
+        if self._handler is not None:
+            self._handler.flush()
+
+    def close(self):
+        """写入剩余的文件日志并关闭文件"""
+        if self._handler is not None:
+            target = self._handler.target
+            self._logger.removeHandler(self._handler)
+            self._handler.close()  # MemoryHandler 关闭前写入缓冲内容，但不关闭目标
+            target.close()
+            self._handler = None
+            self._logger = None
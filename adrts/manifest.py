@@ -0,0 +1,127 @@
+"""增量运行清单：记录每个文件上次处理后的大小和修改时间，未变化的文件直接跳过
+
+sqlite3 和 hashlib 的加载较慢，在打开清单或计算摘要时才导入，不使用清单的运行不受影响。
+"""
+import os
+import json
+import threading
+
+# 每累计这么多条记录提交一次，中途取消或异常退出时已处理的文件不会丢失
+COMMIT_INTERVAL = 500
+
+
+def cache_dir():
+    """清单文件的默认存放目录（可用环境变量 ADRTS_CACHE_DIR 指定）"""
+    override = os.environ.get('ADRTS_CACHE_DIR')
+    if override:
+        return override
+    base = (os.environ.get('LOCALAPPDATA')
+            or os.environ.get('XDG_CACHE_HOME')
+            or os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(base, 'adrts')
+
+
+def default_manifest_path(root):
+    """目标根目录对应的清单文件路径，每个根目录一个清单"""
+    import hashlib
+    key = hashlib.sha1(os.path.abspath(root).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache_dir(), f'manifest-{key}.sqlite')
+
+
+def common_root(file_list):
+    """文件列表的公共父目录，用作多文件模式的清单根目录"""
+    return os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in file_list])
+
+
+def rule_fingerprint(rule_set, read_encoding, write_encoding):
+    """规则集和编码设置的摘要；任何一项变化都会使清单失效"""
+    import hashlib
+    data = {
+        'mode': rule_set.mode,
+        'rules': [[rule.find, rule.replace, rule.regex, rule.span] for rule in rule_set.rules],
+        'read_encoding': read_encoding,
+        'write_encoding': write_encoding,
+    }
+    text = json.dumps(data, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class RunManifest:
+    """SQLite 保存的运行清单
+
+    files 表以路径为键，记录文件在上次用同一规则集处理成功后的大小和修改时间
+    （纳秒）。打开清单时若规则摘要与上次不同，清空全部记录。判断文件是否变化
+    只需 os.stat，不打开文件。清单只在主进程中使用；并行处理迭代器时进程池的
+    派发线程也会查询清单，因此所有数据库操作都在锁内进行。
+    """
+    def __init__(self, db_path, fingerprint):
+        import sqlite3
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db_path = db_path
+        # GUI 在后台线程中运行任务，连接允许跨线程使用，由 _lock 保证不并发
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS files "
+                          "(path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER)")
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+        self.invalidated = row is not None and row[0] != fingerprint
+        if row is None or self.invalidated:
+            self.conn.execute("DELETE FROM files")
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('fingerprint', ?)", (fingerprint,))
+        self.conn.commit()
+        self._pending = 0
+
+    @staticmethod
+    def _key(file_path):
+        return os.path.abspath(file_path)
+
+    def is_unchanged(self, file_path):
+        """文件自上次成功处理后大小和修改时间都没有变化"""
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return False
+        with self._lock:
+            row = self.conn.execute("SELECT size, mtime_ns FROM files WHERE path = ?",
+                                    (self._key(file_path),)).fetchone()
+        return row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime_ns
+
+    def pending(self, file_list, on_unchanged):
+        """逐个产出需要处理的文件；未变化的文件不产出，改为调用 on_unchanged(路径)"""
+        for file_path in file_list:
+            if self.is_unchanged(file_path):
+                on_unchanged(file_path)
+            else:
+                yield file_path
+
+    def record(self, result):
+        """记录文件的处理结果：成功时保存写回后的大小和修改时间，失败时删除记录"""
+        key = self._key(result.path)
+        if result.ok:
+            try:
+                stat = os.stat(result.path)
+            except OSError:
+                return
+            with self._lock:
+                self.conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?)",
+                                  (key, stat.st_size, stat.st_mtime_ns))
+        else:
+            with self._lock:
+                self.conn.execute("DELETE FROM files WHERE path = ?", (key,))
+        self._pending += 1
+        if self._pending >= COMMIT_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        """提交尚未写入的记录"""
+        with self._lock:
+            self.conn.commit()
+        self._pending = 0
+
+    def close(self):
+        """提交并关闭清单"""
+        self.flush()
+        self.conn.close()
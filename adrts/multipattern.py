@@ -0,0 +1,161 @@
+"""多模式单遍匹配：把大量规则合并为一次扫描"""
+import re
+
+
+def _trie_regex(node):
+    """把前缀树节点转换为正则片段
+
+    单分支链路合并为一个字面量，只在分叉处生成分组；终止节点之后的分支
+    写成贪婪的可选组，使同一起点优先匹配最长的字面量。
+    """
+    chars = []
+    while len(node) == 1 and '' not in node:
+        ch, node = next(iter(node.items()))
+        chars.append(ch)
+    prefix = re.escape(''.join(chars))
+
+    branches = [re.escape(ch) + _trie_regex(child)
+                for ch, child in sorted(node.items()) if ch]
+    if not branches:
+        return prefix
+    if '' in node:
+        return prefix + '(?:' + '|'.join(branches) + ')?'
+    return prefix + '(?:' + '|'.join(branches) + ')'
+
+
+class LiteralAutomaton:
+    """字面量规则的多模式匹配自动机
+
+    所有查找文本构建成一棵前缀树，再编译为单个正则，由 re 的 C 引擎
+    从左到右扫描一遍完成全部替换，代价与规则数量基本无关。
+
+    匹配策略（最左最长）：
+    - 从文本左侧开始，在最靠左的位置上取能匹配的最长查找文本；
+    - 被替换的片段不再参与后续匹配，替换结果也不会被其他规则再次匹配；
+    - 查找文本完全相同的多条规则，只有排在最前面的规则生效。
+    """
+    __slots__ = ('pattern', 'targets', 'span')
+
+    def __init__(self, rules):
+        self.targets = {}  # 查找文本 -> (替换文本, 规则序号)
+        trie = {}
+        for rule in rules:
+            if rule.find in self.targets:
+                continue
+            self.targets[rule.find] = (rule.replace, rule.index)
+            node = trie
+            for ch in rule.find:
+                node = node.setdefault(ch, {})
+            node[''] = {}
+        self.pattern = re.compile(_trie_regex(trie))
+        self.span = max(len(find_text) for find_text in self.targets)  # 最长匹配长度
+
+    def replacer(self, counts):
+        """返回 re.sub 使用的替换函数，命中次数累加到 counts[规则序号]"""
+        targets = self.targets
+
+        def dispatch(match):
+            replace_text, index = targets[match.group()]
+            counts[index] += 1
+            return replace_text
+
+        return dispatch
+
+    def substitute(self, content, counts):
+        """单遍替换所有字面量，命中次数累加到 counts[规则序号]"""
+        return self.pattern.sub(self.replacer(counts), content)
+
+    def matches(self, content):
+        """逐个产出替换：(起点, 终点, 规则序号, 替换文本)"""
+        targets = self.targets
+        for match in self.pattern.finditer(content):
+            replace_text, index = targets[match.group()]
+            yield (match.start(), match.end(), index, replace_text)
+
+
+# 转义序列，或 (?P=name) 命名反向引用 / (?(1)...) 条件分组
+_ESCAPE_OR_GROUP_REF = re.compile(r'\\(.)|\(\?P=|\(\?\(', re.DOTALL)
+
+# 转义序列，或 (?s) 等作用于整个正则的内联标志（(?i:...) 这样的局部标志除外）
+_ESCAPE_OR_GLOBAL_FLAGS = re.compile(r'\\.|\(\?[aiLmsux]+\)', re.DOTALL)
+
+# 所有规则统一使用的编译标志
+_BASE_FLAGS = re.compile('', re.DOTALL).flags
+
+
+def has_group_reference(find_text):
+    """正则中是否引用了自身的分组（反向引用或条件分组）"""
+    for match in _ESCAPE_OR_GROUP_REF.finditer(find_text):
+        escaped = match.group(1)
+        if escaped is None or escaped in "123456789":
+            return True
+    return False
+
+
+def has_global_flags(find_text):
+    """正则中是否有 (?s) 等内联全局标志；全局标志只能出现在正则开头，包进分组后无法编译"""
+    return any(match.group().startswith('(') for match in _ESCAPE_OR_GLOBAL_FLAGS.finditer(find_text))
+
+
+def can_fuse(rule):
+    """正则规则能否合并进 FusedRegex
+
+    合并后分组编号会整体偏移，因此带反向引用或条件分组的规则不能合并；
+    用内联全局标志的规则即使标志与编译标志相同（如 (?s)），包进分组后也无法编译，
+    同样不能与其他规则共用一个正则。
+    """
+    return (rule.pattern.flags == _BASE_FLAGS and not has_group_reference(rule.find)
+            and not has_global_flags(rule.find))
+
+
+class FusedRegex:
+    """多条独立正则规则合并成的单个正则
+
+    每条规则包在一个捕获组里按规则顺序组成分支，一遍扫描完成全部替换。
+    匹配策略：在最靠左的位置上，按规则顺序取第一个能匹配的规则；每处文本
+    只被一条规则替换，替换结果不会再被其他规则匹配。
+    """
+    __slots__ = ('pattern', 'branches', 'span')
+
+    def __init__(self, rules):
+        self.branches = {}  # 外层捕获组编号 -> 规则
+        parts = []
+        group = 1
+        for rule in rules:
+            self.branches[group] = rule
+            parts.append('(' + rule.find + ')')
+            group += 1 + rule.pattern.groups
+        self.pattern = re.compile('|'.join(parts), re.DOTALL)
+        # 最长匹配跨度：任一分支未声明时为 None（无界）
+        spans = [rule.span for rule in rules]
+        self.span = None if None in spans else max(spans)
+
+    def replacer(self, counts):
+        """返回 re.sub 使用的替换函数，命中次数累加到 counts[规则序号]"""
+        branches = self.branches
+
+        def dispatch(match):
+            # 外层捕获组最后闭合，lastindex 即命中分支的组号
+            rule = branches[match.lastindex]
+            counts[rule.index] += 1
+            if rule.literal is not None:
+                return rule.literal
+            # 模板引用了分组：用规则自身的正则在同一位置重新匹配后展开
+            return rule.expander(rule.pattern.match(match.string, match.start()))
+
+        return dispatch
+
+    def substitute(self, content, counts):
+        """单遍替换，命中次数累加到 counts[规则序号]"""
+        return self.pattern.sub(self.replacer(counts), content)
+
+    def matches(self, content):
+        """逐个产出替换：(起点, 终点, 规则序号, 替换文本)"""
+        branches = self.branches
+        for match in self.pattern.finditer(content):
+            rule = branches[match.lastindex]
+            if rule.literal is not None:
+                replace_text = rule.literal
+            else:
+                replace_text = rule.expander(rule.pattern.match(match.string, match.start()))
+            yield (match.start(), match.end(), rule.index, replace_text)
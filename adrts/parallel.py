@@ -0,0 +1,115 @@
+"""多进程并行处理：把文件列表分片交给工作进程，结果按原顺序流式返回
+
+multiprocessing 在创建进程池时才导入：命令行计算默认进程数时只需要 os.cpu_count()。
+"""
+import os
+
+from .engine import ReplaceEngine, JobResult, _no_log
+from .profiling import Profile
+
+# 工作进程内的引擎，由 _init_worker 在进程启动时创建一次
+_worker_engine = None
+_collect_messages = False
+_cancel_event = None
+
+
+def default_workers():
+    """默认的工作进程数：CPU 核数"""
+    return os.cpu_count() or 1
+
+
+def _init_worker(rule_set, options, collect_messages, cancel_event):
+    """工作进程初始化：加载已编译的规则集
+
+    写回使用目标文件旁的唯一临时文件，工作进程之间不需要独立的临时文件夹。
+    """
+    global _worker_engine, _collect_messages, _cancel_event
+    _worker_engine = ReplaceEngine(rule_set, **options)
+    _collect_messages = collect_messages
+    _cancel_event = cancel_event
+
+
+def _process_in_worker(task):
+    """在工作进程中处理一个文件，日志随结果一起返回；任务取消后跳过并返回 None
+
+    task 为 (文件路径, 该文件的 FilePreview 或 None)。开启性能统计时，该文件的
+    统计随结果返回，由主进程合并。
+    """
+    if _cancel_event.is_set():
+        return None
+    file_path, preview = task
+    if _collect_messages:
+        messages = []
+        _worker_engine.log = messages.append
+        result = _worker_engine.run_one(file_path, preview)
+        result.messages = messages
+    else:
+        result = _worker_engine.run_one(file_path, preview)
+    if _worker_engine.profile is not None:
+        result.profile = _worker_engine.profile
+        _worker_engine.profile = Profile(_worker_engine.rule_set)
+    return result
+
+
+def _chunk_size(total, workers):
+    """每次派发给工作进程的文件数：足够大以摊薄进程间通信，又能均衡负载（总数未知时取 16）"""
+    if total is None:
+        return 16
+    return max(1, min(64, total // (workers * 8)))
+
+
+def run_parallel(engine, file_list, workers, on_progress=None, cancel_event=None, job=None,
+                 total_files=None, previews=None):
+    """用进程池并行处理文件列表，返回与串行模式一致的 JobResult
+
+    结果按文件列表的原始顺序返回，因此计数与 failed_files 的内容和顺序都与
+    串行执行相同；工作进程的日志在主进程中按文件依次输出。cancel_event 被设置
+    后，工作进程跳过尚未开始的文件，正在处理的文件会正常完成。结果汇总到
+    job（未指定时新建），增量运行的清单在主进程中记录。file_list 为迭代器时
+    由进程池边读取边派发，total_files 为其总数（未知时为 None）。previews 为
+    应用预览时的 Preview，每个文件的预览随任务一起发给工作进程。
+    """
+    import multiprocessing
+    if job is None:
+        job = JobResult()
+    if total_files is None and hasattr(file_list, '__len__'):
+        total_files = len(file_list)
+    if total_files is not None:
+        workers = min(workers, total_files)
+    log = engine.log
+    collect_messages = log is not _no_log
+    # 取消标志需要在进程间共享，由主进程根据 cancel_event 转发
+    worker_cancel = multiprocessing.Event()
+
+    pool = multiprocessing.Pool(
+        workers,
+        initializer=_init_worker,
+        initargs=(engine.rule_set, engine.options(), collect_messages, worker_cancel)
+    )
+    try:
+        tasks = ((file_path, previews.get(file_path) if previews is not None else None)
+                 for file_path in file_list)
+        results = pool.imap(_process_in_worker, tasks,
+                            _chunk_size(total_files, workers))
+        for i, result in enumerate(results):
+            if cancel_event is not None and cancel_event.is_set():
+                worker_cancel.set()
+            if result is None:
+                job.cancelled = True
+                continue
+            if result.messages:
+                for message in result.messages:
+                    log(message)
+            engine.collect_result(job, result)
+
+            if on_progress is not None:
+                on_progress(i + 1, total_files)
+        if job.cancelled:
+            log("任务已取消")
+    finally:
+        # 跳过剩余文件，等待进行中的文件处理完成后再退出，避免写入到一半的文件
+        worker_cancel.set()
+        pool.close()
+        pool.join()
+
+    return job
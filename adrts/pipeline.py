@@ -0,0 +1,208 @@
+"""单进程流水线：预读、替换、写回三个阶段，读写磁盘与替换计算互相重叠
+
+读取线程池按文件顺序预读文件的全部字节；替换在调用 run() 的线程中依次进行
+（正则时间限制只能打断主线程）；需要写回的内容交给写入线程池。已预读但尚未
+替换、以及已替换但尚未写完的文件共用一个字节预算：预算用完时暂停预读，只有
+在没有已预读的文件可以处理时才等待写入完成，内存占用不随文件大小和数量增长。
+达到流式处理阈值或超过整个预算的文件不预读，照常由替换阶段自行读取。
+每个文件的日志先缓存，写回完成后按文件顺序输出，结果与串行处理一致。
+
+concurrent.futures（连带 logging）在运行流水线时才导入，只处理单个文件时不需要加载。
+"""
+import os
+import time
+import threading
+import collections
+
+from .fileio import write_bytes_atomic
+
+# 读取、写入线程池各自的线程数，以及在途字节预算
+DEFAULT_IO_THREADS = 2
+DEFAULT_IO_BUDGET = 64 * 1024 * 1024
+
+
+class ByteBudget:
+    """在途字节预算，由替换阶段占用、读写线程和替换阶段释放"""
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self._cond = threading.Condition()
+
+    def try_acquire(self, size):
+        """预算足够（或没有任何占用）时占用 size 字节并返回 True，否则返回 False"""
+        with self._cond:
+            if self.used and self.used + size > self.limit:
+                return False
+            self.used += size
+            return True
+
+    def acquire(self, size):
+        """占用 size 字节，预算不足时等待其他占用释放"""
+        with self._cond:
+            while self.used and self.used + size > self.limit:
+                self._cond.wait()
+            self.used += size
+
+    def charge(self, size):
+        """不等待地占用 size 字节：替换结果必须保留到写完，替换阶段不能因此阻塞"""
+        with self._cond:
+            self.used += size
+
+    def release(self, size):
+        with self._cond:
+            self.used -= size
+            self._cond.notify_all()
+
+
+def _read(file_path):
+    """读取线程：读取文件的全部字节，返回 (字节, 耗时)"""
+    start = time.perf_counter()
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    return data, time.perf_counter() - start
+
+
+def _write(file_path, data, budget, backup):
+    """写入线程：原子写回并释放占用的预算，返回 (耗时, 备份记录)"""
+    start = time.perf_counter()
+    try:
+        saved = write_bytes_atomic(file_path, data, backup)
+    finally:
+        budget.release(len(data))
+    return time.perf_counter() - start, saved
+
+
+def _should_prefetch(engine, stat, preview):
+    """文件是否预读：流式处理的大文件、超过预算的文件和预览中没有替换的文件不预读"""
+    if stat is None or stat.st_size > engine.io_budget:
+        return False
+    if preview is not None:
+        return preview.replacements > 0
+    return engine.dry_run or engine.stream_threshold is None or stat.st_size < engine.stream_threshold
+
+
+def run_pipelined(engine, file_list, on_progress=None, cancel_event=None, job=None,
+                  total_files=None, previews=None):
+    """在流水线中处理文件列表，返回与串行模式一致的 JobResult（参数同 run_parallel）
+
+    cancel_event 被设置后不再开始新的文件，已替换的文件写完后才返回。
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    log = engine.log
+    budget = ByteBudget(engine.io_budget)
+    depth = engine.io_threads * 2  # 最多预读的文件数
+    readers = ThreadPoolExecutor(engine.io_threads, thread_name_prefix='adrts-read')
+    writers = ThreadPoolExecutor(engine.io_threads, thread_name_prefix='adrts-write')
+    files = iter(file_list)
+    ahead = collections.deque()  # 已派发的文件：(路径, 预览, 读取前的状态, 占用的预算, 读取任务)
+    writing = collections.deque()  # 替换完成、按顺序等待写完的文件：(结果, 日志, 写入字节数, 写入任务)
+    pending = None  # 已从文件列表取出、等待预算的文件：(路径, 预览, 状态)
+    done = 0
+
+    def dispatch():
+        """按文件顺序派发预读，直到预读的文件数或预算达到上限
+
+        预算不足时先处理已预读的文件；没有已预读的文件时才等待写入释放预算。
+        """
+        nonlocal pending
+        while len(ahead) < depth:
+            if pending is None:
+                file_path = next(files, None)
+                if file_path is None:
+                    return
+                preview = previews.get(file_path) if previews is not None else None
+                try:
+                    stat = os.stat(file_path)
+                except OSError:
+                    stat = None
+                pending = (file_path, preview, stat)
+            file_path, preview, stat = pending
+            if not _should_prefetch(engine, stat, preview):
+                ahead.append((file_path, preview, None, 0, None))
+            else:
+                if not budget.try_acquire(stat.st_size):
+                    if ahead:
+                        return
+                    budget.acquire(stat.st_size)
+                ahead.append((file_path, preview, stat, stat.st_size, readers.submit(_read, file_path)))
+            pending = None
+
+    def collect(wait):
+        """按文件顺序输出已写完文件的日志并汇总结果；wait 为 True 时等待全部写完"""
+        nonlocal done
+        while writing and (wait or writing[0][3] is None or writing[0][3].done()):
+            result, messages, size, write = writing.popleft()
+            if write is not None:
+                try:
+                    seconds, result.backup = write.result()
+                except Exception as e:
+                    # 与串行处理中写回出错时的日志一致
+                    messages.append(f"处理文件 {result.path} 时出错 - {str(e)}")
+                    result.error = str(e)
+                    messages.append(f"错误: 处理文件时出错 - {result.error}")
+                else:
+                    if engine.profile is not None:
+                        phases = engine.profile.phases
+                        phases['write'] = phases.get('write', 0.0) + seconds
+                        engine.profile.bytes_written += size
+                    messages.append(f"已保存修改到: {result.path}")
+            for message in messages:
+                log(message)
+            engine.collect_result(job, result)
+            done += 1
+            if on_progress is not None:
+                on_progress(done, total_files)
+
+    engine.defer_writes = True
+    try:
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                job.cancelled = True
+                break
+            dispatch()
+            if not ahead:
+                break
+
+            file_path, preview, stat, size, read = ahead.popleft()
+            data = None
+            if read is not None:
+                try:
+                    data, seconds = read.result()
+                except OSError:
+                    # 读取失败时由替换阶段重新读取，报告与串行处理相同的错误
+                    pass
+                else:
+                    if engine.profile is not None:
+                        phases = engine.profile.phases
+                        phases['read'] = phases.get('read', 0.0) + seconds
+                        engine.profile.bytes_read += len(data)
+
+            messages = []
+            engine.log = messages.append
+            try:
+                result = engine.run_one(file_path, preview, data, stat if data is not None else None)
+            finally:
+                engine.log = log
+            data = None
+            budget.release(size)
+
+            output, write = result.output, None
+            if output is not None:
+                result.output = None
+                budget.charge(len(output))
+                write = writers.submit(_write, file_path, output, budget, engine.backup)
+            writing.append((result, messages, len(output) if output is not None else 0, write))
+            collect(False)
+
+        collect(True)
+        if job.cancelled:
+            log("任务已取消")
+    finally:
+        engine.defer_writes = False
+        # 放弃尚未开始的预读；等待进行中的写入完成，不留下写到一半的临时文件
+        for entry in ahead:
+            if entry[4] is not None:
+                entry[4].cancel()
+        readers.shutdown(wait=True)
+        writers.shutdown(wait=True)
+    return job
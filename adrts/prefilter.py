@@ -0,0 +1,228 @@
+"""字节级预筛选：解码之前在原始字节中查找规则必需的字面量，跳过不可能匹配的文件"""
+import re
+import mmap
+import codecs
+
+from .multipattern import _trie_regex, has_group_reference
+
+# 不小于此大小的文件使用内存映射扫描
+MMAP_THRESHOLD = 1024 * 1024
+
+# 正则中代表字面量的转义
+_ESCAPE_LITERALS = {'n': '\n', 't': '\t', 'r': '\r', 'f': '\f', 'v': '\v', 'a': '\a'}
+# 带参数的转义及其参数的长度：\xhh、\uXXXX、\UXXXXXXXX
+_ESCAPE_ARGUMENTS = {'x': 2, 'u': 4, 'U': 8}
+# 正则中的元字符
+_META = set('.^$*+?{}[]\\|()')
+
+
+# 合法的 {m,n} 量词；不合法的 { 在 Python 正则中是普通字符
+_BRACE_QUANTIFIER = re.compile(r'\{\d*(?:,\d*)?\}')
+
+
+# 内容按原样参与匹配的分组开头：(、(?:、(?P<name>
+_PLAIN_GROUP = re.compile(r'(?!\?)|\?:|\?P<\w+>')
+
+
+def _skip_class(pattern, i):
+    """从 [ 的位置 i 跳到字符类结束之后"""
+    i += 1
+    # 字符类开头的 ] 或 ^] 是普通字符
+    if pattern[i:i + 1] == '^':
+        i += 1
+    if pattern[i:i + 1] == ']':
+        i += 1
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == '\\':
+            i += 2
+            continue
+        if ch == ']':
+            return i + 1
+        i += 1
+    return i
+
+
+def _skip_group(pattern, i):
+    """从 ( 的位置 i 跳到与之匹配的 ) 之后"""
+    depth = 0
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == '\\':
+            i += 2
+            continue
+        if ch == '[':
+            i = _skip_class(pattern, i)
+            continue
+        if ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return i
+
+
+def _skip_escape(pattern, i):
+    """从 \\ 的位置 i 跳到整个转义结束之后（包括 \\x41、\\N{...}、八进制和分组引用的参数）"""
+    escaped = pattern[i + 1:i + 2]
+    i += 2
+    if escaped in _ESCAPE_ARGUMENTS:
+        return min(len(pattern), i + _ESCAPE_ARGUMENTS[escaped])
+    if escaped == 'N' and pattern[i:i + 1] == '{':
+        end = pattern.find('}', i)
+        return len(pattern) if end < 0 else end + 1
+    if escaped.isdigit():
+        # 八进制转义最多三位，分组引用最多两位；多跳过的数字只会让片段更短
+        end = min(len(pattern), i + 2)
+        while i < end and pattern[i].isdigit():
+            i += 1
+    return i
+
+
+def _regex_literal_runs(pattern):
+    """提取正则顶层必须出现的字面量片段；顶层有分支（|）时返回 None
+
+    只做保守的分析：分组、字符类、转义类、量词和可选的字符都会切断片段，
+    因此返回的每个片段在任何匹配中都一定出现。
+    """
+    runs = []
+    current = []
+    i = 0
+    while i < len(pattern):
+        ch = pattern[i]
+        literal = None
+        group_runs = None
+        if ch == '\\':
+            escaped = pattern[i + 1:i + 2]
+            if escaped in _ESCAPE_LITERALS:
+                literal = _ESCAPE_LITERALS[escaped]
+            elif escaped and not escaped.isalnum():
+                literal = escaped
+            # 其余字母数字转义（\d、\x41、\N{...} 等）中断片段，参数不作为字面量
+            i = _skip_escape(pattern, i)
+        elif ch == '(':
+            end = _skip_group(pattern, i)
+            # 普通分组、非捕获分组和命名分组的内容同样必须出现
+            prefix = _PLAIN_GROUP.match(pattern, i + 1)
+            if prefix:
+                group_runs = _regex_literal_runs(pattern[prefix.end():end - 1])
+            i = end
+        elif ch == '[':
+            i = _skip_class(pattern, i)
+        elif ch == '|':
+            return None
+        elif ch == '{':
+            quantifier = _BRACE_QUANTIFIER.match(pattern, i)
+            if quantifier:
+                i = quantifier.end()
+            else:
+                literal = ch
+                i += 1
+        elif ch not in _META:
+            literal = ch
+            i += 1
+        else:
+            i += 1
+
+        # 紧跟的量词：? * {0,...} 使字符可选；任何量词之后片段都要中断
+        follow = pattern[i:i + 1]
+        quantified = follow in ('?', '*', '+') or (follow == '{' and _BRACE_QUANTIFIER.match(pattern, i))
+        optional = follow in ('?', '*') or pattern.startswith(('{0,', '{0}', '{,'), i)
+        if literal is not None and not optional:
+            current.append(literal)
+        if group_runs and not optional:
+            runs.extend(group_runs)
+        if literal is None or quantified:
+            if current:
+                runs.append(''.join(current))
+            current = []
+    if current:
+        runs.append(''.join(current))
+    return runs
+
+
+def required_literal(rule):
+    """规则的任何匹配中都必然出现的字面量；无法确定时返回 None"""
+    if not rule.regex:
+        candidates = [rule.find]
+    else:
+        if rule.pattern.flags & (re.IGNORECASE | re.VERBOSE) or has_group_reference(rule.find):
+            return None
+        candidates = _regex_literal_runs(rule.find)
+        if not candidates:
+            return None
+
+    # 文本模式读取会把 \r\n 转换为 \n，含换行的片段在字节中的形式不确定，只取不含换行的部分
+    pieces = [piece for text in candidates for piece in re.split('[\r\n]', text) if piece]
+    if not pieces:
+        return None
+    return max(pieces, key=len)
+
+
+# 编码时会写入 BOM 的编码，对应不带 BOM 的形式
+_WITHOUT_BOM = {'utf-8-sig': 'utf-8', 'utf-16': 'utf-16-le', 'utf-32': 'utf-32-le'}
+
+
+def _encode_candidates(text, encodings):
+    """字面量在各候选编码下的字节形式（去重；无法编码的跳过）"""
+    encoded = set()
+    for encoding in encodings:
+        try:
+            name = codecs.lookup(encoding).name
+            encoded.add(text.encode(_WITHOUT_BOM.get(name, name)))
+        except (UnicodeEncodeError, LookupError):
+            continue
+    return encoded
+
+
+class Prefilter:
+    """判断文件的原始字节中是否可能含有任一规则的匹配
+
+    只要有一条规则的必需字面量出现在文件中（按任一候选编码编码后），文件就需要
+    处理；否则没有任何规则能匹配，链式规则也不会被触发，文件可以安全跳过。
+    """
+    __slots__ = ('pattern',)
+
+    def __init__(self, literals, encodings):
+        needles = set()
+        for text in literals:
+            needles |= _encode_candidates(text, encodings)
+        # 用 latin-1 在字节与字符之间一一对应，复用字面量自动机的前缀树正则
+        trie = {}
+        for needle in needles:
+            node = trie
+            for ch in needle.decode('latin-1'):
+                node = node.setdefault(ch, {})
+            node[''] = {}
+        self.pattern = re.compile(_trie_regex(trie).encode('latin-1'))
+
+    def may_match(self, file_path):
+        """文件中是否出现了任一必需字面量"""
+        with open(file_path, 'rb') as f:
+            size = f.seek(0, 2)
+            if size == 0:
+                return False
+            if size < MMAP_THRESHOLD:
+                f.seek(0)
+                return self.may_match_bytes(f.read())
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return self.may_match_bytes(data)
+
+    def may_match_bytes(self, data):
+        """已读取的文件字节中是否出现了任一必需字面量"""
+        return self.pattern.search(data) is not None
+
+
+def build_prefilter(rule_set, encodings):
+    """为规则集构建预筛选器；有规则无法确定必需字面量时返回 None（不筛选）"""
+    literals = []
+    for rule in rule_set.rules:
+        literal = required_literal(rule)
+        if literal is None:
+            return None
+        literals.append(literal)
+    if not literals:
+        return None
+    return Prefilter(literals, encodings)
@@ -0,0 +1,90 @@
+"""替换预览：记录每个文件的替换位置，应用预览时对未变化的文件直接复用，无需再次查找"""
+import os
+
+from .encoding import translate_newlines
+from .rules import splice
+
+
+class FilePreview:
+    """单个文件的预览结果，可在进程间传递
+
+    steps 与规则集的执行步骤一一对应，每个步骤是按起点排序的
+    (起点, 终点, 规则序号, 替换文本) 列表，位置基于上一步骤的输出。
+    size / mtime_ns 是预览时文件的状态，用来判断之后文件是否被修改过。
+    """
+    __slots__ = ('path', 'size', 'mtime_ns', 'encoding', 'steps', 'replacements')
+
+    def __init__(self, path, size, mtime_ns, encoding=None, steps=()):
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.encoding = encoding  # 预览时读取使用的编码；预筛选跳过的文件为 None
+        self.steps = steps
+        self.replacements = sum(len(edits) for edits in steps)
+
+    @classmethod
+    def from_stat(cls, path, stat, encoding=None, steps=()):
+        return cls(path, stat.st_size, stat.st_mtime_ns, encoding, steps)
+
+    def is_current(self):
+        """文件自预览后大小和修改时间都没有变化"""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False
+        return stat.st_size == self.size and stat.st_mtime_ns == self.mtime_ns
+
+
+class Preview:
+    """一次预览任务的全部结果
+
+    files 按路径索引所有预览成功的文件（包括没有替换的文件），changed 按处理
+    顺序列出有替换的文件，供界面分页显示。fingerprint 为生成预览时规则集与
+    编码设置的摘要，设置变化后预览不能再应用；aliases 为各规则的别名。
+    """
+    def __init__(self, fingerprint, aliases):
+        self.fingerprint = fingerprint
+        self.aliases = aliases
+        self.files = {}  # 路径 -> FilePreview
+        self.changed = []  # 有替换的文件路径
+        self.replacements = 0
+
+    def add(self, file_preview):
+        """加入一个文件的预览结果"""
+        self.files[file_preview.path] = file_preview
+        if file_preview.replacements:
+            self.changed.append(file_preview.path)
+            self.replacements += file_preview.replacements
+
+    def get(self, path):
+        return self.files.get(path)
+
+    def page(self, number, size):
+        """第 number 页（从 0 开始）有替换的文件预览"""
+        return [self.files[path] for path in self.changed[number * size:(number + 1) * size]]
+
+    def page_count(self, size):
+        return max(1, (len(self.changed) + size - 1) // size)
+
+
+def load_snippets(file_preview, aliases, limit=200, context=20):
+    """读取文件并生成前 limit 处替换的说明：(规则别名, 替换前片段, 替换后片段)
+
+    片段包含匹配前后各 context 个字符。后续步骤的位置基于前一步骤的输出，
+    因此按记录逐步重建中间文本，不需要再次查找。
+    """
+    with open(file_preview.path, 'rb') as f:
+        content = translate_newlines(f.read().decode(file_preview.encoding))
+
+    snippets = []
+    for edits in file_preview.steps:
+        for start, end, index, replace_text in edits:
+            if len(snippets) >= limit:
+                return snippets
+            before = content[max(0, start - context):start]
+            after = content[end:end + context]
+            snippets.append((aliases[index],
+                             before + content[start:end] + after,
+                             before + replace_text + after))
+        content = splice(content, edits)
+    return snippets
@@ -0,0 +1,170 @@
+"""性能统计：按阶段和规则记录耗时、命中数、读写字节数与使用的编码
+
+统计默认关闭，关闭时流水线中只有一次 None 判断的开销。
+"""
+import json
+import time
+
+# 汇总表中阶段的显示顺序与名称
+PHASE_NAMES = {
+    'scan': '扫描目录',
+    'index': '内容索引',
+    'prefilter': '预筛选',
+    'read': '读取',
+    'decode': '解码',
+    'replace': '替换',
+    'write': '写回',
+    'stream': '流式处理',
+}
+
+
+class _Phase:
+    """累计一个阶段耗时的上下文管理器"""
+    __slots__ = ('phases', 'name', 'start')
+
+    def __init__(self, phases, name):
+        self.phases = phases
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.phases[self.name] = self.phases.get(self.name, 0.0) + time.perf_counter() - self.start
+
+
+class _NoPhase:
+    """统计关闭时使用的空上下文管理器"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NO_PHASE = _NoPhase()
+
+
+def timed_iter(iterable, phases, name='scan'):
+    """逐个产出 iterable 的元素，取下一个元素的耗时累计到 phases[name]（用于边扫描边处理）"""
+    iterator = iter(iterable)
+    while True:
+        with _Phase(phases, name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def step_label(step):
+    """规则步骤在汇总表中的名称"""
+    rules = getattr(step, 'targets', None)
+    if rules is not None:
+        return f"字面量自动机 ({len(rules)} 条)"
+    branches = getattr(step, 'branches', None)
+    if branches is not None:
+        return "合并正则: " + ", ".join(rule.alias for rule in branches.values())
+    return step.alias
+
+
+class Profile:
+    """一次任务的性能统计，可在进程间传递并合并
+
+    phases 为各阶段累计秒数；step_time 按规则集的执行步骤累计替换耗时（合并的
+    步骤包含多条规则）；rule_matches / rule_files 为每条规则的替换次数和命中文件数。
+    """
+    def __init__(self, rule_set):
+        self.phases = {}
+        self.step_time = [0.0] * len(rule_set.steps)
+        self.rule_matches = [0] * len(rule_set.rules)
+        self.rule_files = [0] * len(rule_set.rules)
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.files = 0
+        self.encodings = {}  # 编码 -> 文件数
+
+    def phase(self, name):
+        """返回累计 name 阶段耗时的上下文管理器"""
+        return _Phase(self.phases, name)
+
+    def timed_iter(self, iterable, name='scan'):
+        """逐个产出 iterable 的元素，取下一个元素的耗时计入 name 阶段"""
+        return timed_iter(iterable, self.phases, name)
+
+    def add_counts(self, counts):
+        """累计一个文件中每条规则的替换次数"""
+        for index, count in enumerate(counts):
+            if count:
+                self.rule_matches[index] += count
+                self.rule_files[index] += 1
+
+    def add_file(self, result):
+        """累计一个文件的处理结果（文件数与读取编码）"""
+        self.files += 1
+        if result.encoding:
+            self.encodings[result.encoding] = self.encodings.get(result.encoding, 0) + 1
+
+    def merge(self, other):
+        """合并工作进程中单个文件的统计"""
+        for name, seconds in other.phases.items():
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+        for i, seconds in enumerate(other.step_time):
+            self.step_time[i] += seconds
+        for i, count in enumerate(other.rule_matches):
+            self.rule_matches[i] += count
+        for i, count in enumerate(other.rule_files):
+            self.rule_files[i] += count
+        self.bytes_read += other.bytes_read
+        self.bytes_written += other.bytes_written
+
+    def to_dict(self, rule_set):
+        """导出为可序列化为 JSON 的字典"""
+        return {
+            'files': self.files,
+            'bytes_read': self.bytes_read,
+            'bytes_written': self.bytes_written,
+            'phases': {name: round(seconds, 6) for name, seconds in self.phases.items()},
+            'encodings': dict(self.encodings),
+            'steps': [{'step': step_label(step), 'seconds': round(seconds, 6)}
+                      for step, seconds in zip(rule_set.steps, self.step_time)],
+            'rules': [{'alias': rule.alias, 'matches': matches, 'files': files}
+                      for rule, matches, files in zip(rule_set.rules, self.rule_matches, self.rule_files)],
+        }
+
+    def save(self, file_path, rule_set):
+        """导出为 JSON 文件"""
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(rule_set), f, ensure_ascii=False, indent=2)
+
+    def summary_lines(self, rule_set, top=20):
+        """汇总表的文本行：各阶段耗时、耗时最多的步骤和每条规则的命中情况"""
+        lines = ["========== 性能统计 =========="]
+        lines.append(f"文件: {self.files} 个，读取 {self.bytes_read / 1024 / 1024:.2f} MB，"
+                     f"写入 {self.bytes_written / 1024 / 1024:.2f} MB")
+        if self.encodings:
+            lines.append("编码: " + "，".join(f"{encoding} {count} 个" for encoding, count
+                                             in sorted(self.encodings.items(), key=lambda item: -item[1])))
+
+        lines.append(f"{'阶段':<12}{'耗时(秒)':>12}")
+        names = list(PHASE_NAMES) + [name for name in self.phases if name not in PHASE_NAMES]
+        for name in names:
+            if name in self.phases:
+                lines.append(f"{PHASE_NAMES.get(name, name):<12}{self.phases[name]:>12.3f}")
+
+        steps = sorted(zip(rule_set.steps, self.step_time), key=lambda item: -item[1])[:top]
+        if any(seconds for _, seconds in steps):
+            lines.append(f"{'步骤':<30}{'耗时(秒)':>12}")
+            for step, seconds in steps:
+                lines.append(f"{step_label(step)[:30]:<30}{seconds:>12.3f}")
+
+        rules = sorted(zip(rule_set.rules, self.rule_matches, self.rule_files), key=lambda item: -item[1])[:top]
+        if any(matches for _, matches, _ in rules):
+            lines.append(f"{'规则':<30}{'替换数':>10}{'命中文件':>10}")
+            for rule, matches, files in rules:
+                if matches:
+                    lines.append(f"{rule.alias[:30]:<30}{matches:>10}{files:>10}")
+        return lines
@@ -0,0 +1,377 @@
+"""规则集编译：每次任务只编译、校验一次规则，逐文件直接套用"""
+import re
+import time
+
+from .multipattern import LiteralAutomaton, FusedRegex, can_fuse
+
+
+class RuleError(Exception):
+    """规则无效（缺少字段、正则或替换模板错误），任务开始前抛出"""
+
+
+def _template_checker(pattern, fills, prefix="", suffix=""):
+    """构造与 pattern 分组结构相同的匹配对象，用于展开替换模板
+
+    第 i 组捕获 fills[i-1]，整个匹配（第 0 组）为 prefix + 各组内容 + suffix。
+    """
+    names = {index: name for name, index in pattern.groupindex.items()}
+    parts = [re.escape(prefix)]
+    for index, fill in enumerate(fills, 1):
+        name = names.get(index)
+        group = re.escape(fill)
+        parts.append(f"(?P<{name}>{group})" if name else f"({group})")
+    parts.append(re.escape(suffix))
+    return re.compile("".join(parts)).match(prefix + "".join(fills) + suffix)
+
+
+# 标记分组引用位置的占位符，使用 Unicode 非字符，不会出现在正常文本中：
+# \ufdd2...\ufdd3 为整个匹配，\ufdd0 组号 \ufdd1 为各分组
+_GROUP_MARK = re.compile('\ufdd2.*?\ufdd3|\ufdd0(\\d+)\ufdd1')
+
+
+def _probe_template(pattern, replace_text):
+    """用占位符展开模板，拆分为 [字面量, 组号, 字面量, ...]"""
+    probe = _template_checker(
+        pattern, [f"\ufdd0{index}\ufdd1" for index in range(1, pattern.groups + 1)],
+        "\ufdd2", "\ufdd3"
+    ).expand(replace_text)
+    pieces = []
+    last = 0
+    for mark in _GROUP_MARK.finditer(probe):
+        pieces.append(probe[last:mark.start()])
+        pieces.append(int(mark.group(1) or 0))
+        last = mark.end()
+    pieces.append(probe[last:])
+    return pieces
+
+
+def _build_expander(pieces, empty=""):
+    """由 [字面量, 组号, 字面量, ...] 构造替换函数，代替逐次解析模板的 Match.expand
+
+    empty 为空串（字节模式的正则传入 b""），未参与匹配的分组替换为空。
+    """
+    literals = pieces[0::2]
+    groups = pieces[1::2]
+    head = literals[0]
+    tails = literals[1:]
+
+    if len(groups) == 1:
+        group = groups[0]
+        tail = tails[0]
+
+        def expand(match):
+            return head + (match.group(group) or empty) + tail
+        return expand
+
+    def expand(match):
+        out = [head]
+        for value, tail in zip(match.group(*groups), tails):
+            out.append(value or empty)
+            out.append(tail)
+        return empty.join(out)
+    return expand
+
+
+class CompiledRule:
+    """编译后的单条规则"""
+    __slots__ = ('index', 'alias', 'find', 'replace', 'regex', 'pattern', 'template', 'literal',
+                 'expander', 'max_span')
+
+    def __init__(self, index, alias, find, replace, regex, pattern=None, template=None,
+                 literal=None, expander=None, max_span=None):
+        self.index = index
+        self.alias = alias
+        self.find = find
+        self.replace = replace
+        self.regex = regex
+        self.pattern = pattern  # 正则规则的预编译模式
+        self.template = template  # 正则规则的替换模板；不含分组引用时为展开后的字面量
+        self.literal = literal  # 替换结果与匹配内容无关时，展开后的替换文本
+        self.expander = expander  # 模板引用分组时，由匹配对象生成替换文本的函数
+        self.max_span = max_span  # 正则规则声明的最长匹配跨度（含前后断言），未声明为 None
+
+    @property
+    def span(self):
+        """最长匹配跨度：字面量为查找文本长度，正则为声明值（None 表示无界）"""
+        return self.max_span if self.regex else len(self.find)
+
+    def replacer(self, counts):
+        """返回 re.sub 使用的替换函数，命中次数累加到 counts[规则序号]"""
+        index = self.index
+        if self.regex and self.literal is None:
+            expander = self.expander
+
+            def expand(match):
+                counts[index] += 1
+                return expander(match)
+            return expand
+
+        replace_text = self.literal if self.regex else self.replace
+
+        def constant(match):
+            counts[index] += 1
+            return replace_text
+        return constant
+
+    def apply(self, content):
+        """对内容应用本规则，返回 (新内容, 替换次数)"""
+        if self.regex:
+            return self.pattern.subn(self.template, content)
+        count = content.count(self.find)
+        if count:
+            content = content.replace(self.find, self.replace)
+        return content, count
+
+    def substitute(self, content, counts):
+        """应用本规则，替换次数累加到 counts[规则序号]"""
+        content, count = self.apply(content)
+        counts[self.index] += count
+        return content
+
+    def matches(self, content):
+        """逐个产出本规则的替换：(起点, 终点, 规则序号, 替换文本)，与 apply 的结果一致"""
+        index = self.index
+        if not self.regex:
+            find_text = self.find
+            replace_text = self.replace
+            start = content.find(find_text)
+            while start >= 0:
+                end = start + len(find_text)
+                yield (start, end, index, replace_text)
+                start = content.find(find_text, end)
+            return
+        for match in self.pattern.finditer(content):
+            replace_text = self.literal if self.literal is not None else self.expander(match)
+            yield (match.start(), match.end(), index, replace_text)
+
+
+def splice(content, edits):
+    """按位置把替换拼接回文本；edits 为按起点排序、互不重叠的 (起点, 终点, 规则序号, 替换文本)"""
+    if not edits:
+        return content
+    pieces = []
+    pos = 0
+    for start, end, _, replace_text in edits:
+        pieces.append(content[pos:start])
+        pieces.append(replace_text)
+        pos = end
+    pieces.append(content[pos:])
+    return "".join(pieces)
+
+
+def compile_rule(index, rule):
+    """编译并校验一条规则字典，失败时抛出 RuleError"""
+    alias = rule.get("alias") or f"规则{index + 1}"
+    find_text = rule.get("find")
+    replace_text = rule.get("replace", "")
+
+    if not isinstance(find_text, str) or not find_text:
+        raise RuleError(f"{alias}: 查找内容不能为空")
+    if not isinstance(replace_text, str):
+        raise RuleError(f"{alias}: 替换内容必须是字符串")
+
+    if not rule.get("regex", False):
+        return CompiledRule(index, alias, find_text, replace_text, False)
+
+    max_span = rule.get("max_span")
+    if max_span is not None and (not isinstance(max_span, int) or max_span <= 0):
+        raise RuleError(f"{alias}: max_span 必须是正整数")
+
+    try:
+        pattern = re.compile(find_text, re.DOTALL)
+    except re.error as e:
+        raise RuleError(f"{alias}: 正则表达式错误 - {str(e)}")
+
+    # 用等价分组结构的匹配展开一次模板，提前发现无效的转义和分组引用；
+    # 再用占位符展开一次，得到模板引用分组的位置
+    try:
+        expanded = _template_checker(pattern, [""] * pattern.groups).expand(replace_text)
+        pieces = _probe_template(pattern, replace_text)
+    except (re.error, IndexError) as e:
+        raise RuleError(f"{alias}: 替换模板错误 - {str(e)}")
+
+    literal = None
+    expander = None
+    if len(pieces) == 1:
+        # 模板没有引用分组，展开结果就是最终的替换文本
+        literal = expanded
+    elif any(mark in expanded for mark in '\ufdd0\ufdd1\ufdd2\ufdd3'):
+        # 模板本身含有占位字符，无法拆分，退回逐次展开
+        expander = lambda match: match.expand(replace_text)
+    else:
+        expander = _build_expander(pieces)
+
+    template = replace_text
+    if literal is not None and '\\' not in literal:
+        template = literal
+    return CompiledRule(index, alias, find_text, replace_text, True, pattern, template, literal,
+                        expander, max_span)
+
+
+# 规则集执行模式
+MODE_SEQUENTIAL = "sequential"  # 逐条依次替换，前一条规则的结果交给后一条
+MODE_SINGLE_PASS = "single-pass"  # 连续的字面量规则合并为一次扫描，互不链式作用
+MODE_FUSED = "fused"  # 在 single-pass 基础上，连续的独立正则规则也合并为一次扫描
+RULE_MODES = (MODE_SEQUENTIAL, MODE_SINGLE_PASS, MODE_FUSED)
+
+
+class RuleSet:
+    """编译后的规则集
+
+    构造时校验所有规则，任何一条无效都会抛出汇总了全部错误的 RuleError，
+    保证在处理任何文件之前拒绝错误的规则。
+
+    sequential 模式保持原有的链式语义；single-pass 模式下，相邻的字面量
+    规则合并成一个 LiteralAutomaton，按最左最长策略一遍完成替换，正则规则
+    仍在原来的位置依次执行。fused 模式还会把相邻的正则规则合并为一个
+    FusedRegex；使用反向引用或独立标志的规则无法合并，自动退回单独执行，
+    记录在 unfused 中。
+    """
+    __slots__ = ('rules', 'mode', 'steps', 'unfused')
+
+    def __init__(self, rules, mode=MODE_SEQUENTIAL):
+        if mode not in RULE_MODES:
+            raise RuleError(f"未知的规则模式: {mode}")
+
+        compiled = []
+        errors = []
+        for index, rule in enumerate(rules):
+            try:
+                compiled.append(compile_rule(index, rule))
+            except RuleError as e:
+                errors.append(str(e))
+        if errors:
+            raise RuleError("\n".join(errors))
+        self.rules = tuple(compiled)
+        self.mode = mode
+        self.unfused = []
+        self.steps = self._build_steps()
+
+    def _build_steps(self):
+        """按执行模式把规则组织为依次执行的步骤"""
+        if self.mode == MODE_SEQUENTIAL:
+            return self.rules
+
+        steps = []
+        literals = []
+        fused = []
+        fused_names = set()
+        for rule in self.rules:
+            if not rule.regex:
+                if fused:
+                    steps.extend(_fused_steps(fused))
+                    fused = []
+                literals.append(rule)
+                continue
+            if literals:
+                steps.append(_literal_step(literals))
+                literals = []
+            if self.mode != MODE_FUSED:
+                steps.append(rule)
+                continue
+
+            if not can_fuse(rule):
+                if fused:
+                    steps.extend(_fused_steps(fused))
+                    fused = []
+                self.unfused.append(rule)
+                steps.append(rule)
+                continue
+
+            # 不同规则的同名分组无法放进同一个正则，另起一组
+            names = set(rule.pattern.groupindex)
+            if names & fused_names:
+                steps.extend(_fused_steps(fused))
+                fused = []
+                fused_names = set()
+            fused.append(rule)
+            fused_names |= names
+
+        if literals:
+            steps.append(_literal_step(literals))
+        if fused:
+            steps.extend(_fused_steps(fused))
+        return tuple(steps)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def apply(self, content, log=None, profile=None, guard=None):
+        """应用所有规则，返回 (新内容, 总替换次数)
+
+        profile 不为 None 时记录每个步骤的耗时；guard 为 RegexGuard 时限制每个
+        正则步骤的运行时间，超时抛出 RegexTimeout。
+        """
+        counts = [0] * len(self.rules)
+        if profile is None and guard is None:
+            for step in self.steps:
+                content = step.substitute(content, counts)
+        else:
+            step_time = profile.step_time if profile is not None else [0.0] * len(self.steps)
+            for i, step in enumerate(self.steps):
+                start = time.perf_counter()
+                if guard is None:
+                    content = step.substitute(content, counts)
+                else:
+                    with guard.limit(step):
+                        content = step.substitute(content, counts)
+                step_time[i] += time.perf_counter() - start
+            if profile is not None:
+                profile.add_counts(counts)
+
+        if log is not None:
+            self.log_counts(counts, log)
+        return content, sum(counts)
+
+    def preview(self, content, guard=None):
+        """计算所有规则的替换而不只是结果文本，返回 (新内容, 各步骤的替换列表, 各规则的替换次数)
+
+        每个步骤的替换位置基于上一步骤的输出，replay() 按同样的顺序拼接即可
+        得到与 apply() 相同的结果，不需要再次查找。guard 的含义同 apply()。
+        """
+        counts = [0] * len(self.rules)
+        step_edits = []
+        for step in self.steps:
+            if guard is None:
+                edits = list(step.matches(content))
+            else:
+                with guard.limit(step):
+                    edits = list(step.matches(content))
+            for edit in edits:
+                counts[edit[2]] += 1
+            step_edits.append(edits)
+            content = splice(content, edits)
+        return content, step_edits, counts
+
+    def replay(self, content, step_edits):
+        """按 preview() 记录的各步骤替换重建结果，返回 (新内容, 各规则的替换次数)"""
+        counts = [0] * len(self.rules)
+        for edits in step_edits:
+            for edit in edits:
+                counts[edit[2]] += 1
+            content = splice(content, edits)
+        return content, counts
+
+    def log_counts(self, counts, log):
+        """按规则顺序输出每条规则的替换次数"""
+        for rule, count in zip(self.rules, counts):
+            if count:
+                kind = "正则规则" if rule.regex else "规则"
+                log(f"应用{kind}: {rule.alias} (替换 {count} 处)")
+
+
+def _literal_step(literals):
+    """单条字面量规则直接使用 str.replace，多条时构建自动机"""
+    if len(literals) == 1:
+        return literals[0]
+    return LiteralAutomaton(literals)
+
+
+def _fused_steps(rules):
+    """单条正则规则单独执行，多条时合并为一个 FusedRegex；合并后的正则无法编译时各自单独执行"""
+    if len(rules) == 1:
+        return rules
+    try:
+        return [FusedRegex(rules)]
+    except re.error:
+        return rules
@@ -0,0 +1,74 @@
+"""规则列表的搜索与分页：界面只显示当前页，增删规则时只更新受影响的行"""
+import bisect
+
+
+class RuleView:
+    """规则列表的过滤视图
+
+    indices 为匹配搜索条件的规则序号（升序），界面按页显示，第 page 页第 row 行
+    对应 indices[page * page_size + row]。搜索不区分大小写，匹配别名、查找内容或
+    替换内容。rules 为界面持有的规则列表本身，增删规则后调用 append / remove 同步。
+    """
+    def __init__(self, rules, page_size=200):
+        self.rules = rules
+        self.page_size = page_size
+        self.query = ""
+        self.indices = list(range(len(rules)))
+
+    def matches(self, rule):
+        """规则是否匹配当前搜索条件"""
+        query = self.query
+        return (not query or query in rule.get("alias", "").lower()
+                or query in rule.get("find", "").lower() or query in rule.get("replace", "").lower())
+
+    def search(self, query):
+        """按搜索条件重新过滤（空字符串显示全部规则）"""
+        self.query = query.strip().lower()
+        if self.query:
+            self.indices = [index for index, rule in enumerate(self.rules) if self.matches(rule)]
+        else:
+            self.indices = list(range(len(self.rules)))
+
+    def reset(self, rules):
+        """规则列表整体替换（加载、清空）后重新过滤"""
+        self.rules = rules
+        self.search(self.query)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def page_count(self):
+        """总页数（没有规则时为 1）"""
+        return max(1, (len(self.indices) + self.page_size - 1) // self.page_size)
+
+    def page_of(self, position):
+        """视图中第 position 条所在的页"""
+        return position // self.page_size
+
+    def page_indices(self, page):
+        """第 page 页（从 0 开始）显示的规则序号"""
+        start = page * self.page_size
+        return self.indices[start:start + self.page_size]
+
+    def rule_index(self, page, row):
+        """第 page 页第 row 行对应的规则序号"""
+        return self.indices[page * self.page_size + row]
+
+    def append(self, index):
+        """规则追加到列表末尾后调用，返回它在视图中的位置；不匹配搜索条件时返回 None"""
+        if not self.matches(self.rules[index]):
+            return None
+        self.indices.append(index)
+        return len(self.indices) - 1
+
+    def remove(self, index):
+        """规则 index 从列表中删除后调用，返回它原来在视图中的位置；不在视图中时返回 None"""
+        position = bisect.bisect_left(self.indices, index)
+        found = position < len(self.indices) and self.indices[position] == index
+        if found:
+            del self.indices[position]
+        # 之后的规则序号前移一位
+        indices = self.indices
+        for i in range(position, len(indices)):
+            indices[i] -= 1
+        return position if found else None
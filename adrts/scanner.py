@@ -0,0 +1,132 @@
+"""待处理文件列表的收集：单个文件、多个文件或目录扫描"""
+import os
+import re
+import fnmatch
+
+# 默认排除的目录（版本库元数据、依赖与缓存），以及写回过程中残留的临时文件
+DEFAULT_EXCLUDES = ".git,.hg,.svn,node_modules,__pycache__,*.adrts-tmp"
+
+
+def _no_log(message):
+    """默认的日志回调：丢弃消息"""
+
+
+def split_patterns(text):
+    """把逗号分隔的通配符模式拆分为列表"""
+    return [p.strip() for p in (text or "").split(',') if p.strip()]
+
+
+def compile_globs(patterns):
+    """把多个通配符模式合并为一个不区分大小写的正则，只需一次 match；没有模式时返回 None"""
+    if not patterns:
+        return None
+    return re.compile('|'.join(f'(?:{fnmatch.translate(pattern)})' for pattern in patterns),
+                      re.IGNORECASE)
+
+
+def _excluded(exclude, name, rel_path):
+    """名称或相对路径（以 / 分隔）匹配任一排除模式"""
+    return exclude is not None and (exclude.match(name) is not None
+                                    or exclude.match(rel_path) is not None)
+
+
+def iter_directory(path, include=None, exclude=None, recursive=True, log=None):
+    """用 os.scandir 遍历目录，逐个产出匹配的文件路径
+
+    include / exclude 为 compile_globs 编译的匹配器。文件与子目录的判断使用
+    目录项缓存的类型信息，不需要额外 stat；被排除的目录整个跳过，不会进入。
+    顺序与 os.walk 一致：先产出目录中的文件，再依次深入各子目录；指向目录的
+    符号链接不会被深入。无法读取的目录记录警告后跳过。
+    """
+    log = log or _no_log
+    stack = [(path, "")]
+    while stack:
+        directory, rel_dir = stack.pop()
+        subdirs = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    name = entry.name
+                    rel_path = rel_dir + name
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    if is_dir:
+                        if recursive and not entry.is_symlink() and not _excluded(exclude, name, rel_path):
+                            subdirs.append((entry.path, rel_path + "/"))
+                        continue
+                    try:
+                        if not entry.is_file():
+                            continue
+                    except OSError:
+                        continue
+                    if include is not None and include.match(name) is None:
+                        continue
+                    if _excluded(exclude, name, rel_path):
+                        continue
+                    yield entry.path
+        except OSError as e:
+            log(f"警告: 无法读取目录 - {directory} ({e.strerror})")
+        stack.extend(reversed(subdirs))
+
+
+def iter_files(mode, path, filter_text="*.*", recursive=True, log=None, exclude_text=""):
+    """根据选择模式逐个产出文件路径
+
+    mode 为 single / multiple / directory；multiple 模式下 path 为逗号分隔的路径。
+    目录模式边扫描边产出，扫描结束时记录找到的文件数，调用方可以在扫描
+    完成之前开始处理。exclude_text 为逗号分隔的排除模式（匹配文件名、目录名或
+    相对路径），被排除的目录不会被进入。
+    """
+    log = log or _no_log
+    path = path.strip()
+
+    if not path:
+        return
+
+    if mode == "single":
+        if os.path.isfile(path):
+            log(f"已选择文件: {path}")
+            yield path
+        else:
+            log(f"错误: 文件不存在 - {path}")
+
+    elif mode == "multiple":
+        file_paths = [p.strip() for p in path.split(",") if p.strip()]
+        valid_files = []
+
+        for file_path in file_paths:
+            if os.path.isfile(file_path):
+                valid_files.append(file_path)
+            else:
+                log(f"警告: 文件不存在 - {file_path}")
+
+        log(f"已选择 {len(valid_files)} 个文件")
+        yield from valid_files
+
+    elif mode == "directory":
+        if not os.path.isdir(path):
+            log(f"错误: 目录不存在 - {path}")
+            return
+
+        filter_patterns = split_patterns(filter_text) or ["*.*"]  # 默认匹配所有文件
+        exclude_patterns = split_patterns(exclude_text)
+
+        message = f"扫描目录: {path}，过滤模式: {filter_text}"
+        if exclude_patterns:
+            message += f"，排除: {exclude_text}"
+        log(message)
+
+        count = 0
+        for file_path in iter_directory(path, compile_globs(filter_patterns),
+                                        compile_globs(exclude_patterns), recursive, log):
+            count += 1
+            yield file_path
+
+        log(f"找到 {count} 个匹配的文件")
+
+
+def collect_files(mode, path, filter_text="*.*", recursive=True, log=None, exclude_text=""):
+    """根据选择模式收集完整的文件列表（参数同 iter_files）"""
+    return list(iter_files(mode, path, filter_text, recursive, log, exclude_text))
@@ -0,0 +1,184 @@
+"""流式替换：按固定大小分块读取、替换并增量写出，内存占用与文件大小无关
+
+每个规则步骤对应一个流式执行阶段，前一步骤的输出作为后一步骤的输入，
+因此 sequential / single-pass / fused 三种模式的语义与整文件替换完全一致。
+每个阶段只保留与其最长匹配跨度相当的重叠窗口，跨块的匹配不会丢失。
+正则规则需要在规则中声明 max_span（最长匹配长度，含前后断言所需的上下文），
+未声明的规则匹配长度无界，此时文件退回整文件模式。
+"""
+from .rules import CompiledRule
+from .multipattern import LiteralAutomaton
+
+# 默认每次读取的字符数
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+
+class RegexStage:
+    """正则步骤的流式执行状态：逐个匹配推进，保留左侧上下文供断言使用"""
+    __slots__ = ('pattern', 'replacer', 'span', 'buffer', 'pos', 'empty_at')
+
+    def __init__(self, pattern, replacer, span):
+        self.pattern = pattern
+        self.replacer = replacer
+        self.span = span
+        self.buffer = ""  # 左侧上下文 + 尚未输出的文本
+        self.pos = 0  # buffer 中下一次开始匹配的位置，之前的内容已输出
+        self.empty_at = -1  # 上一次空匹配的位置，续接时不能在同一位置再次空匹配
+
+    def feed(self, text, final=False):
+        """输入一段文本，返回已经可以确定的输出；final 为 True 时输出全部剩余内容"""
+        buffer = self.buffer + text
+        pos = self.pos
+        # 起点在 limit 之前的匹配完整落在 buffer 内，结果与整文件匹配相同
+        # （多留一个字符，$ 会检查结尾换行）；最后一块不设限制（包括末尾的空匹配）
+        limit = len(buffer) + 1 if final else len(buffer) - self.span - 1
+        out = []
+
+        for match in self.pattern.finditer(buffer, pos):
+            start, end = match.span()
+            if start >= limit:
+                break
+            if start == end == self.empty_at:
+                continue
+            out.append(buffer[pos:start])
+            out.append(self.replacer(match))
+            pos = end
+            self.empty_at = end if start == end else -1
+
+        if final:
+            out.append(buffer[pos:])
+            self.buffer = ""
+            self.pos = 0
+            return "".join(out)
+
+        if limit > pos:
+            out.append(buffer[pos:limit])
+            pos = limit
+            self.empty_at = -1
+
+        # 保留 span 长度的左侧上下文，供 \b、前向断言以及 ^ 的判断使用
+        keep = max(0, pos - self.span)
+        self.buffer = buffer[keep:]
+        self.pos = pos - keep
+        if self.empty_at >= 0:
+            self.empty_at -= keep
+        return "".join(out)
+
+
+class LiteralStage:
+    """字面量步骤的流式执行状态
+
+    找到一个没有任何查找文本跨越的切分点，切分点之前的内容整体交给
+    str.replace 或自动机的 re.sub 一次替换，避免逐个匹配的 Python 开销。
+    字面量匹配不依赖上下文，因此不需要保留已输出的文本。
+    """
+    __slots__ = ('straddles', 'substitute', 'span', 'buffer')
+
+    def __init__(self, straddles, substitute, span):
+        self.straddles = straddles  # straddles(buffer, 起点, cut) -> 跨越 cut 的最左匹配起点或 -1
+        self.substitute = substitute  # substitute(文本) -> 替换后的文本
+        self.span = span
+        self.buffer = ""
+
+    def feed(self, text, final=False):
+        """输入一段文本，返回已经可以确定的输出；final 为 True 时输出全部剩余内容"""
+        buffer = self.buffer + text
+        if final:
+            self.buffer = ""
+            return self.substitute(buffer)
+
+        # 跨越 cut 的匹配都完整落在 buffer 内，可以检查出来；把 cut 左移到其起点
+        cut = len(buffer) - self.span + 1
+        while cut > 0:
+            start = self.straddles(buffer, cut)
+            if start < 0:
+                break
+            cut = start
+        if cut <= 0:
+            self.buffer = buffer
+            return ""
+        self.buffer = buffer[cut:]
+        return self.substitute(buffer[:cut])
+
+
+def _literal_stage(rule, counts):
+    """单条字面量规则：str.count + str.replace"""
+    find_text = rule.find
+    replace_text = rule.replace
+    index = rule.index
+    length = len(find_text)
+
+    def straddles(buffer, cut):
+        return buffer.find(find_text, max(0, cut - length + 1), cut + length - 1)
+
+    def substitute(text):
+        count = text.count(find_text)
+        if not count:
+            return text
+        counts[index] += count
+        return text.replace(find_text, replace_text)
+
+    return LiteralStage(straddles, substitute, length)
+
+
+def _automaton_stage(automaton, counts):
+    """多条字面量规则合并的自动机：切分点之前整体 re.sub"""
+    pattern = automaton.pattern
+    span = automaton.span
+    replacer = automaton.replacer(counts)
+
+    def straddles(buffer, cut):
+        # 自动机在每个位置取最长匹配，只需检查每个起点的最长匹配是否越过 cut
+        for start in range(max(0, cut - span + 1), cut):
+            match = pattern.match(buffer, start)
+            if match and match.end() > cut:
+                return start
+        return -1
+
+    def substitute(text):
+        return pattern.sub(replacer, text)
+
+    return LiteralStage(straddles, substitute, span)
+
+
+def _stage_for(step, counts):
+    """为规则步骤创建流式执行阶段"""
+    if isinstance(step, LiteralAutomaton):
+        return _automaton_stage(step, counts)
+    if isinstance(step, CompiledRule) and not step.regex:
+        return _literal_stage(step, counts)
+    return RegexStage(step.pattern, step.replacer(counts), step.span)
+
+
+def is_streamable(rule_set):
+    """规则集的每个步骤是否都有确定的最长匹配跨度"""
+    return all(step.span is not None for step in rule_set.steps)
+
+
+def unbounded_rules(rule_set):
+    """未声明 max_span 的正则规则"""
+    return [rule for rule in rule_set.rules if rule.span is None]
+
+
+def stream_replace(rule_set, source, target, chunk_size=DEFAULT_CHUNK_SIZE, guard=None):
+    """从文本文件对象 source 分块读取，替换后写入 target，返回每条规则的替换次数
+
+    guard 为 RegexGuard 时，每个正则步骤在各块上的运行时间累计计入时间限制。
+    """
+    counts = [0] * len(rule_set.rules)
+    stages = [_stage_for(step, counts) for step in rule_set.steps]
+    limits = [guard.limit(step) if guard is not None else None for step in rule_set.steps]
+
+    while True:
+        text = source.read(chunk_size)
+        final = not text
+        for stage, limit in zip(stages, limits):
+            if limit is None:
+                text = stage.feed(text, final)
+            else:
+                with limit:
+                    text = stage.feed(text, final)
+        if text:
+            target.write(text)
+        if final:
+            return counts
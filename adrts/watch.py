@@ -0,0 +1,284 @@
+"""监视模式：持续监视目录，新增或修改的文件在写入平静下来之后交给替换引擎处理
+
+Linux 上通过 inotify（ctypes 调用 libc，不需要额外依赖，开始监视时才导入）接收目录事件；其他平台、
+inotify 不可用或监视数超过系统上限时，退回按大小和修改时间轮询（只做 scandir
+和 stat，不读取文件）。同一文件的一串变化在 delay 秒内没有新的变化后才处理一次。
+
+处理结果记入运行清单（未指定时使用内存中的清单）：文件写回后的大小和修改时间
+被记录下来，写回本身产生的事件对应的文件“未变化”，不会被再次处理。
+"""
+import os
+import sys
+import time
+import errno
+import select
+import struct
+
+from .engine import JobResult
+from .fileio import TEMP_SUFFIX
+from .manifest import RunManifest
+from .scanner import compile_globs, split_patterns, iter_directory, _excluded
+
+# 文件最后一次变化后等待的秒数（防抖）
+DEFAULT_WATCH_DELAY = 1.0
+# 轮询模式下两次扫描之间的秒数
+DEFAULT_POLL_INTERVAL = 2.0
+# 等待事件时最长阻塞的秒数，之后检查是否需要停止
+_TICK = 0.5
+
+
+def _no_log(message):
+    """默认的日志回调：丢弃消息"""
+
+
+class _Matcher:
+    """按目录模式的过滤和排除规则判断文件与子目录（与 iter_directory 一致）"""
+    __slots__ = ('root', 'include', 'exclude', 'recursive')
+
+    def __init__(self, root, filter_text, recursive, exclude_text):
+        self.root = root
+        self.include = compile_globs(split_patterns(filter_text) or ["*.*"])
+        self.exclude = compile_globs(split_patterns(exclude_text))
+        self.recursive = recursive
+
+    def relative(self, path):
+        """相对根目录的路径（以 / 分隔）"""
+        return os.path.relpath(path, self.root).replace(os.sep, '/')
+
+    def wants_file(self, path):
+        name = os.path.basename(path)
+        # 写回过程中的临时文件总是忽略
+        if name.endswith(TEMP_SUFFIX) or self.include.match(name) is None:
+            return False
+        return not _excluded(self.exclude, name, self.relative(path))
+
+    def wants_directory(self, path):
+        return self.recursive and not _excluded(self.exclude, os.path.basename(path), self.relative(path))
+
+    def scan(self):
+        """逐个产出根目录中匹配的文件"""
+        for file_path in iter_directory(self.root, self.include, self.exclude, self.recursive):
+            if not file_path.endswith(TEMP_SUFFIX):
+                yield file_path
+
+
+class InotifyWatcher:
+    """Linux inotify：为根目录和每个子目录添加监视，读取文件变化事件"""
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+    settle = 0.0  # 事件实时到达，不需要额外等待
+
+    def __init__(self, matcher, log=None):
+        self.matcher = matcher
+        self.log = log or _no_log
+        import ctypes
+        import ctypes.util
+        self.ctypes = ctypes
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code))
+        self.watches = {}  # 监视描述符 -> 目录路径
+        try:
+            self._add_tree(matcher.root, initial=True)
+        except OSError:
+            self.close()
+            raise
+
+    def _add_tree(self, directory, initial=False):
+        """监视 directory 及其全部子目录（被排除的除外），返回其中已有的匹配文件
+
+        新建或移入的目录在添加监视之前就可能已经有文件写入，因此同时返回这些文件。
+        initial 为 True 时（启动时）不收集文件，达到监视数上限等错误直接抛出，由调用方
+        退回轮询。
+        """
+        files = []
+        stack = [directory]
+        while stack:
+            current = stack.pop()
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(current), self.MASK)
+            if wd < 0:
+                code = self.ctypes.get_errno()
+                if initial:
+                    raise OSError(code, f"无法监视目录 {current} - {os.strerror(code)}")
+                self.log(f"警告: 无法监视目录 - {current} ({os.strerror(code)})")
+                continue
+            # 目录改名后再次添加会得到同一个描述符，更新为新路径
+            self.watches[wd] = current
+            try:
+                with os.scandir(current) as entries:
+                    for entry in entries:
+                        try:
+                            is_dir = entry.is_dir(follow_symlinks=False)
+                        except OSError:
+                            continue
+                        if is_dir:
+                            if self.matcher.wants_directory(entry.path):
+                                stack.append(entry.path)
+                        elif not initial and self.matcher.wants_file(entry.path):
+                            files.append(entry.path)
+            except OSError as e:
+                self.log(f"警告: 无法读取目录 - {current} ({e.strerror})")
+        return files
+
+    def changes(self, timeout):
+        """等待最多 timeout 秒，返回这段时间内变化的文件路径集合"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = struct.unpack_from('iIII', data, offset)
+                name = data[offset + 16:offset + 16 + length].rstrip(b'\0')
+                offset += 16 + length
+                if mask & self.IN_Q_OVERFLOW:
+                    # 事件队列溢出，丢失的事件无法恢复，重新扫描整个目录
+                    self.log("监视: 事件过多，重新扫描目录")
+                    changed.update(self.matcher.scan())
+                    continue
+                if mask & self.IN_IGNORED:
+                    self.watches.pop(wd, None)
+                    continue
+                directory = self.watches.get(wd)
+                if directory is None or not name:
+                    continue
+                path = os.path.join(directory, os.fsdecode(name))
+                if mask & self.IN_ISDIR:
+                    if mask & (self.IN_CREATE | self.IN_MOVED_TO) and self.matcher.wants_directory(path):
+                        changed.update(self._add_tree(path))
+                elif self.matcher.wants_file(path):
+                    changed.add(path)
+        return changed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollingWatcher:
+    """轮询：每隔 interval 秒扫描一次目录，比较文件的大小和修改时间"""
+    def __init__(self, matcher, interval=DEFAULT_POLL_INTERVAL):
+        self.matcher = matcher
+        self.interval = interval
+        # 两次扫描之间看不到变化：发现变化后至少再扫描一次、确认没有新的变化才算写完
+        self.settle = interval * 1.5
+        self.snapshot = self._scan()
+        self.next_scan = time.monotonic() + interval
+
+    def _scan(self):
+        """匹配文件的路径 -> (大小, 修改时间)"""
+        snapshot = {}
+        for file_path in self.matcher.scan():
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            snapshot[file_path] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def changes(self, timeout):
+        """等待最多 timeout 秒；到了扫描时间时扫描目录，返回新增或变化的文件路径集合"""
+        wait = self.next_scan - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return set()
+        if wait > 0:
+            time.sleep(wait)
+        previous, self.snapshot = self.snapshot, self._scan()
+        self.next_scan = time.monotonic() + self.interval
+        return {path for path, signature in self.snapshot.items() if previous.get(path) != signature}
+
+    def close(self):
+        pass
+
+
+def inotify_supported():
+    """当前平台是否可以使用 inotify"""
+    return sys.platform.startswith('linux')
+
+
+def create_watcher(matcher, poll_interval=DEFAULT_POLL_INTERVAL, polling=False, log=None):
+    """创建目录监视器：优先使用 inotify，不可用时退回轮询"""
+    log = log or _no_log
+    if not polling and inotify_supported():
+        try:
+            return InotifyWatcher(matcher, log)
+        except (OSError, AttributeError) as e:
+            log(f"警告: 无法使用 inotify 监视目录，改为轮询 - {str(e)}")
+    return PollingWatcher(matcher, poll_interval)
+
+
+def watch_directory(engine, root, filter_text="*.*", recursive=True, exclude_text="", workers=1,
+                    file_list=None, on_progress=None, stop_event=None, delay=DEFAULT_WATCH_DELAY,
+                    poll_interval=DEFAULT_POLL_INTERVAL, polling=False):
+    """持续监视目录 root，处理其中新增或修改的文件，停止后返回累计的 JobResult
+
+    filter_text / recursive / exclude_text 与目录模式的扫描参数相同。file_list 为
+    开始监视后先完整处理一遍的文件（通常是目录扫描的结果），为 None 时只处理之后
+    变化的文件。每批文件由 engine.run 处理（workers、on_progress 同 run）。
+    文件最后一次变化 delay 秒后才处理；poll_interval / polling 为轮询间隔和是否强制轮询。
+    stop_event 被设置或收到 KeyboardInterrupt 后，当前文件处理完成即停止。
+    引擎没有运行清单时创建一个内存中的清单，用来识别写回自身引起的变化。
+    """
+    log = engine.log
+    if engine.manifest is None:
+        engine.manifest = RunManifest(':memory:', engine.fingerprint())
+    manifest = engine.manifest
+    matcher = _Matcher(root, filter_text, recursive, exclude_text)
+    # 先开始监视再做初始处理，处理期间发生的变化不会遗漏
+    watcher = create_watcher(matcher, poll_interval, polling, log)
+    total = JobResult()
+    total.profile = engine.profile
+    try:
+        if file_list is not None:
+            total.merge(engine.run(file_list, on_progress, workers, stop_event))
+
+        if isinstance(watcher, InotifyWatcher):
+            log(f"开始监视目录 (inotify): {root}")
+        else:
+            log(f"开始监视目录 (每 {watcher.interval:g} 秒轮询): {root}")
+        settle = max(delay, watcher.settle)
+        pending = {}  # 路径 -> 最后一次变化的时间
+        while stop_event is None or not stop_event.is_set():
+            timeout = _TICK
+            if pending:
+                timeout = min(timeout, max(0.0, min(pending.values()) + settle - time.monotonic()))
+            changed = watcher.changes(timeout)
+            now = time.monotonic()
+            for file_path in changed:
+                pending[file_path] = now
+
+            ready = sorted(path for path, changed_at in pending.items() if now - changed_at >= settle)
+            for file_path in ready:
+                del pending[file_path]
+            # 已删除的文件和写回后没有再变化的文件（包括本工具的写回）不处理
+            batch = [path for path in ready if os.path.isfile(path) and not manifest.is_unchanged(path)]
+            if not batch:
+                continue
+            log(f"\n监视: {len(batch)} 个文件新增或已修改")
+            total.merge(engine.run(batch, on_progress, workers, stop_event))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+    log("监视已停止")
+    return total
@@ -0,0 +1,306 @@
+"""替换流水线基准测试：生成可复现的合成语料，按参数化的规则集运行，结果输出为 JSON
+
+用法示例：
+    python benchmarks/bench_pipeline.py --out before.json
+    python benchmarks/bench_pipeline.py --corpus small,mixed --rules literal-1k --scale 0.2
+    python benchmarks/bench_pipeline.py --out after.json --compare before.json
+
+每个用例在独立的子进程中运行，峰值内存（RSS）只反映该用例；每次运行都处理
+语料的一份新副本，复制时间不计入结果。
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from adrts.engine import ReplaceEngine  # noqa: E402
+from adrts.rules import RuleSet, RULE_MODES, MODE_SEQUENTIAL  # noqa: E402
+from adrts.scanner import collect_files  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块，不报告峰值内存
+    resource = None
+
+SEED = 20240501
+
+# 语料中使用的词表：中英文混合，保证各规则集都有命中
+WORDS = ["alpha", "beta", "gamma", "delta", "omega", "foo", "bar", "baz", "hello", "world",
+         "2024-05-01", "v1.2.3", "user@example.com", "TODO", "FIXME",
+         "中文", "替换", "测试", "文件", "规则", "编码"]
+
+
+def _text(rng, size):
+    """生成约 size 个字符的随机文本，每行 10 个词"""
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS) if rng.random() < 0.7 else f"w{rng.randrange(100000)}"
+        words.append(word)
+        length += len(word) + 1
+    lines = [" ".join(words[i:i + 10]) for i in range(0, len(words), 10)]
+    return "\n".join(lines) + "\n"
+
+
+def _write(path, text, encoding):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding=encoding, newline='') as f:
+        f.write(text)
+
+
+def gen_small(root, rng, scale):
+    """大量小文件：每个约 4 KB"""
+    for i in range(int(2000 * scale) or 1):
+        _write(os.path.join(root, f"d{i % 20}", f"f{i}.txt"), _text(rng, 4096), 'utf-8')
+
+
+def gen_huge(root, rng, scale):
+    """少量大文件：每个约 32 MB（超过默认流式阈值时按块处理）"""
+    block = _text(rng, 1024 * 1024)
+    for i in range(2):
+        path = os.path.join(root, f"huge{i}.txt")
+        os.makedirs(root, exist_ok=True)
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            for _ in range(max(1, int(32 * scale))):
+                f.write(block)
+
+
+def gen_mixed(root, rng, scale):
+    """混合编码：UTF-8、带 BOM 的 UTF-8 和 GBK 各占三分之一"""
+    encodings = ['utf-8', 'utf-8-sig', 'gbk']
+    for i in range(int(600 * scale) or 1):
+        encoding = encodings[i % 3]
+        _write(os.path.join(root, encoding, f"f{i}.txt"), _text(rng, 8192), encoding)
+
+
+def gen_deep(root, rng, scale):
+    """深层目录树：深度 12、每层 3 个分支，叶子目录中放少量文件和不匹配过滤的文件"""
+    depth = 12 if scale >= 1 else max(3, int(12 * scale))
+
+    def build(path, level, budget):
+        if level == depth or budget[0] <= 0:
+            return
+        for name in range(3):
+            child = os.path.join(path, f"n{name}")
+            _write(os.path.join(child, "a.txt"), _text(rng, 1024), 'utf-8')
+            _write(os.path.join(child, "skip.bin"), "x", 'utf-8')
+            budget[0] -= 1
+            build(child, level + 1, budget)
+
+    build(root, 0, [int(3000 * scale) or 1])
+
+
+CORPORA = {
+    'small': gen_small,
+    'huge': gen_huge,
+    'mixed': gen_mixed,
+    'deep': gen_deep,
+}
+
+
+def literal_rules(count):
+    """count 条字面量规则：前几条命中词表，其余为不会出现的随机词"""
+    rng = random.Random(SEED + count)
+    rules = [{"alias": f"l{i}", "find": word, "replace": word.upper()}
+             for i, word in enumerate(WORDS[:min(count, len(WORDS))])]
+    while len(rules) < count:
+        rules.append({"alias": f"l{len(rules)}", "find": f"zz{rng.randrange(10 ** 9)}", "replace": "x"})
+    return rules
+
+
+def regex_rules():
+    """正则为主的规则集：分组引用、字符类和断言"""
+    return [
+        {"alias": "date", "find": r"(\d{4})-(\d{2})-(\d{2})", "replace": r"\3/\2/\1", "regex": True, "max_span": 10},
+        {"alias": "ver", "find": r"v(\d+)\.(\d+)\.(\d+)", "replace": r"version \1.\2", "regex": True, "max_span": 40},
+        {"alias": "mail", "find": r"[\w.]+@[\w.]+\.com", "replace": "<mail>", "regex": True, "max_span": 80},
+        {"alias": "word", "find": r"\bw(\d{3})\b", "replace": r"W\1", "regex": True, "max_span": 6},
+        {"alias": "todo", "find": r"(?:TODO|FIXME)", "replace": "NOTE", "regex": True, "max_span": 5},
+        {"alias": "han", "find": r"中文|测试", "replace": "汉字", "regex": True, "max_span": 2},
+        {"alias": "greek", "find": r"(alpha|beta|gamma) (\w+)", "replace": r"\2 \1", "regex": True,
+         "max_span": 200},
+    ]
+
+
+def chained_rules():
+    """链式规则：每条规则的输出是下一条规则的输入"""
+    chain = ["foo", "c1", "c2", "c3", "c4", "c5", "c6", "c7", "c8", "c9", "done"]
+    return [{"alias": f"c{i}", "find": a, "replace": b} for i, (a, b) in enumerate(zip(chain, chain[1:]))]
+
+
+RULE_SETS = {
+    'literal-10': lambda: literal_rules(10),
+    'literal-1k': lambda: literal_rules(1000),
+    'literal-10k': lambda: literal_rules(10000),
+    'regex': regex_rules,
+    'chained': chained_rules,
+}
+
+
+def corpus_dir(base, name, scale):
+    """生成（或复用已生成的）语料目录"""
+    path = os.path.join(base, f"corpus-{name}-{scale:g}")
+    if not os.path.isdir(path):
+        temp = path + ".tmp"
+        shutil.rmtree(temp, ignore_errors=True)
+        CORPORA[name](temp, random.Random(f"{SEED}-{name}"), scale)
+        os.replace(temp, path)
+    return path
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def run_case(corpus_path, rules_name, mode, workers, read_encoding, work_dir):
+    """在当前进程中运行一个用例，返回结果字典"""
+    target = os.path.join(work_dir, "work")
+    shutil.rmtree(target, ignore_errors=True)
+    shutil.copytree(corpus_path, target)
+
+    phases = {}
+    start = time.perf_counter()
+    rules = RULE_SETS[rules_name]()
+    rule_set = RuleSet(rules, mode)
+    engine = ReplaceEngine(rule_set, read_encoding=read_encoding)
+    phases['compile'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    file_list = collect_files("directory", target, "*.txt")
+    phases['scan'] = time.perf_counter() - start
+
+    total_bytes = sum(os.path.getsize(path) for path in file_list)
+
+    start = time.perf_counter()
+    result = engine.run(file_list, workers=workers)
+    phases['process'] = time.perf_counter() - start
+    engine.cleanup()
+
+    seconds = sum(phases.values())
+    process = phases['process'] or 1e-9
+    return {
+        'files': len(file_list),
+        'bytes': total_bytes,
+        'failed': result.failed_count,
+        'skipped': result.skipped_count,
+        'seconds': round(seconds, 4),
+        'files_per_s': round(len(file_list) / process, 1),
+        'mb_per_s': round(total_bytes / 1024 / 1024 / process, 2),
+        'peak_rss_mb': _peak_rss_mb(),
+        'phases': {name: round(value, 4) for name, value in phases.items()},
+    }
+
+
+def _metadata(args):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'scale': args.scale,
+        'seed': SEED,
+    }
+
+
+def _case_key(case):
+    return (case['corpus'], case['rules'], case['mode'], case['workers'])
+
+
+def compare(results, baseline_path):
+    """与基线结果比较，输出每个用例的耗时与吞吐量变化"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {_case_key(case): case for case in json.load(f)['results']}
+    print(f"\n{'用例':<44}{'耗时(s)':>18}{'MB/s':>18}")
+    for case in results:
+        old = baseline.get(_case_key(case))
+        name = "/".join(str(part) for part in _case_key(case))
+        if old is None or 'error' in case or 'error' in old:
+            print(f"{name:<44}{'-':>18}{'-':>18}")
+            continue
+        ratio = old['seconds'] / case['seconds'] if case['seconds'] else float('inf')
+        print(f"{name:<44}{old['seconds']:>8.3f}->{case['seconds']:<8.3f}"
+              f"{old['mb_per_s']:>8.1f}->{case['mb_per_s']:<8.1f} x{ratio:.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Adrts 替换流水线基准测试")
+    parser.add_argument("--corpus", default=",".join(CORPORA),
+                        help=f"语料，逗号分隔（可选 {', '.join(CORPORA)}）")
+    parser.add_argument("--rules", default=",".join(RULE_SETS),
+                        help=f"规则集，逗号分隔（可选 {', '.join(RULE_SETS)}）")
+    parser.add_argument("--mode", default=MODE_SEQUENTIAL,
+                        help=f"规则模式，逗号分隔（可选 {', '.join(RULE_MODES)}）")
+    parser.add_argument("--workers", default="1", help="工作进程数，逗号分隔（默认 1）")
+    parser.add_argument("--read-encoding", default="try-all", help="读取编码（默认 try-all）")
+    parser.add_argument("--scale", type=float, default=1.0, help="语料规模系数（默认 1.0）")
+    parser.add_argument("--dir", default=os.path.join(tempfile.gettempdir(), "adrts-bench"),
+                        help="语料与工作目录（已生成的语料会被复用）")
+    parser.add_argument("--out", help="结果 JSON 文件（默认输出到标准输出）")
+    parser.add_argument("--compare", metavar="BASELINE", help="与之前的结果 JSON 比较")
+    parser.add_argument("--case", help=argparse.SUPPRESS)  # 子进程内部使用
+    args = parser.parse_args(argv)
+
+    if args.case:
+        corpus_path, rules_name, mode, workers = json.loads(args.case)
+        case = run_case(corpus_path, rules_name, mode, workers, args.read_encoding, args.dir)
+        print(json.dumps(case))
+        return 0
+
+    os.makedirs(args.dir, exist_ok=True)
+    results = []
+    for corpus in args.corpus.split(","):
+        corpus_path = corpus_dir(args.dir, corpus, args.scale)
+        for rules_name in args.rules.split(","):
+            for mode in args.mode.split(","):
+                for workers in (int(w) for w in args.workers.split(",")):
+                    case = {'corpus': corpus, 'rules': rules_name, 'mode': mode, 'workers': workers}
+                    work_dir = tempfile.mkdtemp(dir=args.dir)
+                    spec = json.dumps([corpus_path, rules_name, mode, workers])
+                    proc = subprocess.run(
+                        [sys.executable, os.path.abspath(__file__), "--case", spec,
+                         "--read-encoding", args.read_encoding, "--dir", work_dir],
+                        capture_output=True, text=True, encoding='utf-8')
+                    shutil.rmtree(work_dir, ignore_errors=True)
+                    if proc.returncode == 0:
+                        case.update(json.loads(proc.stdout.strip().splitlines()[-1]))
+                    else:
+                        case['error'] = proc.stderr.strip().splitlines()[-1:]
+                    results.append(case)
+                    print(f"{corpus}/{rules_name}/{mode}/j{workers}: "
+                          + (f"{case['seconds']}s, {case['files_per_s']} 文件/s, {case['mb_per_s']} MB/s"
+                             if 'error' not in case else f"出错 {case['error']}"),
+                          file=sys.stderr)
+
+    report = {'meta': _metadata(args), 'results': results}
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+"""启动时间基准测试：在全新的子进程中反复启动命令行和引擎，结果输出为 JSON
+
+用法示例：
+    python benchmarks/bench_startup.py --out before.json
+    python benchmarks/bench_startup.py --out after.json --compare before.json --check
+
+每个用例重复运行 --repeat 次，报告最短和中位耗时（毫秒）。另外用 -X importtime
+运行一次，记录加载的模块数；加载了用例不应加载的模块（Tk 界面、多进程、线程池、
+SQLite、ctypes 等），或在临时目录中留下了文件时，--check 以非零状态退出。
+"""
+import os
+import sys
+import json
+import time
+import glob
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GUI_SCRIPT = (glob.glob(os.path.join(ROOT, "Adrts*.py")) or [None])[0]
+
+# 无界面使用时不应加载的模块
+GUI_MODULES = ("tkinter",)
+# 只在对应功能启用时才需要的模块
+LAZY_MODULES = ("multiprocessing", "concurrent.futures", "sqlite3", "ctypes", "logging")
+
+RULES = [{"alias": "r", "find": "hello", "replace": "HELLO"}]
+SAMPLE = "hello world\n" * 200
+
+
+def cases(work_dir):
+    """用例名 -> (命令行参数, 不应加载的模块)"""
+    rules = os.path.join(work_dir, "rules.json")
+    target = os.path.join(work_dir, "sample.txt")
+    headless = GUI_MODULES + LAZY_MODULES
+    result = {
+        'python': (["-c", "pass"], ()),
+        'import-adrts': (["-c", "import adrts"], headless),
+        'import-cli': (["-c", "import adrts.cli"], headless),
+        'cli-help': (["-m", "adrts", "--help"], headless),
+        'cli-one-file': (["-m", "adrts", rules, target], headless),
+        'cli-dry-run': (["-m", "adrts", rules, target, "--dry-run"], headless),
+    }
+    if GUI_SCRIPT is not None:
+        # 带参数运行界面脚本时作为命令行工具使用，同样不应加载 Tk
+        result['script-one-file'] = ([GUI_SCRIPT, rules, target], headless)
+    return result
+
+
+def _prepare(work_dir):
+    with open(os.path.join(work_dir, "rules.json"), 'w', encoding='utf-8') as f:
+        json.dump(RULES, f)
+    with open(os.path.join(work_dir, "sample.txt"), 'w', encoding='utf-8') as f:
+        f.write(SAMPLE)
+
+
+def _env(temp_dir, cache_dir):
+    """子进程的环境：使用独立的临时目录和缓存目录，运行后检查临时目录是否为空"""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = ROOT + os.pathsep + env.get('PYTHONPATH', '')
+    for name in ('TMPDIR', 'TEMP', 'TMP'):
+        env[name] = temp_dir
+    env['ADRTS_CACHE_DIR'] = cache_dir
+    env['PYTHONIOENCODING'] = 'utf-8'
+    return env
+
+
+def _loaded_modules(stderr):
+    """解析 -X importtime 的输出，返回加载的模块名集合"""
+    modules = set()
+    for line in stderr.splitlines():
+        if line.startswith("import time:") and line.count("|") == 2:
+            name = line.rsplit("|", 1)[1].strip()
+            if name != "imported package":
+                modules.add(name)
+    return modules
+
+
+def run_case(name, args, forbidden, repeat, work_dir):
+    """运行一个用例，返回结果字典"""
+    temp_dir = tempfile.mkdtemp(dir=work_dir, prefix="tmp-")
+    env = _env(temp_dir, os.path.join(work_dir, "cache"))
+    command = [sys.executable] + args
+    times = []
+    for _ in range(repeat):
+        _prepare(work_dir)
+        start = time.perf_counter()
+        proc = subprocess.run(command, capture_output=True, env=env, cwd=work_dir)
+        times.append(time.perf_counter() - start)
+        if proc.returncode != 0:
+            return {'error': proc.stderr.decode('utf-8', 'replace').strip().splitlines()[-1:]}
+
+    _prepare(work_dir)
+    proc = subprocess.run([sys.executable, "-X", "importtime"] + args, capture_output=True, env=env,
+                          cwd=work_dir)
+    modules = _loaded_modules(proc.stderr.decode('utf-8', 'replace'))
+    unexpected = sorted(module for module in forbidden if module in modules)
+    leftovers = sorted(os.listdir(temp_dir))
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    return {
+        'min_ms': round(min(times) * 1000, 1),
+        'median_ms': round(statistics.median(times) * 1000, 1),
+        'modules': len(modules),
+        'unexpected_modules': unexpected,
+        'temp_files': leftovers,
+    }
+
+
+def _metadata(args):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=ROOT).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+    }
+
+
+def compare(results, baseline_path, tolerance):
+    """与基线结果比较中位耗时，返回超过容差变慢的用例名列表"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)['results']
+    slower = []
+    print(f"\n{'用例':<20}{'中位耗时(ms)':>24}")
+    for name, case in results.items():
+        old = baseline.get(name)
+        if old is None or 'error' in case or 'error' in old:
+            print(f"{name:<20}{'-':>24}")
+            continue
+        ratio = case['median_ms'] / old['median_ms'] if old['median_ms'] else 1.0
+        print(f"{name:<20}{old['median_ms']:>10.1f}->{case['median_ms']:<10.1f} x{ratio:.2f}")
+        if ratio > 1 + tolerance:
+            slower.append(name)
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Adrts 启动时间基准测试")
+    parser.add_argument("--cases", help="用例，逗号分隔（默认全部）")
+    parser.add_argument("--repeat", type=int, default=15, help="每个用例的运行次数（默认 15）")
+    parser.add_argument("--out", help="结果 JSON 文件（默认输出到标准输出）")
+    parser.add_argument("--compare", metavar="BASELINE", help="与之前的结果 JSON 比较")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="与基线比较时允许变慢的比例（默认 0.25）")
+    parser.add_argument("--check", action="store_true",
+                        help="加载了不应加载的模块、留下临时文件、出错或超过容差变慢时以非零状态退出")
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="adrts-startup-")
+    try:
+        all_cases = cases(work_dir)
+        names = args.cases.split(",") if args.cases else list(all_cases)
+        results = {}
+        for name in names:
+            command, forbidden = all_cases[name]
+            case = run_case(name, command, forbidden, max(1, args.repeat), work_dir)
+            results[name] = case
+            if 'error' in case:
+                print(f"{name}: 出错 {case['error']}", file=sys.stderr)
+                continue
+            extra = ""
+            if case['unexpected_modules']:
+                extra += f"，加载了 {', '.join(case['unexpected_modules'])}"
+            if case['temp_files']:
+                extra += f"，留下临时文件 {', '.join(case['temp_files'])}"
+            print(f"{name}: 中位 {case['median_ms']} ms，最短 {case['min_ms']} ms，"
+                  f"{case['modules']} 个模块{extra}", file=sys.stderr)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {'meta': _metadata(args), 'results': results}
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+
+    failed = [name for name, case in results.items()
+              if 'error' in case or case['unexpected_modules'] or case['temp_files']]
+    if args.compare:
+        failed += compare(results, args.compare, args.tolerance)
+    if args.check and failed:
+        print(f"\n检查未通过: {', '.join(sorted(set(failed)))}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,47 @@
+"""规则检查的回归测试：标记为可删除的规则，删除后替换结果必须不变"""
+import pytest
+
+from adrts.analysis import analyze_rules, DUPLICATE, CONFLICT
+from adrts.rules import RuleSet, MODE_SEQUENTIAL, MODE_SINGLE_PASS
+
+
+def _apply(rules, content, mode):
+    return RuleSet(rules, mode).apply(content)[0]
+
+
+def _issue(rules, mode=MODE_SEQUENTIAL):
+    issues = analyze_rules(RuleSet(rules, mode))
+    assert len(issues) == 1
+    return issues[0]
+
+
+@pytest.mark.parametrize('rules, content', [
+    ([{'find': 'ab', 'replace': ''}, {'find': 'ab', 'replace': ''}], 'aabb'),
+    ([{'find': 'ab', 'replace': 'a'}, {'find': 'ab', 'replace': 'x'}], 'aabb'),
+    ([{'find': 'aXb', 'replace': 'X'}, {'find': 'aXb', 'replace': 'X'}], 'aaXbb'),
+    ([{'find': 'ab', 'replace': 'b'}, {'find': 'ab', 'replace': 'b'}], 'aab'),
+])
+def test_recurring_duplicate_is_only_a_hint(rules, content):
+    issue = _issue(rules)
+    assert issue.kind in (DUPLICATE, CONFLICT)
+    assert not issue.removable
+    # 删除后结果确实会变化
+    assert _apply(rules, content, MODE_SEQUENTIAL) != _apply(rules[:1], content, MODE_SEQUENTIAL)
+
+
+@pytest.mark.parametrize('rules, mode', [
+    ([{'find': 'ab', 'replace': 'x'}, {'find': 'ab', 'replace': 'x'}], MODE_SEQUENTIAL),
+    ([{'find': 'a', 'replace': ''}, {'find': 'a', 'replace': 'y'}], MODE_SEQUENTIAL),
+    ([{'find': 'ab', 'replace': ''}, {'find': 'ab', 'replace': ''}], MODE_SINGLE_PASS),
+])
+def test_exact_duplicate_is_removable(rules, mode):
+    issue = _issue(rules, mode)
+    assert issue.removable
+    for content in ('aabb', 'abab', 'xaabbx', 'aaab'):
+        assert _apply(rules, content, mode) == _apply(rules[:1], content, mode)
+
+
+def test_recurring_output_of_rule_between():
+    rules = [{'find': 'ab', 'replace': 'x'}, {'find': 'c', 'replace': 'a'}, {'find': 'ab', 'replace': 'x'}]
+    issues = [issue for issue in analyze_rules(RuleSet(rules)) if issue.index == 2]
+    assert issues and not any(issue.removable for issue in issues)
@@ -0,0 +1,45 @@
+"""字节模式的回归测试：结果必须与解码后按文本替换完全相同"""
+import pytest
+
+from adrts.bytesmode import ByteRuleSet
+from adrts.engine import ReplaceEngine
+from adrts.rules import RuleSet
+
+RULE_SETS = [
+    # 前面的规则插入非 ASCII 文本，后面的 \w 在字节上只匹配 ASCII 字母
+    [{'find': 'a', 'replace': 'é'}, {'find': r'\w+', 'replace': r'[\g<0>]', 'regex': True}],
+    [{'find': 'a', 'replace': 'é', 'regex': True}, {'find': r'\b', 'replace': '|', 'regex': True}],
+    [{'find': 'a', 'replace': 'é'}, {'find': 'É', 'replace': 'E', 'regex': True},
+     {'find': '(?i)é', 'replace': 'e', 'regex': True}],
+    [{'find': 'a', 'replace': 'b'}, {'find': r'\w+', 'replace': r'[\g<0>]', 'regex': True}],
+]
+
+
+def _run(tmp_path, rules, content, bytes_mode):
+    target = tmp_path / f'{bytes_mode}.txt'
+    target.write_text(content, encoding='utf-8')
+    engine = ReplaceEngine(rules, 'utf-8', 'utf-8', bytes_mode=bytes_mode)
+    result = engine.run([str(target)])
+    assert result.failed_count == 0
+    return target.read_text(encoding='utf-8')
+
+
+@pytest.mark.parametrize('rules', RULE_SETS)
+@pytest.mark.parametrize('content', ['abc abd', 'abc é abd'])
+def test_bytes_mode_matches_text_mode(tmp_path, rules, content):
+    assert _run(tmp_path, rules, content, True) == _run(tmp_path, rules, content, False)
+
+
+def test_non_ascii_insertion_disables_ascii_bytes_mode():
+    rules = RULE_SETS[0]
+    assert not ByteRuleSet(RuleSet(rules)).ascii_ok
+    assert ByteRuleSet(RuleSet(RULE_SETS[3])).ascii_ok
+
+
+@pytest.mark.parametrize('find', [r'x*', r'b?', r'(?!a)'])
+@pytest.mark.parametrize('content', ['中b', 'a中文b'])
+def test_empty_match_on_non_ascii(tmp_path, find, content):
+    # 能匹配空串的字节正则会落在多字节字符内部，写出非法的 UTF-8
+    rules = [{'find': find, 'replace': '-', 'regex': True}]
+    assert not ByteRuleSet(RuleSet(rules)).utf8_ok
+    assert _run(tmp_path, rules, content, True) == _run(tmp_path, rules, content, False)
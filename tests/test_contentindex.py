@@ -0,0 +1,33 @@
+"""内容索引的回归测试：索引查询与预筛选使用相同的必需字面量，不能排除实际匹配的文件"""
+import pytest
+
+from adrts.contentindex import ContentIndex, build_query
+from adrts.engine import ReplaceEngine
+from adrts.rules import RuleSet
+
+
+@pytest.mark.parametrize('find, content, output', [
+    (r'\x41BCD', 'xx ABCD xx', 'xx Q xx'),
+    (r'ABCD', 'xx ABCD xx', 'xx Q xx'),
+    (r'\N{LATIN SMALL LETTER A}bcd', 'xx abcd xx', 'xx Q xx'),
+])
+def test_index_does_not_exclude_matching_file(tmp_path, find, content, output):
+    rules = [{'find': find, 'replace': 'Q', 'regex': True}]
+    target = tmp_path / 'a.txt'
+    target.write_text(content, encoding='utf-8')
+
+    index = ContentIndex(str(tmp_path / 'index.sqlite'))
+    try:
+        query = build_query(RuleSet(rules), ['utf-8'])
+        assert query is not None
+        assert index.may_contain(str(target), query)
+
+        # 第一次运行建立索引；第二次运行使用已有的记录，同样不能排除
+        for _ in range(2):
+            target.write_text(content, encoding='utf-8')
+            engine = ReplaceEngine(rules, 'utf-8', 'utf-8', content_index=index)
+            result = engine.run([str(target)])
+            assert result.excluded_count == 0
+            assert target.read_text(encoding='utf-8') == output
+    finally:
+        index.close()
@@ -0,0 +1,43 @@
+"""编码检测的回归测试：启发式排序不能让 GBK 排在能解码任意字节的编码之后，也不能改变 BOM 的写回"""
+import codecs
+
+import pytest
+
+from adrts.encoding import AVAILABLE_ENCODINGS, SAMPLE_SIZE, decode_bytes, rank_encodings
+from adrts.engine import ReplaceEngine
+
+GBK_SAMPLES = {
+    # 样本（前 64 KB）全是 ASCII，中文在样本之后
+    'ascii-prefix': 'x' * (SAMPLE_SIZE + 100) + '\n中文内容 foo\n',
+    # 繁体字的 GBK 尾字节大多小于 0xA1，样本不像简体中文
+    'traditional': '這個們說話 foo\n' * 50,
+}
+
+
+@pytest.mark.parametrize('name', sorted(GBK_SAMPLES))
+def test_gbk_ranked_before_latin1(name):
+    data = GBK_SAMPLES[name].encode('gbk')
+    ranked = rank_encodings(data, AVAILABLE_ENCODINGS)
+    assert 'gbk' in ranked
+    assert ranked.index('gbk') < ranked.index('latin-1')
+    assert decode_bytes(data, AVAILABLE_ENCODINGS) == (GBK_SAMPLES[name], 'gbk')
+
+
+@pytest.mark.parametrize('bytes_mode', [True, False])
+@pytest.mark.parametrize('name', sorted(GBK_SAMPLES))
+def test_gbk_file_rewritten_as_utf8(tmp_path, name, bytes_mode):
+    target = tmp_path / 'a.txt'
+    target.write_bytes(GBK_SAMPLES[name].encode('gbk'))
+    engine = ReplaceEngine([{'find': 'foo', 'replace': 'bar'}], 'try-all', 'utf-8', bytes_mode=bytes_mode)
+    result = engine.run([str(target)])
+    assert result.failed_count == 0
+    assert target.read_bytes().decode('utf-8') == GBK_SAMPLES[name].replace('foo', 'bar')
+
+
+@pytest.mark.parametrize('bytes_mode', [True, False])
+def test_utf8_bom_kept_in_try_all(tmp_path, bytes_mode):
+    target = tmp_path / 'a.txt'
+    target.write_bytes(codecs.BOM_UTF8 + b'hello foo\n')
+    engine = ReplaceEngine([{'find': 'foo', 'replace': 'bar'}], 'try-all', 'utf-8', bytes_mode=bytes_mode)
+    engine.run([str(target)])
+    assert target.read_bytes() == codecs.BOM_UTF8 + b'hello bar\n'
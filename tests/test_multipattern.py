@@ -0,0 +1,30 @@
+"""合并正则的回归测试：带内联全局标志的规则不能合并，fused 模式不能因此报错"""
+import pytest
+
+from adrts.multipattern import FusedRegex, can_fuse, has_global_flags
+from adrts.rules import RuleSet, MODE_FUSED, MODE_SEQUENTIAL
+
+
+@pytest.mark.parametrize('find, expected', [
+    (r'(?s)a.b', True),
+    (r'(?u)x', True),
+    (r'(?i:a)b', False),
+    (r'\(?s\)', False),
+    (r'a.b', False),
+])
+def test_has_global_flags(find, expected):
+    assert has_global_flags(find) == expected
+
+
+def test_fused_mode_with_global_flags():
+    rules = [
+        {'find': '(?s)a.b', 'replace': 'Q', 'regex': True},
+        {'find': '(?u)x', 'replace': 'X', 'regex': True},
+        {'find': 'y', 'replace': 'Y', 'regex': True},
+        {'find': 'z', 'replace': 'Z', 'regex': True},
+    ]
+    fused = RuleSet(rules, MODE_FUSED)
+    assert not any(can_fuse(rule) for rule in fused.rules[:2])
+    assert any(isinstance(step, FusedRegex) for step in fused.steps)
+    content = "a\nb x y z"
+    assert fused.apply(content)[0] == RuleSet(rules, MODE_SEQUENTIAL).apply(content)[0] == "Q X Y Z"
@@ -0,0 +1,45 @@
+"""并行处理的回归测试：派发线程中汇总的跳过、排除计数与主线程的结果计数互不丢失"""
+from adrts.contentindex import ContentIndex
+from adrts.engine import ReplaceEngine
+from adrts.manifest import RunManifest
+
+RULES = [{'find': 'foo', 'replace': 'bar'}]
+
+
+def _files(tmp_path, count):
+    paths = []
+    for i in range(count):
+        path = tmp_path / f'f{i}.txt'
+        # 一半文件含有查找内容
+        path.write_text('foo\n' if i % 2 else 'qux\n', encoding='utf-8')
+        paths.append(str(path))
+    return paths
+
+
+def _engine(**options):
+    return ReplaceEngine(RULES, 'utf-8', 'utf-8', **options)
+
+
+def test_parallel_counts_with_manifest(tmp_path):
+    paths = _files(tmp_path, 400)
+    manifest = RunManifest(str(tmp_path / 'manifest.sqlite'), _engine().fingerprint())
+    try:
+        _engine(manifest=manifest).run(paths[:200], workers=2)
+        result = _engine(manifest=manifest).run(iter(paths), workers=2)
+    finally:
+        manifest.close()
+    assert result.failed_count == 0
+    assert result.success_count == 400
+    assert result.unchanged_count == 200
+
+
+def test_parallel_counts_with_index(tmp_path):
+    paths = _files(tmp_path, 400)
+    index = ContentIndex(str(tmp_path / 'index.sqlite'))
+    try:
+        result = _engine(content_index=index, prefilter=False).run(iter(paths), workers=2)
+    finally:
+        index.close()
+    assert result.failed_count == 0
+    assert result.success_count == 400
+    assert result.excluded_count == 200
@@ -0,0 +1,35 @@
+"""预筛选必需字面量的回归测试：带参数的转义不能把参数当作字面量"""
+import pytest
+
+from adrts.engine import ReplaceEngine
+from adrts.prefilter import required_literal
+from adrts.rules import compile_rule
+
+
+def _regex(find):
+    return compile_rule(0, {'find': find, 'replace': 'Q', 'regex': True})
+
+
+@pytest.mark.parametrize('find, expected', [
+    (r'\x41BC', 'BC'),
+    (r'\U00000041BC', 'BC'),
+    (r'\N{LATIN SMALL LETTER A}bc', 'bc'),
+    (r'\0BC', 'BC'),
+    (r'ab\dcd', 'ab'),
+    (r'foo\.bar', 'foo.bar'),
+])
+def test_required_literal_skips_escape_arguments(find, expected):
+    assert required_literal(_regex(find)) == expected
+
+
+@pytest.mark.parametrize('find, content, output', [
+    (r'\x41BC', 'xx ABC xx', 'xx Q xx'),
+    (r'\N{LATIN SMALL LETTER A}bc', 'xx abc xx', 'xx Q xx'),
+])
+def test_prefilter_does_not_skip_matching_file(tmp_path, find, content, output):
+    target = tmp_path / 'a.txt'
+    target.write_text(content, encoding='utf-8')
+    engine = ReplaceEngine([{'find': find, 'replace': 'Q', 'regex': True}], 'utf-8', 'utf-8')
+    result = engine.run([str(target)])
+    assert result.skipped_count == 0
+    assert target.read_text(encoding='utf-8') == output